@@ -1,19 +1,27 @@
 ﻿import importlib
 import os
+import shutil
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
+from urllib.parse import urlparse
 
 from fastapi import FastAPI, Request, Form, UploadFile, File
 from fastapi.responses import RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from apscheduler.schedulers.background import BackgroundScheduler
 from sqlmodel import select
 
 from db import init_db, get_session
 from models import Product, RunLog, ResearchSnapshot, ProductVariant, PricingRule, VariantMap
 from version import get_version
+from media_resolver import MediaFiles, derived_dir
 from research import run_research
+import variants
+import runlog_sink
+import scheduling
+import job_runner
+from runlog_sink import log_run
 
 BASE_DIR = Path(__file__).parent
 MEDIA_DIR = BASE_DIR / "media"
@@ -22,17 +30,76 @@ MEDIA_PRODUCTS.mkdir(parents=True, exist_ok=True)
 
 app = FastAPI(title="AutoMerch")
 app.mount("/static", StaticFiles(directory="static"), name="static")
-app.mount("/media", StaticFiles(directory=str(MEDIA_DIR)), name="media")
+app.mount("/media", MediaFiles(directory=str(MEDIA_DIR)), name="media")
 templates = Jinja2Templates(directory="templates")
 # Ensure version reflects the file each render by using a callable
 templates.env.globals["VERSION"] = get_version
-scheduler = BackgroundScheduler()
+
+
+@lru_cache(maxsize=4096)
+def _file_digest(path: str, mtime_ns: int, size: int) -> str:
+    import s3_storage
+    return s3_storage.content_hash(path)
+
+
+def _thumb(url: Optional[str], width: int, sku: Optional[str] = None) -> str:
+    """Local /media images are resized by the media resolver; external URLs pass through.
+
+    A product's content-addressed S3 URL is swapped for its local copy when this
+    replica holds the same file, so the page still gets a derivative.
+    """
+    if url and sku and not url.startswith("/media/"):
+        name = Path(urlparse(url).path)
+        local = MEDIA_PRODUCTS / f"{sku}{name.suffix}"
+        try:
+            st = local.stat()
+        except OSError:
+            st = None
+        if st is not None and name.stem == _file_digest(str(local), st.st_mtime_ns, st.st_size):
+            url = f"/media/products/{local.name}"
+    if not url or not url.startswith("/media/"):
+        return url or ""
+    return f"{url}{'&' if '?' in url else '?'}w={width}"
+
+
+templates.env.filters["thumb"] = _thumb
+scheduler = scheduling.build_scheduler()
+# Every replica runs a scheduler so schedules can be edited anywhere, but it stays
+# paused unless this replica holds the DB lease; only the leader fires jobs.
+LEADER_ELECTION = os.getenv("SCHEDULER_LEADER_ELECTION", "true").lower() == "true"
+elector = None
 
 
 @app.on_event("startup")
 def on_startup():
+    global elector
     init_db()
-    scheduler.start()
+    runlog_sink.start()
+    if LEADER_ELECTION:
+        from db import engine
+        from leader import LeaderElector
+        scheduler.start(paused=True)
+        elector = LeaderElector(
+            engine,
+            on_elected=scheduler.resume,
+            on_demoted=scheduler.pause,
+            # Pick up schedules other replicas added to the shared job store
+            on_renewed=scheduler.wakeup,
+        )
+        elector.start()
+    else:
+        scheduler.start()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    if elector is not None:
+        elector.stop()
+    scheduler.shutdown(wait=False)
+    job_runner.shutdown(wait=False)
+    import image_processing
+    image_processing.shutdown(wait=False)
+    runlog_sink.stop()
 
 
 @app.get("/")
@@ -41,21 +108,40 @@ def home(request: Request):
 
 
 @app.get("/products")
-def products_page(request: Request):
+def products_page(request: Request, page: int = 1, page_size: int = 50):
+    from sqlmodel import func
+    page = max(1, page)
+    page_size = max(1, min(200, page_size))
+    # One query for the page of products joined to their variants, plus a count
+    page_skus = select(Product.sku).order_by(Product.sku).offset((page - 1) * page_size).limit(page_size)
+    stmt = (
+        select(Product, ProductVariant)
+        .outerjoin(ProductVariant, ProductVariant.product_sku == Product.sku)
+        .where(Product.sku.in_(page_skus))
+        .order_by(Product.sku, ProductVariant.id)
+    )
+    products = []
+    variants_map = {}
     with get_session() as session:
-        products = session.exec(select(Product)).all()
-        variant_rows = session.exec(select(ProductVariant)).all()
-        variants_map = {}
-        for v in variant_rows:
-            variants_map.setdefault(v.product_sku, []).append(v)
+        total = session.exec(select(func.count()).select_from(Product)).one()
+        for p, v in session.exec(stmt).all():
+            if not products or products[-1].sku != p.sku:
+                products.append(p)
+            if v is not None:
+                variants_map.setdefault(p.sku, []).append(v)
+        mapped = variants.variant_map(session)
     printful_variants = [
+        {"id": pfid, "label": f"{pfid} - {size or 'ONE'} / {color or 'NA'}"}
+        for (size, color), pfid in sorted(mapped.items(), key=lambda kv: kv[1])
+    ] or [
         {"id": 4011, "label": "4011 - Tee (example)"},
         {"id": 4012, "label": "4012 - Tee (example)"},
         {"id": 4013, "label": "4013 - Tee (example)"},
     ]
+    pager = {"page": page, "page_size": page_size, "total": total}
     return templates.TemplateResponse(
         "products.html",
-        {"request": request, "products": products, "title": "Products", "printful_variants": printful_variants, "variants_map": variants_map},
+        {"request": request, "products": products, "title": "Products", "printful_variants": printful_variants, "variants_map": variants_map, "pager": pager},
     )
 
 
@@ -192,9 +278,7 @@ def import_blueprints(
             created += 1
         session.commit()
 
-    with get_session() as session:
-        session.add(RunLog(job="import_blueprints", status="ok", message=f"{created} created for '{q}'"))
-        session.commit()
+    log_run("import_blueprints", "ok", f"{created} created for '{q}'")
 
     return RedirectResponse(url="/products", status_code=303)
 
@@ -239,8 +323,8 @@ def research_snapshot(q: str = Form(...), limit: int = Form(50)):
             llm_json=json.dumps(data.get("llm") or {}),
         )
         s.add(snap)
-        s.add(RunLog(job="research_snapshot", status="ok", message=f"{q} (limit {limit})"))
         s.commit()
+    log_run("research_snapshot", "ok", f"{q} (limit {limit})", counts={f"research_keyword:{q}": 1})
     return RedirectResponse(url="/research/snapshots", status_code=303)
 
 
@@ -278,6 +362,7 @@ def variant_map_add(size: str = Form(None), color: str = Form(None), printful_va
         m = VariantMap(size=(size or None), color=(color or None), printful_variant_id=pfid)
         s.add(m)
         s.commit()
+    variants.invalidate()
     return RedirectResponse(url="/variants/map", status_code=303)
 
 
@@ -288,25 +373,16 @@ def variant_map_delete(id: int = Form(...)):
         if m:
             s.delete(m)
             s.commit()
+    variants.invalidate()
     return RedirectResponse(url="/variants/map", status_code=303)
 
 
 @app.post("/api/products/variants/add_matrix")
 def add_variant_matrix(sku: str = Form(...), sizes: list[str] = Form(default_factory=list), colors: list[str] = Form(default_factory=list)):
-    created = 0
     with get_session() as s:
-        for size in (sizes or [None]):
-            for color in (colors or [None]):
-                size_v = size or None
-                color_v = color or None
-                exists = s.exec(select(ProductVariant).where((ProductVariant.product_sku == sku) & (ProductVariant.size == size_v) & (ProductVariant.color == color_v))).first()
-                if exists:
-                    continue
-                s.add(ProductVariant(product_sku=sku, size=size_v, color=color_v))
-                created += 1
-        s.commit()
-        s.add(RunLog(job="variant_matrix_add", status="ok", message=f"{sku}: {created} created"))
+        created = variants.add_matrix(s, sku, sizes, colors)
         s.commit()
+        log_run("variant_matrix_add", "ok", f"{sku}: {created} created")
     return RedirectResponse(url="/products", status_code=303)
 
 
@@ -389,8 +465,7 @@ def bulk_etsy_draft(skus: _List[str] = Form(default_factory=list)):
                 created += 1
             except Exception:
                 errors += 1
-        session.add(RunLog(job="bulk_etsy_draft", status="ok", message=f"{created} created, {skipped} skipped, {errors} errors"))
-        session.commit()
+        log_run("bulk_etsy_draft", "ok", f"{created} created, {skipped} skipped, {errors} errors", counts={"drafts_created": created})
     return RedirectResponse(url="/products", status_code=303)
 
 
@@ -408,8 +483,7 @@ def bulk_etsy_publish(skus: _List[str] = Form(default_factory=list)):
                 published += 1
             except Exception:
                 errors += 1
-        session.add(RunLog(job="bulk_etsy_publish", status="ok", message=f"{published} published, {skipped} skipped, {errors} errors"))
-        session.commit()
+        log_run("bulk_etsy_publish", "ok", f"{published} published, {skipped} skipped, {errors} errors", counts={"published": published})
     return RedirectResponse(url="/products", status_code=303)
 
 
@@ -437,8 +511,7 @@ def bulk_printful_create(skus: _List[str] = Form(default_factory=list)):
                 created += 1
             except Exception:
                 errors += 1
-        session.add(RunLog(job="bulk_printful", status="ok", message=f"{created} created, {skipped} skipped, {errors} errors"))
-        session.commit()
+        log_run("bulk_printful", "ok", f"{created} created, {skipped} skipped, {errors} errors")
     return RedirectResponse(url="/products", status_code=303)
 
 
@@ -490,40 +563,64 @@ def delete_product(sku: str = Form(...)):
     return RedirectResponse(url="/products", status_code=303)
 
 
-@app.post("/api/products/upload_image")
-def upload_product_image(sku: str = Form(...), image: UploadFile = File(...)):
-    suffix = Path(image.filename).suffix or ".jpg"
-    path = MEDIA_PRODUCTS / f"{sku}{suffix}"
-    data = image.file.read()
-    try:
-        from PIL import Image
-        from io import BytesIO
-        bio = BytesIO(data)
-        im = Image.open(bio).convert("RGB")
-        w, h = im.size
-        max_w = int(os.getenv("IMG_MAX_WIDTH", "1600"))
-        if w > max_w:
-            ratio = max_w / float(w)
-            im = im.resize((max_w, int(h * ratio)))
-        im.save(path, format="JPEG", quality=int(os.getenv("IMG_JPEG_QUALITY", "88")))
-    except Exception:
-        with open(path, "wb") as f:
-            f.write(data)
-    public_url = f"/media/products/{path.name}"
-    # If S3 is configured, upload and use S3 URL instead
-    try:
-        from s3_storage import is_configured as s3_is_configured, upload_file as s3_upload
-        if s3_is_configured():
-            prefix = os.getenv("S3_PREFIX", "products").strip("/")
-            key = f"{prefix}/{path.name}"
-            public_url = s3_upload(str(path), key)
-    except Exception:
-        pass
+def _set_thumbnail(sku: str, url: str):
     with get_session() as session:
         obj = session.get(Product, sku) or Product(sku=sku)
-        obj.thumbnail_url = public_url
+        obj.thumbnail_url = url
         session.add(obj)
         session.commit()
+
+
+def _publish_product_image(sku: str, path: Path):
+    """Point the product at its local image, then at the S3 copy once uploaded."""
+    _set_thumbnail(sku, f"/media/products/{path.relative_to(MEDIA_PRODUCTS).as_posix()}")
+    try:
+        import s3_storage
+        if s3_storage.is_configured():
+            # Content-hash keys: re-uploading the same image is a HEAD, and a new one gets a fresh URL
+            url, _ = s3_storage.put_content_addressed(str(path), os.getenv("S3_PREFIX", "products"))
+            _set_thumbnail(sku, url)
+    except Exception as e:
+        log_run("image_upload", "error", f"{sku}: {e}")
+
+
+@app.get("/blobs/{key}")
+def get_blob(key: str):
+    """Serve a stored blob; keys are content hashes, so responses never change."""
+    import blob_store
+    from fastapi.responses import FileResponse, JSONResponse
+    store = blob_store.get_store()
+    if "/" in key or not store.exists(key):
+        return JSONResponse({"error": "blob not found"}, status_code=404)
+    if not store.local:
+        return RedirectResponse(url=store.url(key), status_code=307)
+    return FileResponse(store.path(key), headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+
+@app.post("/api/products/upload_image")
+def upload_product_image(sku: str = Form(...), image: UploadFile = File(...)):
+    """Persist the original in the blob store, then resize and upload it in the background."""
+    import blob_store
+    import image_processing
+    store = blob_store.get_store()
+    suffix = Path(image.filename).suffix or ".jpg"
+    key = store.put_stream(image.file, suffix.lower())
+    # The product holds only its current original; replaced ones become collectable
+    store.set_refs(f"product:{sku}", [key])
+    original = store.path(key)
+    target = MEDIA_PRODUCTS / f"{sku}.jpg"
+
+    def on_done(result, error):
+        if error is not None:
+            # Not decodable as an image: serve the original as-is, as before
+            log_run("image_process", "error", f"{sku}: {error}")
+            fallback = MEDIA_PRODUCTS / f"{sku}{suffix}"
+            shutil.copyfile(original, fallback)
+            _publish_product_image(sku, fallback)
+        else:
+            _publish_product_image(sku, target)
+
+    image_processing.submit(original, target, on_done, derived_dir(MEDIA_DIR, target.relative_to(MEDIA_DIR).as_posix()))
     return RedirectResponse(url="/products", status_code=303)
 
 
@@ -558,10 +655,11 @@ def product_to_etsy(sku: str = Form(...)):
             "when_made": "made_to_order",
             "is_supply": False,
         }
-        status = "ok"; message = None
+        status = "ok"; message = None; drafted = 0
         try:
             listing_id = create_listing_draft(payload)
             obj.etsy_listing_id = listing_id
+            drafted = 1
             # Try to upload image if present
             if obj.thumbnail_url:
                 if obj.thumbnail_url.startswith("http://") or obj.thumbnail_url.startswith("https://"):
@@ -574,9 +672,10 @@ def product_to_etsy(sku: str = Form(...)):
             session.commit()
         except Exception as e:
             status = "error"; message = str(e)
-        finally:
-            session.add(RunLog(job="etsy_list", status=status, message=message))
+            # Keep the draft id even if the image upload failed
             session.commit()
+        finally:
+            log_run("etsy_list", status, message, counts={"drafts_created": drafted})
     return RedirectResponse(url="/products", status_code=303)
 
 
@@ -596,8 +695,7 @@ def generate_copy(sku: str = Form(...)):
         obj.description = desc
         session.add(obj)
         session.commit()
-        session.add(RunLog(job="generate_copy", status="ok", message=f"{sku}"))
-        session.commit()
+        log_run("generate_copy", "ok", f"{sku}")
     return RedirectResponse(url="/products", status_code=303)
 
 
@@ -609,11 +707,9 @@ def product_etsy_publish(sku: str = Form(...)):
         if obj and obj.etsy_listing_id:
             try:
                 publish_listing(obj.etsy_listing_id)
-                session.add(RunLog(job="etsy_publish", status="ok"))
-                session.commit()
+                log_run("etsy_publish", "ok", counts={"published": 1})
             except Exception as e:
-                session.add(RunLog(job="etsy_publish", status="error", message=str(e)))
-                session.commit()
+                log_run("etsy_publish", "error", str(e))
     return RedirectResponse(url="/products", status_code=303)
 
 
@@ -631,11 +727,9 @@ def product_etsy_update(sku: str = Form(...)):
                     "when_made": "made_to_order",
                     "is_supply": False,
                 })
-                session.add(RunLog(job="etsy_update", status="ok"))
-                session.commit()
+                log_run("etsy_update", "ok")
             except Exception as e:
-                session.add(RunLog(job="etsy_update", status="error", message=str(e)))
-                session.commit()
+                log_run("etsy_update", "error", str(e))
     return RedirectResponse(url="/products", status_code=303)
 
 
@@ -654,19 +748,13 @@ def product_to_printful(sku: str = Form(...)):
         }
         status = "ok"; message = None
         try:
-            variants = session.exec(select(ProductVariant).where(ProductVariant.product_sku == obj.sku)).all()
-            if variants:
+            product_variants = session.exec(select(ProductVariant).where(ProductVariant.product_sku == obj.sku)).all()
+            if product_variants:
                 variant_inputs = []
-                for v in variants:
-                    # Try global VariantMap first
-                    mapping = None
-                    if v.size or v.color:
-                        mapping = session.exec(
-                            select(VariantMap).where(
-                                (VariantMap.size == (v.size or None)) & (VariantMap.color == (v.color or None))
-                            )
-                        ).first()
-                    pf_vid = (mapping.printful_variant_id if mapping else None) or v.printful_variant_id or obj.variant_id or 4011
+                for v in product_variants:
+                    # Try global VariantMap first (cached, loaded once)
+                    mapped = variants.resolve(session, v.size, v.color)
+                    pf_vid = mapped or v.printful_variant_id or obj.variant_id or 4011
                     variant_inputs.append({
                         "retail_price": str(payload["price"]),
                         "sku": f"{obj.sku}-{(v.size or 'ONE').upper()}-{(v.color or 'NA').upper()}",
@@ -675,7 +763,7 @@ def product_to_printful(sku: str = Form(...)):
                     })
                 results = create_product_with_variants(payload, variant_inputs)
                 # store ids if provided
-                for v, r in zip(variants, results):
+                for v, r in zip(product_variants, results):
                     if isinstance(r.get("variant_id"), (int, str)):
                         v.printful_variant_id = r.get("variant_id") if isinstance(r.get("variant_id"), int) else v.printful_variant_id
                         session.add(v)
@@ -688,8 +776,7 @@ def product_to_printful(sku: str = Form(...)):
         except Exception as e:
             status = "error"; message = str(e)
         finally:
-            session.add(RunLog(job="printful_create", status=status, message=message))
-            session.commit()
+            log_run("printful_create", status, message)
     return RedirectResponse(url="/products", status_code=303)
 
 
@@ -700,8 +787,7 @@ def add_variant(sku: str = Form(...), size: str = Form(None), color: str = Form(
                            printful_variant_id=int(printful_variant_id) if printful_variant_id else None)
         s.add(v)
         s.commit()
-        s.add(RunLog(job="variant_add", status="ok", message=f"{sku}:{size}/{color}"))
-        s.commit()
+        log_run("variant_add", "ok", f"{sku}:{size}/{color}")
     return RedirectResponse(url="/products", status_code=303)
 
 
@@ -712,136 +798,150 @@ def delete_variant(id: int = Form(...)):
         if v:
             s.delete(v)
             s.commit()
-            s.add(RunLog(job="variant_delete", status="ok", message=str(id)))
-            s.commit()
+            log_run("variant_delete", "ok", str(id))
     return RedirectResponse(url="/products", status_code=303)
 
 
 @app.get("/jobs")
 def jobs_page(request: Request):
-    return templates.TemplateResponse("jobs.html", {"request": request, "title": "Jobs"})
+    runs = job_runner.recent_runs(20)
+    return templates.TemplateResponse("jobs.html", {"request": request, "title": "Jobs", "runs": runs})
 
 
 @app.post("/api/run_job")
 def run_job(job: str = Form(...)):
-    job_map = {
-        "list_to_etsy": "jobs.list_to_etsy",
-        "pull_metrics": "jobs.pull_metrics",
-        "prune_scale": "jobs.prune_scale",
-        "weekly_report": "jobs.weekly_report",
-        "intake_to_assets": "jobs.intake_to_assets",
-        "sync_prices": "jobs.sync_prices",
-        "sync_inventory": "jobs.sync_inventory",
-    }
-    module_name = job_map.get(job)
-    status = "ok"
-    message = None
-    if module_name:
-        try:
-            mod = importlib.import_module(module_name)
-            if hasattr(mod, "run"):
-                mod.run()
-            else:
-                status = "no_run"
-                message = "run() not implemented"
-        except Exception as e:
-            status = "error"
-            message = str(e)
-    else:
-        status = "unknown"
-        message = f"Unknown job: {job}"
+    # Runs on the job runner pool; progress is on /jobs and /api/jobs/runs/{id}
+    job_runner.submit(job, trigger="manual")
+    return RedirectResponse(url="/jobs", status_code=303)
 
-    with get_session() as session:
-        session.add(RunLog(job=job, status=status, message=message))
-        session.commit()
 
-    return RedirectResponse(url="/logs", status_code=303)
+@app.get("/api/jobs/runs")
+def job_runs(limit: int = 20):
+    return job_runner.recent_runs(max(1, min(200, limit)))
 
 
-# Pricing deltas
-def _active_pricing_rule(session) -> PricingRule:
-    rule = session.exec(select(PricingRule).where(PricingRule.active == True)).first()  # noqa: E712
-    return rule or PricingRule()
-
+@app.get("/api/jobs/runs/{run_id}")
+def job_run_detail(run_id: int):
+    from fastapi.responses import JSONResponse
+    run = job_runner.get_run(run_id)
+    if run is None:
+        return JSONResponse({"error": "Run not found"}, status_code=404)
+    return run
 
-def _apply_rounding(value: float, rounding: str) -> float:
-    if rounding == ".95":
-        return round(int(value) + 0.95, 2)
-    return round(int(value) + 0.99, 2)
 
+@app.get("/api/jobs/runs/{run_id}/stream")
+def job_run_stream(run_id: int, offset: int = 0):
+    """Server-sent events with the run's output lines until it finishes.
 
-def _proposed_price(product: Product, rule: PricingRule) -> float | None:
-    # Base on cost if available; otherwise keep current price and enforce rounding/min/max
-    if product.cost is not None and product.cost > 0:
-        base = float(product.cost) * (1.0 + float(rule.margin_pct))
-    elif product.price is not None:
-        base = float(product.price)
-    else:
-        return None
-    base = max(float(rule.min_price), min(float(rule.max_price), base))
-    return _apply_rounding(base, rule.rounding)
+    A run that stays queued or silent (e.g. running in another process) ends the
+    stream with a timeout event carrying its status and the offset to resume from.
+    """
+    import json
+    import time
+    from fastapi.responses import StreamingResponse
+
+    def events():
+        pos = max(0, offset)
+        opened = last_output = time.monotonic()
+        while True:
+            lines, pos, finished = job_runner.read_log(run_id, pos)
+            for line in lines:
+                yield f"data: {json.dumps(line)}\n\n"
+            if finished:
+                yield "event: done\ndata: {}\n\n"
+                return
+            now = time.monotonic()
+            if lines:
+                last_output = now
+            if now - last_output >= job_runner.STREAM_IDLE_SECONDS or now - opened >= job_runner.STREAM_MAX_SECONDS:
+                run = job_runner.get_run(run_id) or {}
+                yield f"event: timeout\ndata: {json.dumps({'status': run.get('status'), 'offset': pos})}\n\n"
+                return
+            time.sleep(0.5)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/api/jobs/latency")
+def jobs_latency(limit: int = 50):
+    return job_runner.latency_summary(limit)
+
+
+@app.get("/api/jobs/{job}/history")
+def job_history(job: str, limit: int = 50):
+    return job_runner.history(job, limit)
+
+
+@app.get("/api/sync/preview")
+def sync_preview(job: str = "sync_prices", limit: int = 100, refresh: bool = False):
+    """Dry-run diff for a sync job, computed without writing anything.
+
+    sync_inventory diffs against the remote state stored by its last run; refresh=1
+    fetches it live from Printful and Etsy instead.
+    """
+    from fastapi.responses import JSONResponse
+    planners = {"sync_prices": "jobs.sync_prices", "sync_inventory": "jobs.sync_inventory"}
+    module_name = planners.get(job)
+    if not module_name:
+        return JSONResponse({"error": f"Unknown sync job: {job}"}, status_code=404)
+    mod = importlib.import_module(module_name)
+    with get_session() as s:
+        plan = mod.plan(s, refresh=True) if refresh and job == "sync_inventory" else mod.plan(s)
+    return plan.summary(limit=max(0, limit))
 
 
+# Pricing deltas
 @app.get("/pricing/deltas")
-def pricing_deltas_page(request: Request):
-    rows = []
+def pricing_deltas_page(request: Request, limit: int = 500):
+    import pricing
     with get_session() as s:
-        products = s.exec(select(Product)).all()
-        rule = _active_pricing_rule(s)
-        for p in products:
-            prop = _proposed_price(p, rule)
-            if prop is not None and p.price is not None and abs(prop - float(p.price)) >= 0.01:
-                rows.append({
-                    "sku": p.sku,
-                    "name": p.name,
-                    "current": float(p.price),
-                    "proposed": float(prop),
-                    "etsy_listing_id": p.etsy_listing_id,
-                })
-    return templates.TemplateResponse("pricing_deltas.html", {"request": request, "title": "Pricing", "deltas": rows})
+        deltas = pricing.compute_deltas(s)
+    rows = deltas.rows(limit=max(1, limit))
+    return templates.TemplateResponse("pricing_deltas.html", {"request": request, "title": "Pricing", "deltas": rows, "total": len(deltas)})
 
 
 @app.post("/api/pricing/apply")
-def pricing_apply(skus: list[str] = Form(default_factory=list)):
-    from etsy_client import update_listing_price
-    changed = 0; errors = 0
+def pricing_apply(skus: list[str] = Form(default_factory=list), apply_all: str | None = Form(None)):
+    import pricing
+    from price_push import push_prices
     with get_session() as s:
-        rule = _active_pricing_rule(s)
-        for sku in skus or []:
-            p = s.get(Product, sku)
-            if not p or p.price is None:
-                continue
-            prop = _proposed_price(p, rule)
-            if prop is None or abs(prop - float(p.price)) < 0.01:
-                continue
-            old = float(p.price)
-            try:
-                p.price = prop
-                s.add(p)
-                s.commit()
-                if p.etsy_listing_id:
-                    update_listing_price(p.etsy_listing_id, float(prop))
-                changed += 1
-                s.add(RunLog(job="pricing_apply", status="ok", message=f"{sku}: {old} -> {prop}"))
-                s.commit()
-            except Exception as e:
-                s.rollback()
-                errors += 1
-                s.add(RunLog(job="pricing_apply", status="error", message=f"{sku}: {e}"))
-                s.commit()
+        deltas = pricing.compute_deltas(s, skus=None if apply_all else (skus or []))
+        changed = pricing.apply_deltas(s, deltas)
+        s.commit()
+    result = push_prices(zip(deltas.sku, deltas.etsy_listing_id, deltas.proposed))
+    for sku, err in result["failed"]:
+        log_run("pricing_apply", "error", f"{sku}: {err}")
+    log_run("pricing_apply", "ok", f"changed={changed}, pushed={result['pushed']}, skipped={result['skipped']}, etsy_errors={result['errors']}", counts={"repriced": changed})
     return RedirectResponse(url="/pricing/deltas", status_code=303)
 
 
 @app.get("/pricing/rules")
-def pricing_rules_page(request: Request):
+def pricing_rules_page(request: Request, name: str | None = None):
+    import pricing
     with get_session() as s:
-        rule = s.exec(select(PricingRule).where(PricingRule.active == True)).first()  # noqa: E712
-        rule = rule or PricingRule()
-    return templates.TemplateResponse("pricing_rules.html", {"request": request, "title": "Pricing Rules", "rule": rule})
+        rules = s.exec(select(PricingRule).order_by(PricingRule.priority.desc(), PricingRule.id)).all()
+        rule = None
+        if name:
+            rule = s.exec(select(PricingRule).where(PricingRule.name == name)).first()
+        rule = rule or pricing.active_rule(s)
+    return templates.TemplateResponse("pricing_rules.html", {"request": request, "title": "Pricing Rules", "rule": rule, "rules": rules})
 
 
 @app.post("/api/pricing/rules/save")
-def pricing_rules_save(name: str = Form("Global"), active: str = Form("true"), margin_pct: str = Form("0.5"), min_price: str = Form("9.99"), max_price: str = Form("99.99"), rounding: str = Form(".99")):
+def pricing_rules_save(
+    name: str = Form("Global"),
+    active: str = Form("true"),
+    margin_pct: str = Form("0.5"),
+    min_price: str = Form("9.99"),
+    max_price: str = Form("99.99"),
+    rounding: str = Form(".99"),
+    scope: str = Form("global"),
+    scope_value: str | None = Form(None),
+    band_min: str | None = Form(None),
+    band_max: str | None = Form(None),
+    priority: str = Form("0"),
+):
+    import pricing
     on = (active.lower() == "true" or active == "1" or active.lower() == "on")
     try:
         margin = float(margin_pct)
@@ -849,8 +949,14 @@ def pricing_rules_save(name: str = Form("Global"), active: str = Form("true"), m
         maxp = float(max_price)
     except ValueError:
         margin, minp, maxp = 0.5, 9.99, 99.99
+
+    def _opt_float(v):
+        try:
+            return float(v) if v not in (None, "") else None
+        except ValueError:
+            return None
+
     with get_session() as s:
-        # Single active global rule for now
         rule = s.exec(select(PricingRule).where(PricingRule.name == name)).first()
         if not rule:
             rule = PricingRule(name=name)
@@ -859,18 +965,100 @@ def pricing_rules_save(name: str = Form("Global"), active: str = Form("true"), m
         rule.min_price = minp
         rule.max_price = maxp
         rule.rounding = rounding if rounding in (".99", ".95") else ".99"
+        rule.scope = scope if scope in pricing.SCOPE_SPECIFICITY else "global"
+        rule.scope_value = (scope_value or "").strip() or None
+        rule.band_min = _opt_float(band_min)
+        rule.band_max = _opt_float(band_max)
+        try:
+            rule.priority = int(priority)
+        except ValueError:
+            rule.priority = 0
         s.add(rule)
         s.commit()
-        s.add(RunLog(job="pricing_rule_save", status="ok", message=f"{name}"))
-        s.commit()
+        log_run("pricing_rule_save", "ok", f"{name}")
     return RedirectResponse(url="/pricing/deltas", status_code=303)
 
 
+@app.post("/api/pricing/rules/delete")
+def pricing_rules_delete(id: int = Form(...)):
+    with get_session() as s:
+        rule = s.get(PricingRule, id)
+        if rule:
+            s.delete(rule)
+            s.commit()
+            log_run("pricing_rule_delete", "ok", rule.name)
+    return RedirectResponse(url="/pricing/rules", status_code=303)
+
+
+def _parse_log_cursor(cursor: str | None):
+    # Cursor is "<created_at iso>_<id>" of the last row on the previous page
+    from datetime import datetime
+    if not cursor:
+        return None
+    try:
+        ts, _, rid = cursor.rpartition("_")
+        return datetime.fromisoformat(ts), int(rid)
+    except ValueError:
+        return None
+
+
 @app.get("/logs")
-def logs_page(request: Request):
+def logs_page(request: Request, job: str | None = None, status: str | None = None, before: str | None = None, limit: int = 100):
+    from sqlmodel import and_, or_
+    limit = max(1, min(500, limit))
+    stmt = select(RunLog)
+    if job:
+        stmt = stmt.where(RunLog.job == job)
+    if status:
+        stmt = stmt.where(RunLog.status == status)
+    cur = _parse_log_cursor(before)
+    if cur:
+        ts, rid = cur
+        stmt = stmt.where(or_(RunLog.created_at < ts, and_(RunLog.created_at == ts, RunLog.id < rid)))
+    stmt = stmt.order_by(RunLog.created_at.desc(), RunLog.id.desc()).limit(limit + 1)
+    with get_session() as session:
+        logs = session.exec(stmt).all()
+    next_cursor = None
+    if len(logs) > limit:
+        logs = logs[:limit]
+        last = logs[-1]
+        next_cursor = f"{last.created_at.isoformat()}_{last.id}"
+    return templates.TemplateResponse(
+        "logs.html",
+        {"request": request, "logs": logs, "title": "Logs", "job": job or "", "status": status or "", "limit": limit, "next_cursor": next_cursor},
+    )
+
+
+@app.get("/api/logs/daily")
+def logs_daily(job: str | None = None, days: int = 90):
+    from datetime import datetime, timedelta
+    from models import RunLogDaily
+    since = (datetime.utcnow() - timedelta(days=max(1, days))).strftime("%Y-%m-%d")
+    stmt = select(RunLogDaily).where(RunLogDaily.day >= since)
+    if job:
+        stmt = stmt.where(RunLogDaily.job == job)
     with get_session() as session:
-        logs = session.exec(select(RunLog).order_by(RunLog.created_at.desc())).all()
-    return templates.TemplateResponse("logs.html", {"request": request, "logs": logs, "title": "Logs"})
+        rows = session.exec(stmt.order_by(RunLogDaily.day.desc(), RunLogDaily.job)).all()
+    return [r.model_dump() for r in rows]
+
+
+@app.get("/api/metrics/trend")
+def metrics_trend(metric: str = "views", source: str | None = None, start: str | None = None, end: str | None = None, entity_id: str | None = None):
+    """Daily series for a metric from the MetricDaily rollups (start/end as YYYY-MM-DD)."""
+    import metrics_store
+    return metrics_store.trend(metric, source=source, start=start, end=end, entity_id=entity_id)
+
+
+@app.get("/api/reports/weekly")
+def weekly_report(week: str | None = None):
+    """Cached weekly report as Markdown; week is an ISO week such as 2024-W05 (default: last week)."""
+    from fastapi.responses import JSONResponse, PlainTextResponse
+    from jobs.weekly_report import get
+    try:
+        report = get(week)
+    except ValueError:
+        return JSONResponse({"error": f"Invalid week: {week}"}, status_code=400)
+    return PlainTextResponse(report["content"], media_type="text/markdown")
 
 
 @app.get("/schedules")
@@ -881,33 +1069,17 @@ def schedules_page(request: Request):
 
 @app.post("/api/schedules")
 def add_schedule(job: str = Form(...), minutes: int = Form(...)):
-    from uuid import uuid4
-    job_map = {
-        "list_to_etsy": "jobs.list_to_etsy",
-        "pull_metrics": "jobs.pull_metrics",
-        "prune_scale": "jobs.prune_scale",
-        "weekly_report": "jobs.weekly_report",
-        "intake_to_assets": "jobs.intake_to_assets",
-    }
-    module_name = job_map.get(job)
-    if module_name:
-        job_id = f"{job}-" + str(uuid4())[:8]
-        def _runner():
-            mod = __import__(module_name, fromlist=["run"])
-            if hasattr(mod, "run"):
-                try:
-                    mod.run()
-                    with get_session() as s:
-                        s.add(RunLog(job=job, status="ok"))
-                        s.commit()
-                except Exception as e:
-                    with get_session() as s:
-                        s.add(RunLog(job=job, status="error", message=str(e)))
-                        s.commit()
-        scheduler.add_job(_runner, 'interval', minutes=minutes, id=job_id, name=job, replace_existing=False)
+    scheduling.add_interval_job(scheduler, job, minutes)
     return RedirectResponse(url="/schedules", status_code=303)
 
 
+@app.get("/api/scheduler/leader")
+def scheduler_leader():
+    if elector is None:
+        return {"election": False, "is_leader": True}
+    return {"election": True, "is_leader": elector.is_leader, "holder": elector.holder, "lease": elector.current()}
+
+
 @app.post("/api/schedules/delete")
 def delete_schedule(id: str = Form(...)):
     try:
@@ -938,20 +1110,14 @@ def etsy_login():
 def etsy_callback(code: str = None, state: str = None, error: str = None):
     from etsy_auth import exchange_code
     if error:
-        with get_session() as s:
-            s.add(RunLog(job="etsy_oauth", status="error", message=error))
-            s.commit()
+        log_run("etsy_oauth", "error", error)
         return RedirectResponse(url="/integrations", status_code=303)
     if code:
         try:
             exchange_code(code)
-            with get_session() as s:
-                s.add(RunLog(job="etsy_oauth", status="ok", message="connected"))
-                s.commit()
+            log_run("etsy_oauth", "ok", "connected")
         except Exception as e:
-            with get_session() as s:
-                s.add(RunLog(job="etsy_oauth", status="error", message=str(e)))
-                s.commit()
+            log_run("etsy_oauth", "error", str(e))
     return RedirectResponse(url="/integrations", status_code=303)
 
 
@@ -960,13 +1126,9 @@ def test_etsy():
     from etsy_client import create_listing_draft
     try:
         create_listing_draft({"title": "AutoMerch Test", "description": "Test"})
-        with get_session() as s:
-            s.add(RunLog(job="etsy_test", status="ok"))
-            s.commit()
+        log_run("etsy_test", "ok")
     except Exception as e:
-        with get_session() as s:
-            s.add(RunLog(job="etsy_test", status="error", message=str(e)))
-            s.commit()
+        log_run("etsy_test", "error", str(e))
     return RedirectResponse(url="/integrations", status_code=303)
 
 
@@ -975,13 +1137,9 @@ def test_printful():
     from printful_client import get_store_metrics
     try:
         get_store_metrics()
-        with get_session() as s:
-            s.add(RunLog(job="printful_test", status="ok"))
-            s.commit()
+        log_run("printful_test", "ok")
     except Exception as e:
-        with get_session() as s:
-            s.add(RunLog(job="printful_test", status="error", message=str(e)))
-            s.commit()
+        log_run("printful_test", "error", str(e))
     return RedirectResponse(url="/integrations", status_code=303)
 
 
@@ -997,30 +1155,27 @@ def etsy_add_image_url(sku: str = Form(...), url: str = Form(...)):
         if obj and obj.etsy_listing_id and url:
             try:
                 upload_listing_image_from_url(obj.etsy_listing_id, url)
-                session.add(RunLog(job="etsy_add_image_url", status="ok"))
-                session.commit()
+                log_run("etsy_add_image_url", "ok")
             except Exception as e:
-                session.add(RunLog(job="etsy_add_image_url", status="error", message=str(e)))
-                session.commit()
+                log_run("etsy_add_image_url", "error", str(e))
     return RedirectResponse(url="/products", status_code=303)
 
 
 @app.post("/api/products/etsy_add_image")
 def etsy_add_image(sku: str = Form(...), image: UploadFile = File(...)):
+    import blob_store
     from etsy_client import upload_listing_image_from_file
-    local_path = MEDIA_PRODUCTS / f"{sku}-extra-{image.filename}"
-    with open(local_path, "wb") as f:
-        f.write(image.file.read())
+    store = blob_store.get_store()
+    key = store.put_stream(image.file, Path(image.filename).suffix.lower() or None, owner=f"product:{sku}:extra")
+    local_path = store.path(key)
     with get_session() as session:
         obj = session.get(Product, sku)
         if obj and obj.etsy_listing_id:
             try:
                 upload_listing_image_from_file(obj.etsy_listing_id, str(local_path))
-                session.add(RunLog(job="etsy_add_image_file", status="ok"))
-                session.commit()
+                log_run("etsy_add_image_file", "ok")
             except Exception as e:
-                session.add(RunLog(job="etsy_add_image_file", status="error", message=str(e)))
-                session.commit()
+                log_run("etsy_add_image_file", "error", str(e))
     return RedirectResponse(url="/products", status_code=303)
 
 
@@ -1031,12 +1186,12 @@ def etsy_update_price(sku: str = Form(...)):
         obj = session.get(Product, sku)
         if obj and obj.etsy_listing_id and obj.price is not None:
             try:
-                update_listing_price(obj.etsy_listing_id, float(obj.price))
-                session.add(RunLog(job="etsy_update_price", status="ok"))
-                session.commit()
+                # The inventory PUT also sets stock; keep the reconciled quantity
+                quantity = obj.quantity if obj.quantity is not None else int(os.getenv("INVENTORY_IN_STOCK_QTY", "999"))
+                update_listing_price(obj.etsy_listing_id, float(obj.price), quantity=quantity)
+                log_run("etsy_update_price", "ok")
             except Exception as e:
-                session.add(RunLog(job="etsy_update_price", status="error", message=str(e)))
-                session.commit()
+                log_run("etsy_update_price", "error", str(e))
     return RedirectResponse(url="/products", status_code=303)
 
 
@@ -1069,6 +1224,33 @@ def export_products_csv():
     from fastapi.responses import Response
     return Response(content=sio.getvalue(), media_type="text/csv")
 
+
+def _columnar_export(dataset: str, fmt: str, compression: str | None, row_group_size: int | None):
+    from fastapi.responses import FileResponse, JSONResponse
+    from starlette.background import BackgroundTask
+    import exports
+    if dataset not in exports.DATASETS:
+        return JSONResponse({"error": f"Unknown dataset: {dataset}", "datasets": list(exports.DATASETS)}, status_code=404)
+    try:
+        compression = exports.check_compression(fmt, compression)
+    except ValueError as e:
+        return JSONResponse({"error": str(e), "codecs": list(exports.CODECS[fmt])}, status_code=400)
+    if not exports.is_available():
+        return JSONResponse({"error": "pyarrow is not installed"}, status_code=501)
+    path = exports.export_to_tempfile(dataset, fmt, compression=compression, row_group_size=row_group_size)
+    media_type = "application/vnd.apache.parquet" if fmt == "parquet" else "application/vnd.apache.arrow.file"
+    return FileResponse(path, media_type=media_type, filename=f"{dataset}.{fmt}", background=BackgroundTask(os.unlink, path))
+
+
+@app.get("/api/export/{dataset}.parquet")
+def export_parquet(dataset: str, compression: str | None = None, row_group_size: int | None = None):
+    return _columnar_export(dataset, "parquet", compression, row_group_size)
+
+
+@app.get("/api/export/{dataset}.arrow")
+def export_arrow(dataset: str, compression: str | None = None):
+    return _columnar_export(dataset, "arrow", compression, None)
+
 @app.get("/catalog")
 def catalog(request: Request, q: str | None = None, page: int = 1, page_size: int = 20):
     q = q or request.query_params.get("q")
@@ -77,6 +77,18 @@ def on_startup():
         init_db()
     except Exception as e:
             print(f"Warning: Database init in startup had issues: {e}")
+    
+    # Resume generation jobs interrupted by the last shutdown, then drain the queue
+    from ..services.image_generator import job_queue
+    job_queue.requeue_interrupted()
+    job_queue.start()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    """Stop the image generation workers."""
+    from ..services.image_generator import job_queue
+    job_queue.stop()
 
 
 @app.exception_handler(RequestValidationError)
@@ -1,17 +1,26 @@
 """Image generation API routes."""
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, Any
-import time
+import json
 
-from ...services.image_generator.client import ImageGenerator
-from ...services.image_generator.utils import save_image_from_base64, download_image_from_url
-from pathlib import Path
+from ...services.image_generator import job_queue
 
 router = APIRouter(prefix="/api/images", tags=["images"])
 
 
+def _queued(job_id: str, **extra: Any) -> dict[str, Any]:
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/images/jobs/{job_id}",
+        "events_url": f"/api/images/jobs/{job_id}/events",
+        **extra
+    }
+
+
 class GenerateImageRequest(BaseModel):
     """Request to generate product images."""
     prompt: str
@@ -21,9 +30,10 @@ class GenerateImageRequest(BaseModel):
     research_data: Optional[dict[str, Any]] = None  # Optional research insights to enhance prompt
     reference_image_url: Optional[str] = None  # URL of reference image to improve upon
     reference_image_base64: Optional[str] = None  # Base64 encoded reference image
+    reference_image_key: Optional[str] = None  # Blob key of a stored reference image (e.g. from research)
 
 
-@router.post("/generate")
+@router.post("/generate", status_code=202)
 def generate_images(request: GenerateImageRequest):
     """Generate product images based on a prompt and optional research data.
     
@@ -31,11 +41,15 @@ def generate_images(request: GenerateImageRequest):
         request: Image generation request with prompt and options
         
     Returns:
-        List of generated images
+        Queued job ID with its status and event stream URLs; images arrive on the stream
     """
+    reference_image_key = request.reference_image_key
+    if reference_image_key and job_queue.blob_path(reference_image_key) is None:
+        # The stored blob may have been collected; fall back to any other reference sent along
+        if not (request.reference_image_url or request.reference_image_base64):
+            raise HTTPException(status_code=400, detail="Unknown reference_image_key")
+        reference_image_key = None
     try:
-        generator = ImageGenerator()
-        
         # Enhance prompt with research data if provided
         enhanced_prompt = request.prompt
         if request.research_data:
@@ -68,67 +82,21 @@ def generate_images(request: GenerateImageRequest):
             if enhancements:
                 enhanced_prompt = f"{enhanced_prompt}, {'; '.join(enhancements)}"
         
-        # Save reference image locally if provided
-        reference_image_path = None
-        if request.reference_image_base64:
-            images_dir = Path("generated_images") / "references"
-            reference_image_path = save_image_from_base64(
-                request.reference_image_base64,
-                images_dir,
-                f"ref_{int(time.time())}"
-            )
-        elif request.reference_image_url:
-            images_dir = Path("generated_images") / "references"
-            reference_image_path = download_image_from_url(
-                request.reference_image_url,
-                images_dir,
-                f"ref_{int(time.time())}"
-            )
-        
-        images = generator.generate_product_images(
-            prompt=enhanced_prompt,
-            count=request.count,
-            style=request.style,
-            aspect_ratio=request.aspect_ratio,
-            reference_image_url=request.reference_image_url,
-            reference_image_base64=request.reference_image_base64
-        )
-        
-        # Save generated images locally
-        generated_image_paths = []
-        output_dir = Path("generated_images") / "products"
-        for idx, img in enumerate(images):
-            if img.get("base64"):
-                saved_path = save_image_from_base64(
-                    img["base64"],
-                    output_dir,
-                    f"generated_{int(time.time())}_{idx}"
-                )
-                if saved_path:
-                    generated_image_paths.append(str(saved_path))
-            elif img.get("url"):
-                # Download generated image if it's a URL
-                saved_path = download_image_from_url(
-                    img["url"],
-                    output_dir,
-                    f"generated_{int(time.time())}_{idx}"
-                )
-                if saved_path:
-                    generated_image_paths.append(str(saved_path))
-        
-        return {
-            "images": images,
-            "count": len(images),
+        job_id = job_queue.enqueue({
             "prompt": enhanced_prompt,
-            "original_prompt": request.prompt,
-            "reference_image_path": str(reference_image_path) if reference_image_path else None,
-            "generated_image_paths": generated_image_paths
-        }
+            "count": request.count,
+            "style": request.style,
+            "aspect_ratio": request.aspect_ratio,
+            "reference_image_url": request.reference_image_url,
+            "reference_image_base64": request.reference_image_base64,
+            "reference_image_key": reference_image_key
+        })
+        return _queued(job_id, prompt=enhanced_prompt, original_prompt=request.prompt, count=request.count)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Image generation failed: {str(e)}")
 
 
-@router.post("/generate-from-research")
+@router.post("/generate-from-research", status_code=202)
 def generate_from_research(
     keywords: str,
     research_data: dict[str, Any],
@@ -144,7 +112,7 @@ def generate_from_research(
         style: Image style
         
     Returns:
-        Generated images
+        Queued job ID with its status and event stream URLs
     """
     try:
         # Build prompt from research data
@@ -173,21 +141,60 @@ def generate_from_research(
             # Fallback to keywords with market insights
             prompt = f"{keywords} product design"
         
-        generator = ImageGenerator()
-        images = generator.generate_product_images(
-            prompt=prompt,
-            count=count,
-            style=style,
-            aspect_ratio="1:1"
-        )
-        
-        return {
-            "images": images,
-            "count": len(images),
+        job_id = job_queue.enqueue({
             "prompt": prompt,
-            "keywords": keywords,
-            "research_based": True
-        }
+            "count": count,
+            "style": style,
+            "aspect_ratio": "1:1"
+        })
+        return _queued(job_id, prompt=prompt, keywords=keywords, count=count, research_based=True)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Research-based image generation failed: {str(e)}")
 
+
+@router.get("/jobs/{job_id}")
+def get_generation_job(job_id: str):
+    """Status of a generation job and the images finished so far."""
+    job = job_queue.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/jobs/{job_id}/events")
+def generation_job_events(job_id: str, request: Request, after: int = 0):
+    """Server-sent events: one "image" event per finished image, then "done" with the final status.
+    
+    Each event carries an `id`; reconnecting clients resume after Last-Event-ID (or ?after=<id>).
+    """
+    import time
+    
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        after = max(after, int(last_event_id))
+    if job_queue.get_status(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    def events():
+        pos = max(0, after)
+        while True:
+            # Status first: once it reads finished, every image is already recorded
+            status = job_queue.get_status(job_id) or {}
+            images, pos = job_queue.read_images(job_id, pos)
+            for image in images:
+                yield f"event: image\nid: {image['id']}\ndata: {json.dumps(image)}\n\n"
+            if status.get("status") not in ("queued", "running"):
+                yield f"event: done\ndata: {json.dumps(status)}\n\n"
+                return
+            time.sleep(0.5)
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@router.get("/files/{key}")
+def get_generated_image(key: str):
+    """Serve a stored image by blob key."""
+    path = job_queue.blob_path(key)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(path=str(path), headers={"Cache-Control": "public, max-age=31536000, immutable"})
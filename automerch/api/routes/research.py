@@ -64,5 +64,11 @@ def get_research_image(filename: str):
             path=str(image_path),
             media_type="image/jpeg"
         )
+    
+    # Downloaded research images live in the blob store, named by content hash
+    import blob_store
+    store = blob_store.get_store()
+    if "/" not in filename and store.exists(filename):
+        return FileResponse(path=str(store.path(filename)))
     raise HTTPException(status_code=404, detail="Image not found")
 
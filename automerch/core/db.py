@@ -19,7 +19,10 @@ def init_db():
         OAuthToken,
         Listing,
         Asset,
-        EtsyShop
+        EtsyShop,
+        GenerationJob,
+        GenerationJobImage,
+        GeneratedImageCacheEntry
     )
     
     # Use Alembic if configured
@@ -42,6 +45,7 @@ def init_db():
     _migrate_product_table()
     _migrate_oauth_token_table()
     _migrate_listing_table()
+    _migrate_generation_job_table()
 
 
 def _migrate_product_table():
@@ -119,6 +123,29 @@ def _migrate_listing_table():
             print(f"Warning: Listing table migration had issues: {e}")
 
 
+def _migrate_generation_job_table():
+    """Migrate GenerationJob table to add worker heartbeat columns."""
+    with engine.connect() as conn:
+        try:
+            result = conn.exec_driver_sql(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name='generationjob'"
+            )
+            if not result.fetchone():
+                return
+            
+            result = conn.exec_driver_sql("PRAGMA table_info('generationjob')")
+            existing_cols = {row[1] for row in result}
+            
+            if 'worker' not in existing_cols:
+                conn.exec_driver_sql("ALTER TABLE generationjob ADD COLUMN worker VARCHAR")
+            if 'heartbeat_at' not in existing_cols:
+                conn.exec_driver_sql("ALTER TABLE generationjob ADD COLUMN heartbeat_at TIMESTAMP")
+            
+            conn.commit()
+        except Exception as e:
+            print(f"Warning: GenerationJob table migration had issues: {e}")
+
+
 def get_session() -> Generator[Session, None, None]:
     """Get a database session (context manager)."""
     with Session(engine) as session:
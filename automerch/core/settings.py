@@ -47,6 +47,28 @@ class Settings:
     
     # Printful API Base URL
     PRINTFUL_API_BASE: str = "https://api.printful.com"
+    
+    # Image generation: shared HTTP connection pool size, default per-provider concurrency cap
+    # (override with IMAGE_GEN_CONCURRENCY_<PROVIDER>) and per-image timeout in seconds
+    IMAGE_GEN_WORKERS: int = int(os.getenv("IMAGE_GEN_WORKERS", "8"))
+    IMAGE_GEN_CONCURRENCY: int = int(os.getenv("IMAGE_GEN_CONCURRENCY", "4"))
+    IMAGE_GEN_TIMEOUT: float = float(os.getenv("IMAGE_GEN_TIMEOUT", "90"))
+    
+    # Image generation jobs: worker threads draining the queue, and how often idle
+    # workers re-check it for jobs enqueued by other processes (seconds). Running jobs
+    # are heartbeated every IMAGE_JOB_HEARTBEAT seconds; one whose heartbeat is older
+    # than IMAGE_JOB_STALE is taken to be orphaned by a dead process and requeued
+    IMAGE_JOB_WORKERS: int = int(os.getenv("IMAGE_JOB_WORKERS", "2"))
+    IMAGE_JOB_POLL: float = float(os.getenv("IMAGE_JOB_POLL", "2"))
+    IMAGE_JOB_HEARTBEAT: float = float(os.getenv("IMAGE_JOB_HEARTBEAT", "15"))
+    IMAGE_JOB_STALE: float = float(os.getenv("IMAGE_JOB_STALE", "90"))
+    
+    # Generated image cache: reuse (serve cached images first), refresh (always generate,
+    # still record) or off; near-duplicates are images within IMAGE_CACHE_PHASH_DISTANCE bits
+    IMAGE_CACHE_POLICY: str = os.getenv("IMAGE_CACHE_POLICY", "reuse")
+    IMAGE_CACHE_PHASH_DISTANCE: int = int(os.getenv("IMAGE_CACHE_PHASH_DISTANCE", "6"))
+    IMAGE_CACHE_MAX_ENTRIES: int = int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", "2000"))
+    IMAGE_CACHE_MAX_MB: int = int(os.getenv("IMAGE_CACHE_MAX_MB", "1024"))
 
 
 # Global settings instance
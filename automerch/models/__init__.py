@@ -6,6 +6,7 @@ from .asset import Asset
 from .token import OAuthToken
 from .runlog import RunLog
 from .shop import EtsyShop
+from .generation_job import GenerationJob, GenerationJobImage, GeneratedImageCacheEntry
 
-__all__ = ["Product", "Listing", "Asset", "OAuthToken", "RunLog", "EtsyShop"]
+__all__ = ["Product", "Listing", "Asset", "OAuthToken", "RunLog", "EtsyShop", "GenerationJob", "GenerationJobImage", "GeneratedImageCacheEntry"]
 
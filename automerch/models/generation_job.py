@@ -0,0 +1,48 @@
+"""Image generation job models."""
+
+from datetime import datetime
+from typing import Optional
+from sqlmodel import SQLModel, Field, UniqueConstraint
+
+
+class GenerationJob(SQLModel, table=True):
+    """A queued image generation request, drained by the generation worker pool."""
+    
+    id: str = Field(primary_key=True)  # uuid4 hex
+    status: str = Field(default="queued", index=True)  # queued, running, done, error
+    params: str  # JSON: generate_product_images arguments (reference image as a blob key)
+    count: int = Field(default=1)
+    completed: int = Field(default=0)
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    worker: Optional[str] = None  # host:pid of the process running it
+    heartbeat_at: Optional[datetime] = None  # refreshed by that process while the job runs
+
+
+class GenerationJobImage(SQLModel, table=True):
+    """One finished image of a generation job, stored in the blob store."""
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    job_id: str = Field(index=True)
+    position: int = Field(default=0)  # index of the variation within the job
+    blob_key: Optional[str] = None  # None if the image could not be stored
+    url: Optional[str] = None
+    meta: Optional[str] = None  # JSON: prompt, style, aspect_ratio, mock
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class GeneratedImageCacheEntry(SQLModel, table=True):
+    """A generated image reusable for later requests with the same cache key (see image_cache)."""
+    
+    __table_args__ = (UniqueConstraint("cache_key", "blob_key", name="uq_generatedimagecache_key_blob"),)
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    cache_key: str = Field(index=True)  # sha256 of provider, model, prompt, style, aspect ratio, reference hash
+    blob_key: str
+    phash: str  # 64-bit difference hash, hex
+    size: int = Field(default=0)
+    hits: int = Field(default=0)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    last_used_at: datetime = Field(default_factory=datetime.utcnow, index=True)
@@ -254,14 +254,14 @@ class EtsyClient:
         
         # Handle URL vs file path
         if image_path.startswith("http://") or image_path.startswith("https://"):
-            # Download image first
-            resp = requests.get(image_path, timeout=30)
-            resp.raise_for_status()
-            image_data = resp.content
-            file_name = Path(image_path).name or "image.jpg"
-        else:
-            image_data = Path(image_path).read_bytes()
-            file_name = Path(image_path).name
+            # Stream to a temp file first: size-capped and checked to be an image
+            import image_download
+            with tempfile.TemporaryDirectory() as tmp:
+                path = image_download.download(image_path, tmp, Path(image_path.split("?")[0]).stem or "image", timeout=30)
+                return self.upload_listing_image(listing_id, str(path))
+        
+        image_data = Path(image_path).read_bytes()
+        file_name = Path(image_path).name
         
         files = {"image": (file_name, image_data, "image/jpeg")}
         
@@ -2,15 +2,23 @@
 
 import logging
 import os
-from typing import Optional, Any
-import requests
+from typing import Optional, Any, Callable
 import base64
 from io import BytesIO
 
 from ...core.settings import settings
+from .engine import http_session, run_batch
+from .reference import ReferenceImage
 
 logger = logging.getLogger(__name__)
 
+# Model each provider is called with (part of the generated-image cache key)
+PROVIDER_MODELS = {
+    "google_imagen": "gemini-2.0-flash-exp",
+    "openai_dalle": "dall-e-3",
+    "stability_ai": "stable-image-core",
+}
+
 
 class ImageGenerator:
     """Client for generating product images using AI APIs."""
@@ -26,6 +34,16 @@ class ImageGenerator:
         # For now, we'll use Vertex AI Imagen API or fallback to other services
         self.provider = os.getenv("IMAGE_GEN_PROVIDER", "google_imagen")  # google_imagen, openai_dalle, stability_ai
         self.api_key = api_key or os.getenv("GOOGLE_API_KEY") or os.getenv("VERTEX_AI_API_KEY") or os.getenv("OPENAI_API_KEY") or os.getenv("STABILITY_API_KEY")
+    
+    @property
+    def dry_run(self) -> bool:
+        return settings.AUTOMERCH_DRY_RUN or not self.api_key
+    
+    def cache_identity(self) -> tuple[str, str]:
+        """(provider, model) that would serve a request right now."""
+        if self.dry_run:
+            return "dry_run", "placeholder"
+        return self.provider, PROVIDER_MODELS.get(self.provider, "")
         
     def generate_product_images(
         self,
@@ -34,7 +52,9 @@ class ImageGenerator:
         style: str = "professional",
         aspect_ratio: str = "1:1",
         reference_image_url: Optional[str] = None,
-        reference_image_base64: Optional[str] = None
+        reference_image_base64: Optional[str] = None,
+        on_image: Optional[Callable[[int, dict[str, Any]], None]] = None,
+        reference: Optional[ReferenceImage] = None
     ) -> list[dict[str, Any]]:
         """Generate product images based on a prompt.
         
@@ -43,16 +63,50 @@ class ImageGenerator:
             count: Number of images to generate (default: 5)
             style: Style of images (professional, artistic, minimal, etc.)
             aspect_ratio: Image aspect ratio (1:1, 16:9, 4:3, etc.)
+            on_image: Called with (index, image) as soon as each image is ready
+            reference: Reference image shared by all variations; takes precedence
+                over reference_image_url/reference_image_base64
             
         Returns:
             List of generated image data (urls, base64, or file paths)
         """
+        if reference is None and reference_image_base64:
+            reference = ReferenceImage.from_base64(reference_image_base64)
+        elif reference is None and reference_image_url and not self.dry_run:
+            reference = ReferenceImage.from_url(reference_image_url)
+        delivered = set()
+        
+        def report(i: int, image: dict[str, Any]):
+            delivered.add(id(image))
+            on_image(i, image)
+        
+        images = self._generate(
+            prompt, count, style, aspect_ratio, reference_image_url, reference,
+            report if on_image is not None else None
+        )
+        if on_image is not None:
+            # Dry-run and mock fallback images do not come from a provider batch
+            for i, image in enumerate(images):
+                if id(image) not in delivered:
+                    on_image(i, image)
+        return images
+    
+    def _generate(
+        self,
+        prompt: str,
+        count: int,
+        style: str,
+        aspect_ratio: str,
+        reference_image_url: Optional[str],
+        reference: Optional[ReferenceImage],
+        on_image: Optional[Callable[[int, dict[str, Any]], None]]
+    ) -> list[dict[str, Any]]:
         # Add reference image info to prompt
         enhanced_prompt = prompt
-        if reference_image_url or reference_image_base64:
+        if reference_image_url or reference is not None:
             enhanced_prompt = f"{prompt}, improve upon this reference design, make it better and more appealing"
         
-        if settings.AUTOMERCH_DRY_RUN or not self.api_key:
+        if self.dry_run:
             logger.info(f"[DRY RUN] Generating {count} images with prompt: {enhanced_prompt[:50]}...")
             if reference_image_url:
                 logger.info(f"[DRY RUN] Using reference image: {reference_image_url[:50]}...")
@@ -63,25 +117,25 @@ class ImageGenerator:
                     "prompt": enhanced_prompt,
                     "style": style,
                     "aspect_ratio": aspect_ratio,
-                    "reference_image": reference_image_url or "base64_image"
+                    "reference_image": reference_image_url or (reference.key if reference is not None else None) or "base64_image"
                 }
                 for i in range(count)
             ]
         
         try:
             if self.provider in ("google_imagen", "google_imagen", "google_gemini"):
-                return self._generate_with_imagen(prompt, count, style, aspect_ratio, reference_image_url, reference_image_base64)
+                return self._generate_with_imagen(prompt, count, style, aspect_ratio, reference, on_image)
             elif self.provider == "openai_dalle":
-                return self._generate_with_dalle(prompt, count, style, aspect_ratio, reference_image_url, reference_image_base64)
+                return self._generate_with_dalle(prompt, count, style, aspect_ratio, reference, on_image)
             elif self.provider == "stability_ai":
-                return self._generate_with_stability(prompt, count, style, aspect_ratio, reference_image_url, reference_image_base64)
+                return self._generate_with_stability(prompt, count, style, aspect_ratio, reference, on_image)
             else:
                 raise ValueError(f"Unsupported provider: {self.provider}")
         except Exception as e:
             logger.error(f"Image generation failed: {e}")
             raise
     
-    def _generate_with_imagen(self, prompt: str, count: int, style: str, aspect_ratio: str, reference_image_url: Optional[str] = None, reference_image_base64: Optional[str] = None) -> list[dict[str, Any]]:
+    def _generate_with_imagen(self, prompt: str, count: int, style: str, aspect_ratio: str, reference: Optional[ReferenceImage] = None, on_image: Optional[Callable[[int, dict[str, Any]], None]] = None) -> list[dict[str, Any]]:
         """Generate images using Google Gemini image generation.
         
         Note: Google Gemini now supports image generation via the gemini-2.5-flash-image model.
@@ -95,60 +149,44 @@ class ImageGenerator:
                 
                 enhanced_prompt = f"{prompt}, {style} style, aspect ratio {aspect_ratio}, high quality product image, printable design"
                 
-                client = genai.Client(api_key=self.api_key)
-                images = []
+                # HttpOptions.timeout is in milliseconds; without it a stalled call holds a provider slot
+                client = genai.Client(
+                    api_key=self.api_key,
+                    http_options=types.HttpOptions(timeout=int(settings.IMAGE_GEN_TIMEOUT * 1000)),
+                )
                 
                 # Prepare content with reference image if provided
                 contents = [enhanced_prompt]
-                if reference_image_base64:
-                    # Add image as part of the prompt
-                    import io
-                    from PIL import Image
-                    img_bytes = base64.b64decode(reference_image_base64)
-                    img = Image.open(io.BytesIO(img_bytes))
-                    # Gemini can accept images in the content
-                    contents.append(img)
+                if reference is not None:
+                    # Gemini accepts the encoded image as-is; one part is shared by every variation
+                    contents.append(types.Part.from_bytes(data=reference.data, mime_type=reference.mime_type))
                     enhanced_prompt = f"Create 5 improved variations of this product design: {prompt}. Make them better, more appealing, and professional. Style: {style}"
-                elif reference_image_url:
-                    # Download and add image
-                    try:
-                        img_resp = requests.get(reference_image_url, timeout=10)
-                        if img_resp.status_code == 200:
-                            from PIL import Image
-                            import io
-                            img = Image.open(io.BytesIO(img_resp.content))
-                            contents.append(img)
-                            enhanced_prompt = f"Create 5 improved variations of this product design: {prompt}. Make them better, more appealing, and professional. Style: {style}"
-                    except Exception as e:
-                        logger.warning(f"Could not load reference image: {e}")
                 
-                for i in range(count):
-                    try:
-                        # Use Gemini 2.0 Flash model with image input
-                        response = client.models.generate_content(
-                            model="gemini-2.0-flash-exp",
-                            contents=contents,
-                        )
-                        
-                        # Extract image data from response
-                        if response.candidates and len(response.candidates) > 0:
-                            for part in response.candidates[0].content.parts:
-                                if part.inline_data is not None:
-                                    img_base64 = part.inline_data.data
-                                    images.append({
-                                        "url": None,
-                                        "base64": img_base64,
-                                        "prompt": enhanced_prompt,
-                                        "style": style,
-                                        "aspect_ratio": aspect_ratio
-                                    })
-                                elif hasattr(part, 'text') and part.text:
-                                    # If text response, might contain image URL
-                                    logger.info(f"Gemini returned text: {part.text[:100]}")
-                    except Exception as e:
-                        logger.warning(f"Gemini image {i+1} generation failed: {e}")
-                        continue
+                def generate_one(i: int) -> list[dict[str, Any]]:
+                    # Use Gemini 2.0 Flash model with image input
+                    response = client.models.generate_content(
+                        model=PROVIDER_MODELS["google_imagen"],
+                        contents=contents,
+                    )
+                    
+                    # Extract image data from response
+                    found = []
+                    if response.candidates and len(response.candidates) > 0:
+                        for part in response.candidates[0].content.parts:
+                            if part.inline_data is not None:
+                                found.append({
+                                    "url": None,
+                                    "base64": part.inline_data.data,
+                                    "prompt": enhanced_prompt,
+                                    "style": style,
+                                    "aspect_ratio": aspect_ratio
+                                })
+                            elif hasattr(part, 'text') and part.text:
+                                # If text response, might contain image URL
+                                logger.info(f"Gemini returned text: {part.text[:100]}")
+                    return found
                 
+                images = run_batch("google_imagen", count, generate_one, on_image=on_image)
                 return images if images else self._generate_mock_images(prompt, count, style, aspect_ratio)
                 
             except ImportError:
@@ -173,42 +211,36 @@ class ImageGenerator:
             logger.error(f"Gemini image generation error: {e}")
             return self._generate_mock_images(prompt, count, style, aspect_ratio)
     
-    def _generate_with_dalle(self, prompt: str, count: int, style: str, aspect_ratio: str, reference_image_url: Optional[str] = None, reference_image_base64: Optional[str] = None) -> list[dict[str, Any]]:
+    def _generate_with_dalle(self, prompt: str, count: int, style: str, aspect_ratio: str, reference: Optional[ReferenceImage] = None, on_image: Optional[Callable[[int, dict[str, Any]], None]] = None) -> list[dict[str, Any]]:
         """Generate images using OpenAI DALL-E API."""
         try:
             import openai
-            client = openai.OpenAI(api_key=self.api_key)
+            client = openai.OpenAI(api_key=self.api_key, timeout=settings.IMAGE_GEN_TIMEOUT)
             
             # DALL-E 3 doesn't support direct image input, so enhance prompt with reference description
-            if reference_image_url or reference_image_base64:
+            if reference is not None:
                 enhanced_prompt = f"Create an improved version of this product design: {prompt}. Style: {style}, aspect ratio: {aspect_ratio}. Make it better, more professional, and appealing. High quality product image."
             else:
                 enhanced_prompt = f"{prompt}, {style} style, aspect ratio {aspect_ratio}, high quality product image"
             
-            images = []
-            
-            for i in range(count):
-                try:
-                    # Note: DALL-E 3 doesn't support image-to-image directly, but we can describe improvements
-                    variant_prompt = f"{enhanced_prompt} Variation {i+1}: more unique and eye-catching"
-                    response = client.images.generate(
-                        model="dall-e-3",
-                        prompt=variant_prompt,
-                        size="1024x1024",
-                        quality="standard",
-                        n=1
-                    )
-                    images.append({
-                        "url": response.data[0].url,
-                        "prompt": enhanced_prompt,
-                        "style": style,
-                        "aspect_ratio": aspect_ratio
-                    })
-                except Exception as e:
-                    logger.warning(f"DALL-E image {i+1} generation failed: {e}")
-                    continue
+            def generate_one(i: int) -> dict[str, Any]:
+                # Note: DALL-E 3 doesn't support image-to-image directly, but we can describe improvements
+                variant_prompt = f"{enhanced_prompt} Variation {i+1}: more unique and eye-catching"
+                response = client.images.generate(
+                    model=PROVIDER_MODELS["openai_dalle"],
+                    prompt=variant_prompt,
+                    size="1024x1024",
+                    quality="standard",
+                    n=1
+                )
+                return {
+                    "url": response.data[0].url,
+                    "prompt": enhanced_prompt,
+                    "style": style,
+                    "aspect_ratio": aspect_ratio
+                }
             
-            return images
+            return run_batch("openai_dalle", count, generate_one, on_image=on_image)
             
         except ImportError:
             logger.warning("openai not installed. Using mock images.")
@@ -217,62 +249,48 @@ class ImageGenerator:
             logger.error(f"DALL-E generation error: {e}")
             return self._generate_mock_images(prompt, count, style, aspect_ratio)
     
-    def _generate_with_stability(self, prompt: str, count: int, style: str, aspect_ratio: str, reference_image_url: Optional[str] = None, reference_image_base64: Optional[str] = None) -> list[dict[str, Any]]:
+    def _generate_with_stability(self, prompt: str, count: int, style: str, aspect_ratio: str, reference: Optional[ReferenceImage] = None, on_image: Optional[Callable[[int, dict[str, Any]], None]] = None) -> list[dict[str, Any]]:
         """Generate images using Stability AI API."""
         try:
             headers = {"Authorization": f"Bearer {self.api_key}"}
             
             # Stability AI supports image-to-image via init_image parameter
-            if reference_image_base64:
+            if reference is not None:
                 enhanced_prompt = f"Improve this design: {prompt}. Style: {style}, make it better and more professional"
-            elif reference_image_url:
-                enhanced_prompt = f"Improve this design: {prompt}. Style: {style}, make it better and more professional"
-                # Download reference image
-                try:
-                    img_resp = requests.get(reference_image_url, timeout=10)
-                    if img_resp.status_code == 200:
-                        reference_image_base64 = base64.b64encode(img_resp.content).decode()
-                except:
-                    pass
+                init_image = (f"image{reference.ext}", reference.data, reference.mime_type)
             else:
                 enhanced_prompt = f"{prompt}, {style} style, aspect ratio {aspect_ratio}, high quality product image"
             
-            images = []
-            for i in range(count):
-                try:
-                    files = {}
-                    data = {
-                        "prompt": f"{enhanced_prompt}, variation {i+1}",
-                        "output_format": "png"
-                    }
-                    
-                    # Add init_image if we have reference
-                    if reference_image_base64:
-                        import io
-                        img_bytes = base64.b64decode(reference_image_base64)
-                        files["init_image"] = ("image.png", img_bytes, "image/png")
-                        data["image_strength"] = 0.35  # Blend factor
-                    
-                    response = requests.post(
-                        "https://api.stability.ai/v2beta/stable-image/generate/core",
-                        headers=headers,
-                        files=files if files else {"none": ""},
-                        data=data,
-                        timeout=30
-                    )
-                    if response.status_code == 200:
-                        images.append({
-                            "url": None,
-                            "base64": base64.b64encode(response.content).decode(),
-                            "prompt": enhanced_prompt,
-                            "style": style,
-                            "aspect_ratio": aspect_ratio
-                        })
-                except Exception as e:
-                    logger.warning(f"Stability AI image {i+1} generation failed: {e}")
-                    continue
+            def generate_one(i: int) -> Optional[dict[str, Any]]:
+                files = {}
+                data = {
+                    "prompt": f"{enhanced_prompt}, variation {i+1}",
+                    "output_format": "png"
+                }
+                
+                # Add init_image if we have reference
+                if reference is not None:
+                    files["init_image"] = init_image
+                    data["image_strength"] = 0.35  # Blend factor
+                
+                response = http_session().post(
+                    "https://api.stability.ai/v2beta/stable-image/generate/core",
+                    headers=headers,
+                    files=files if files else {"none": ""},
+                    data=data,
+                    timeout=settings.IMAGE_GEN_TIMEOUT
+                )
+                if response.status_code != 200:
+                    raise RuntimeError(f"HTTP {response.status_code}")
+                return {
+                    "url": None,
+                    "base64": base64.b64encode(response.content).decode(),
+                    "prompt": enhanced_prompt,
+                    "style": style,
+                    "aspect_ratio": aspect_ratio
+                }
             
-            return images
+            return run_batch("stability_ai", count, generate_one, on_image=on_image)
             
         except Exception as e:
             logger.error(f"Stability AI generation error: {e}")
@@ -0,0 +1,132 @@
+"""Concurrent execution of image generation batches.
+
+Each provider has its own thread pool, sized to its concurrency cap, so calls
+queued for one provider never hold threads another provider (or another job)
+could use. All calls share one pooled HTTP session.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, CancelledError, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ...core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_session: Optional[requests.Session] = None
+_pools: dict[str, tuple[ThreadPoolExecutor, int]] = {}
+# Last time any call to a provider started or finished
+_activity: dict[str, float] = {}
+
+
+def provider_pool(provider: str) -> tuple[ThreadPoolExecutor, int]:
+    """Thread pool for a provider's calls, and its size (IMAGE_GEN_CONCURRENCY_<PROVIDER>)."""
+    with _lock:
+        pool = _pools.get(provider)
+        if pool is None:
+            n = max(1, int(os.getenv(f"IMAGE_GEN_CONCURRENCY_{provider.upper()}", settings.IMAGE_GEN_CONCURRENCY)))
+            pool = _pools[provider] = (ThreadPoolExecutor(max_workers=n, thread_name_prefix=f"image-gen-{provider}"), n)
+        return pool
+
+
+def http_session() -> requests.Session:
+    """Shared session whose connection pool fits every worker, so TLS connections are reused."""
+    global _session
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(1, settings.IMAGE_GEN_WORKERS))
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def run_batch(
+    provider: str,
+    count: int,
+    generate_one: Callable[[int], Any],
+    timeout: Optional[float] = None,
+    on_image: Optional[Callable[[int, Any], None]] = None,
+) -> list[Any]:
+    """Run generate_one(i) for i in range(count) concurrently and collect the results in index order.
+
+    generate_one returns one image dict, a list of them, or None. Failed images are
+    logged and skipped. Each image gets `timeout` seconds (IMAGE_GEN_TIMEOUT) once it
+    starts and is abandoned after that; images still queued behind other batches wait
+    as long as the provider's pool keeps moving, and are cancelled once it has been
+    idle for `timeout`. on_image(i, image) is called from the worker thread as soon
+    as each image is ready, in completion order.
+
+    Args:
+        provider: Provider name, used for its concurrency cap and in log messages
+        count: Number of images to generate
+        generate_one: Callable producing image i
+        timeout: Per-image timeout in seconds
+        on_image: Optional callback for each finished image
+
+    Returns:
+        Flat list of image dicts, ordered by index
+    """
+    if count <= 0:
+        return []
+    timeout = settings.IMAGE_GEN_TIMEOUT if timeout is None else timeout
+    pool, _ = provider_pool(provider)
+    started: dict[int, float] = {}
+    abandoned: set[int] = set()
+
+    def task(i: int):
+        if i in abandoned:
+            raise CancelledError()
+        started[i] = _activity[provider] = time.monotonic()
+        try:
+            result = generate_one(i)
+        finally:
+            _activity[provider] = time.monotonic()
+        if on_image is not None and i not in abandoned:
+            for image in result if isinstance(result, list) else [result]:
+                if image is not None:
+                    on_image(i, image)
+        return result
+
+    _activity[provider] = time.monotonic()
+    futures: list[Future] = [pool.submit(task, i) for i in range(count)]
+    waiting = set(range(count))
+    while waiting:
+        now = time.monotonic()
+        expiry = min([started[i] + timeout for i in waiting if i in started] + [_activity[provider] + timeout])
+        done, _ = wait([futures[i] for i in waiting], timeout=max(0.0, expiry - now), return_when=FIRST_COMPLETED)
+        waiting = {i for i in waiting if not futures[i].done()}
+        now = time.monotonic()
+        overdue = {i for i in waiting if i in started and now - started[i] >= timeout}
+        if not done and now - _activity[provider] >= timeout:
+            overdue = set(waiting)  # nothing has moved on this provider for a whole timeout
+        if overdue:
+            abandoned.update(overdue)
+            for i in overdue:
+                futures[i].cancel()
+            waiting -= overdue
+
+    if abandoned:
+        logger.warning(f"{provider}: {len(abandoned)} of {count} images timed out")
+    images: list[Any] = []
+    for i, f in enumerate(futures):
+        if i in abandoned:
+            continue
+        try:
+            result = f.result()
+        except Exception as e:
+            logger.warning(f"{provider} image {i+1} generation failed: {e}")
+            continue
+        if isinstance(result, list):
+            images.extend(result)
+        elif result is not None:
+            images.append(result)
+    return images
@@ -0,0 +1,161 @@
+"""Cache of generated images keyed by everything that produced them.
+
+A request is keyed by (provider, model, prompt, style, aspect ratio, reference
+image content hash). Each cached image also carries a 64-bit difference hash, so outputs
+that are near-duplicates of earlier ones can be detected across runs and keys.
+Entries hold a blob store reference until they are evicted, least recently used
+first, once the cache exceeds IMAGE_CACHE_MAX_ENTRIES or IMAGE_CACHE_MAX_MB.
+"""
+
+import hashlib
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Optional
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from ...core.db import engine
+from ...core.settings import settings
+from ...models import GeneratedImageCacheEntry
+
+logger = logging.getLogger(__name__)
+
+_EVICT_BATCH = 200
+
+
+def cache_key(provider: str, model: str, prompt: str, style: str, aspect_ratio: str, reference_hash: str = "") -> str:
+    raw = json.dumps([provider, model, prompt.strip(), style, aspect_ratio, reference_hash])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def url_hash(reference_url: Optional[str]) -> str:
+    """Stand-in reference hash for a reference URL whose bytes were not fetched (dry runs)."""
+    if reference_url:
+        return "url:" + hashlib.sha256(reference_url.encode("utf-8")).hexdigest()
+    return ""
+
+
+def dhash(path: Path) -> int:
+    """64-bit difference hash: brightness gradients of a 9x8 grayscale thumbnail."""
+    from PIL import Image
+    with Image.open(path) as im:
+        im.draft("L", (64, 64))
+        pixels = im.convert("L").resize((9, 8), Image.LANCZOS).tobytes()
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return bits
+
+
+def _owner(key: str) -> str:
+    return f"image_cache:{key}"
+
+
+def lookup(key: str, limit: int) -> list[dict[str, Any]]:
+    """Up to `limit` cached images for key, oldest first; marks them as used."""
+    if limit <= 0:
+        return []
+    cols = (GeneratedImageCacheEntry.id, GeneratedImageCacheEntry.blob_key, GeneratedImageCacheEntry.phash)
+    with engine.begin() as conn:
+        rows = conn.execute(
+            select(*cols)
+            .where(GeneratedImageCacheEntry.cache_key == key)
+            .order_by(GeneratedImageCacheEntry.created_at, GeneratedImageCacheEntry.id)
+            .limit(limit)
+        ).mappings().all()
+        if rows:
+            conn.execute(
+                update(GeneratedImageCacheEntry)
+                .where(GeneratedImageCacheEntry.id.in_([r["id"] for r in rows]))
+                .values(hits=GeneratedImageCacheEntry.hits + 1, last_used_at=datetime.utcnow())
+            )
+    return [dict(r) for r in rows]
+
+
+def find_similar(phash: int, max_distance: Optional[int] = None, key: Optional[str] = None) -> Optional[dict[str, Any]]:
+    """Closest cached image within max_distance bits of phash (optionally only under key)."""
+    max_distance = settings.IMAGE_CACHE_PHASH_DISTANCE if max_distance is None else max_distance
+    stmt = select(GeneratedImageCacheEntry.cache_key, GeneratedImageCacheEntry.blob_key, GeneratedImageCacheEntry.phash)
+    if key is not None:
+        stmt = stmt.where(GeneratedImageCacheEntry.cache_key == key)
+    best = None
+    with engine.connect() as conn:
+        for cached_key, blob_key, other in conn.execute(stmt):
+            distance = (phash ^ int(other, 16)).bit_count()
+            if distance <= max_distance and (best is None or distance < best["distance"]):
+                best = {"cache_key": cached_key, "blob_key": blob_key, "distance": distance}
+    return best
+
+
+def record(key: str, blob_key: str, path: Path) -> dict[str, Any]:
+    """Add a generated image to the cache unless it near-duplicates one already cached under key.
+
+    Returns {"phash", "cache_recorded", "near_duplicate_of"}; near_duplicate_of is the closest
+    similar image under any key, if there is one.
+    """
+    import blob_store
+    phash = dhash(path)
+    similar = find_similar(phash)
+    if similar is None or similar["cache_key"] == key:
+        same_key = similar
+    else:
+        same_key = find_similar(phash, key=key)
+    result = {
+        "phash": f"{phash:016x}",
+        "cache_recorded": False,
+        "near_duplicate_of": similar["blob_key"] if similar and similar["blob_key"] != blob_key else None,
+    }
+    if same_key is not None:
+        return result
+    now = datetime.utcnow()
+    try:
+        with engine.begin() as conn:
+            conn.execute(insert(GeneratedImageCacheEntry).values(
+                cache_key=key, blob_key=blob_key, phash=result["phash"], size=Path(path).stat().st_size,
+                created_at=now, last_used_at=now,
+            ))
+    except IntegrityError:
+        return result
+    blob_store.get_store().add_ref(blob_key, _owner(key))
+    result["cache_recorded"] = True
+    evict()
+    return result
+
+
+def evict(max_entries: Optional[int] = None, max_bytes: Optional[int] = None) -> int:
+    """Drop least recently used entries until the cache fits both caps; returns how many were dropped."""
+    import blob_store
+    max_entries = settings.IMAGE_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+    max_bytes = settings.IMAGE_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+    dropped = []
+    with engine.begin() as conn:
+        entries, size = conn.execute(
+            select(func.count(), func.coalesce(func.sum(GeneratedImageCacheEntry.size), 0))
+        ).one()
+        while entries > max_entries or size > max_bytes:
+            rows = conn.execute(
+                select(GeneratedImageCacheEntry.id, GeneratedImageCacheEntry.cache_key, GeneratedImageCacheEntry.blob_key, GeneratedImageCacheEntry.size)
+                .order_by(GeneratedImageCacheEntry.last_used_at, GeneratedImageCacheEntry.id)
+                .limit(_EVICT_BATCH)
+            ).all()
+            if not rows:
+                break
+            batch = []
+            for row in rows:
+                if entries <= max_entries and size <= max_bytes:
+                    break
+                batch.append(row)
+                entries -= 1
+                size -= row.size or 0
+            conn.execute(delete(GeneratedImageCacheEntry).where(GeneratedImageCacheEntry.id.in_([r.id for r in batch])))
+            dropped.extend(batch)
+    if dropped:
+        # The blobs themselves go at the next blob_gc once nothing else references them
+        store = blob_store.get_store()
+        for row in dropped:
+            store.release(_owner(row.cache_key), row.blob_key)
+    return len(dropped)
@@ -0,0 +1,322 @@
+"""Persistent queue of image generation jobs, drained by a bounded worker pool.
+
+Jobs are GenerationJob rows, so queued work survives a restart. Each finished
+image is written to the blob store and recorded as a GenerationJobImage row as
+soon as it arrives, which is what the API streams to clients.
+"""
+
+import base64
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Optional
+
+from sqlalchemy import func, insert, or_, select, update
+
+from ...core.db import engine
+from ...core.settings import settings
+from ...models import GenerationJob, GenerationJobImage
+
+logger = logging.getLogger(__name__)
+
+# Generated images and references are kept this long unless something else references them
+GENERATED_IMAGE_TTL = timedelta(days=float(os.getenv("GENERATED_IMAGE_TTL_DAYS", "30")))
+
+_lock = threading.Lock()
+_wake = threading.Event()
+_stop = threading.Event()
+_workers: list[threading.Thread] = []
+# Jobs this process is running; the heartbeat thread keeps them from looking orphaned
+_running: set[str] = set()
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def store_image(owner: str, base64_data: Optional[str] = None, url: Optional[str] = None) -> Optional[str]:
+    """Put an image into the blob store under owner; returns its blob key, or None if it failed."""
+    import blob_store
+    from .utils import download_image_from_url
+    store = blob_store.get_store()
+    try:
+        if base64_data:
+            return store.put_bytes(base64.b64decode(base64_data), owner=owner, ttl=GENERATED_IMAGE_TTL)
+        downloaded = download_image_from_url(url, store.staging, uuid.uuid4().hex)
+        if downloaded is None:
+            return None
+        return store.put_file(downloaded, owner=owner, ttl=GENERATED_IMAGE_TTL, move=True)
+    except Exception as e:
+        logger.warning(f"Could not store image for {owner}: {e}")
+        return None
+
+
+def blob_path(key: str) -> Optional[Path]:
+    import blob_store
+    store = blob_store.get_store()
+    if "/" in key or not store.exists(key):
+        return None
+    return store.path(key)
+
+
+def enqueue(params: dict[str, Any]) -> str:
+    """Queue a generation job; params are generate_product_images arguments. Returns the job ID.
+
+    The queue row only carries the reference image's blob key: a key passed in
+    (e.g. a research image) is referenced by the job, and a base64 reference is
+    decoded and stored here, once.
+    """
+    import blob_store
+    from .reference import ReferenceImage
+    job_id = uuid.uuid4().hex
+    owner = f"generation_job:{job_id}"
+    params = dict(params)
+    reference_b64 = params.pop("reference_image_base64", None)
+    try:
+        if params.get("reference_image_key"):
+            # Keeps the reference alive while the job waits, even if its original owner lets go
+            blob_store.get_store().add_ref(params["reference_image_key"], owner, GENERATED_IMAGE_TTL)
+        elif reference_b64:
+            params["reference_image_key"] = ReferenceImage.from_base64(reference_b64).store(owner, GENERATED_IMAGE_TTL)
+    except Exception as e:
+        logger.warning(f"Could not store reference image for {owner}: {e}")
+    with engine.begin() as conn:
+        conn.execute(insert(GenerationJob).values(
+            id=job_id,
+            status="queued",
+            params=json.dumps(params),
+            count=int(params.get("count") or 1),
+            created_at=datetime.utcnow(),
+        ))
+    start()
+    _wake.set()
+    return job_id
+
+
+def _claim() -> Optional[GenerationJob]:
+    """Take the oldest queued job; the conditional UPDATE keeps two workers from claiming the same one."""
+    with engine.begin() as conn:
+        candidates = conn.execute(
+            select(GenerationJob.id).where(GenerationJob.status == "queued").order_by(GenerationJob.created_at).limit(5)
+        ).scalars().all()
+        for job_id in candidates:
+            claimed = conn.execute(
+                update(GenerationJob)
+                .where(GenerationJob.id == job_id, GenerationJob.status == "queued")
+                .values(status="running", started_at=datetime.utcnow(), worker=WORKER_ID, heartbeat_at=datetime.utcnow())
+            ).rowcount
+            if claimed:
+                with _lock:
+                    _running.add(job_id)
+                row = conn.execute(select(GenerationJob).where(GenerationJob.id == job_id)).mappings().first()
+                return GenerationJob(**row)
+    return None
+
+
+def _add_image(job_id: str, position: int, blob_key: Optional[str], url: Optional[str], meta: dict[str, Any]):
+    with engine.begin() as conn:
+        conn.execute(insert(GenerationJobImage).values(
+            job_id=job_id,
+            position=position,
+            blob_key=blob_key,
+            url=url,
+            meta=json.dumps(meta),
+            created_at=datetime.utcnow(),
+        ))
+        conn.execute(update(GenerationJob).where(GenerationJob.id == job_id).values(completed=GenerationJob.completed + 1))
+
+
+def _run(job: GenerationJob):
+    from . import image_cache
+    from .client import ImageGenerator
+    from .reference import ReferenceImage
+    params = json.loads(job.params)
+    owner = f"generation_job:{job.id}"
+    generator = ImageGenerator()
+    count = int(params.get("count") or 1)
+    style = params.get("style") or "professional"
+    aspect_ratio = params.get("aspect_ratio") or "1:1"
+    policy = settings.IMAGE_CACHE_POLICY
+    
+    # A requeued job resumes: images it already produced stay, and only the shortfall
+    # is generated, at positions after the last one
+    with engine.begin() as conn:
+        done, last = conn.execute(
+            select(func.count(), func.max(GenerationJobImage.position)).where(GenerationJobImage.job_id == job.id)
+        ).one()
+        conn.execute(update(GenerationJob).where(GenerationJob.id == job.id).values(completed=done))
+    
+    # Read (or downloaded) once here; every variation shares the same bytes
+    reference = None
+    if params.get("reference_image_key"):
+        reference = ReferenceImage.from_key(params["reference_image_key"])
+        if reference is None:
+            logger.warning(f"Reference image {params['reference_image_key']} is gone; generating without it")
+    if reference is None and params.get("reference_image_url") and not generator.dry_run:
+        reference = ReferenceImage.from_url(params["reference_image_url"])
+    
+    cache_key = None
+    # Offset of this run's positions, and how many images the job already has
+    reused = last + 1 if done else 0
+    if policy in ("reuse", "refresh"):
+        provider, model = generator.cache_identity()
+        reference_hash = reference.content_hash if reference is not None else image_cache.url_hash(params.get("reference_image_url"))
+        cache_key = image_cache.cache_key(provider, model, params["prompt"], style, aspect_ratio, reference_hash)
+    if policy == "reuse" and not done:
+        # Earlier results for the same request come first; only the shortfall is generated.
+        # The job holds its own ref, so evicting the cache entry does not take the image away
+        import blob_store
+        store = blob_store.get_store()
+        for entry in image_cache.lookup(cache_key, count):
+            store.add_ref(entry["blob_key"], owner, GENERATED_IMAGE_TTL)
+            _add_image(job.id, reused, entry["blob_key"], None, {"cached": True, "style": style, "aspect_ratio": aspect_ratio})
+            reused += 1
+            done += 1
+
+    def on_image(index: int, image: dict[str, Any]):
+        key = store_image(owner, base64_data=image.get("base64"), url=image.get("url")) if (image.get("base64") or image.get("url")) else None
+        meta = {k: image.get(k) for k in ("prompt", "style", "aspect_ratio", "mock") if image.get(k) is not None}
+        if key and cache_key and not image.get("mock"):
+            try:
+                meta.update(image_cache.record(cache_key, key, blob_path(key)))
+            except Exception as e:
+                logger.warning(f"Could not cache image {key}: {e}")
+        # Unstored provider URLs are passed through; base64 is never streamed
+        _add_image(job.id, reused + index, key, None if key else image.get("url"), meta)
+
+    status, error = "done", None
+    try:
+        images = []
+        if count > done:
+            images = generator.generate_product_images(
+                prompt=params["prompt"],
+                count=count - done,
+                style=style,
+                aspect_ratio=aspect_ratio,
+                reference_image_url=params.get("reference_image_url"),
+                on_image=on_image,
+                reference=reference,
+            )
+        if not images and not done:
+            status, error = "error", "no images were generated"
+    except Exception as e:
+        logger.error(f"Generation job {job.id} failed: {e}")
+        status, error = "error", str(e) or type(e).__name__
+    finally:
+        with _lock:
+            _running.discard(job.id)
+    # A job requeued while this worker stalled belongs to whoever claimed it next
+    with engine.begin() as conn:
+        conn.execute(
+            update(GenerationJob)
+            .where(GenerationJob.id == job.id, GenerationJob.worker == WORKER_ID, GenerationJob.status == "running")
+            .values(status=status, error=error, finished_at=datetime.utcnow())
+        )
+
+
+def _worker():
+    while not _stop.is_set():
+        job = _claim()
+        if job is None:
+            # Woken by enqueue(); the timeout picks up jobs queued by other processes
+            _wake.wait(settings.IMAGE_JOB_POLL)
+            _wake.clear()
+            continue
+        _run(job)
+
+
+def _heartbeat():
+    while not _stop.wait(settings.IMAGE_JOB_HEARTBEAT):
+        try:
+            with _lock:
+                running = list(_running)
+            if running:
+                with engine.begin() as conn:
+                    conn.execute(
+                        update(GenerationJob)
+                        .where(GenerationJob.id.in_(running), GenerationJob.worker == WORKER_ID)
+                        .values(heartbeat_at=datetime.utcnow())
+                    )
+            # Also picks up jobs orphaned by sibling processes that died since startup
+            requeue_interrupted()
+        except Exception as e:
+            logger.warning(f"Generation job heartbeat failed: {e}")
+
+
+def requeue_interrupted(stale_after: Optional[float] = None) -> int:
+    """Put running jobs whose heartbeat is older than stale_after seconds (IMAGE_JOB_STALE) back on the queue.
+
+    Jobs still heartbeated by a live process, this one or a sibling, are left alone.
+    Returns how many were requeued.
+    """
+    stale_after = settings.IMAGE_JOB_STALE if stale_after is None else stale_after
+    cutoff = datetime.utcnow() - timedelta(seconds=stale_after)
+    with engine.begin() as conn:
+        return conn.execute(
+            update(GenerationJob)
+            .where(
+                GenerationJob.status == "running",
+                or_(GenerationJob.heartbeat_at.is_(None), GenerationJob.heartbeat_at < cutoff),
+            )
+            .values(status="queued", started_at=None, worker=None, heartbeat_at=None)
+        ).rowcount
+
+
+def start():
+    """Start the worker pool (IMAGE_JOB_WORKERS threads) and its heartbeat once per process."""
+    with _lock:
+        if _workers:
+            return
+        _stop.clear()
+        for i in range(max(1, settings.IMAGE_JOB_WORKERS)):
+            t = threading.Thread(target=_worker, name=f"image-job-{i}", daemon=True)
+            t.start()
+            _workers.append(t)
+        t = threading.Thread(target=_heartbeat, name="image-job-heartbeat", daemon=True)
+        t.start()
+        _workers.append(t)
+
+
+def stop():
+    with _lock:
+        _stop.set()
+        _wake.set()
+        _workers.clear()
+
+
+def get_status(job_id: str) -> Optional[dict[str, Any]]:
+    """Job status fields (status, count, completed, error, timestamps), or None if unknown."""
+    with engine.connect() as conn:
+        row = conn.execute(select(GenerationJob).where(GenerationJob.id == job_id)).mappings().first()
+    if row is None:
+        return None
+    return {k: v.isoformat() if isinstance(v, datetime) else v for k, v in dict(row).items() if k != "params"}
+
+
+def get_job(job_id: str) -> Optional[dict[str, Any]]:
+    job = get_status(job_id)
+    if job is not None:
+        job["images"] = read_images(job_id)[0]
+    return job
+
+
+def read_images(job_id: str, after: int = 0) -> tuple[list[dict[str, Any]], int]:
+    """Images recorded for a job after row id `after`; returns (images, next offset)."""
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(GenerationJobImage)
+            .where(GenerationJobImage.job_id == job_id, GenerationJobImage.id > after)
+            .order_by(GenerationJobImage.id)
+        ).mappings().all()
+    images = []
+    for r in rows:
+        images.append({
+            "id": r["id"],
+            "index": r["position"],
+            "blob_key": r["blob_key"],
+            "url": f"/api/images/files/{r['blob_key']}" if r["blob_key"] else r["url"],
+            **json.loads(r["meta"] or "{}"),
+        })
+    return images, (rows[-1]["id"] if rows else after)
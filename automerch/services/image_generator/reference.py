@@ -0,0 +1,73 @@
+"""Reference images shared by every variation of a generation request.
+
+The bytes are decoded (from base64) or downloaded once, identified by their
+content hash, and handed to the providers as-is; nothing re-encodes or re-decodes
+them per variation.
+"""
+
+import base64
+import hashlib
+import logging
+import tempfile
+from datetime import timedelta
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_MIME_TYPES = {".jpg": "image/jpeg", ".png": "image/png", ".webp": "image/webp", ".gif": "image/gif", ".avif": "image/avif"}
+
+
+class ReferenceImage:
+    """Raw bytes of a reference image plus its blob store key, once stored."""
+
+    def __init__(self, data: bytes, key: Optional[str] = None):
+        self.data = data
+        self.key = key
+
+    @property
+    def ext(self) -> str:
+        import blob_store
+        return blob_store.sniff_ext(self.data[:16]) or ".jpg"
+
+    @property
+    def mime_type(self) -> str:
+        return _MIME_TYPES.get(self.ext, "image/jpeg")
+
+    @property
+    def content_hash(self) -> str:
+        """sha256 of the bytes; blob keys already start with it."""
+        if self.key:
+            return self.key.split(".", 1)[0]
+        return hashlib.sha256(self.data).hexdigest()
+
+    def store(self, owner: str, ttl: Optional[timedelta] = None) -> str:
+        """Put the bytes into the blob store under owner (a no-op write if already there); returns the key."""
+        import blob_store
+        store = blob_store.get_store()
+        if self.key:
+            store.add_ref(self.key, owner, ttl)
+        else:
+            self.key = store.put_bytes(self.data, self.ext, owner=owner, ttl=ttl)
+        return self.key
+
+    @classmethod
+    def from_key(cls, key: str) -> Optional["ReferenceImage"]:
+        import blob_store
+        store = blob_store.get_store()
+        if "/" in key or not store.exists(key):
+            return None
+        return cls(store.path(key).read_bytes(), key)
+
+    @classmethod
+    def from_base64(cls, data: str) -> "ReferenceImage":
+        return cls(base64.b64decode(data))
+
+    @classmethod
+    def from_url(cls, url: str) -> Optional["ReferenceImage"]:
+        import image_download
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                return cls(image_download.download(url, tmp, timeout=10).read_bytes())
+        except Exception as e:
+            logger.warning(f"Could not load reference image: {e}")
+        return None
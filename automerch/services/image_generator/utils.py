@@ -4,7 +4,6 @@ import base64
 from pathlib import Path
 from typing import Optional
 import logging
-import requests
 
 logger = logging.getLogger(__name__)
 
@@ -53,29 +52,10 @@ def download_image_from_url(url: str, output_path: Path, filename: str) -> Optio
     Returns:
         Path to saved image, or None if failed
     """
+    import image_download
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        
-        output_path.mkdir(parents=True, exist_ok=True)
-        
-        # Get extension from content type or URL
-        content_type = response.headers.get('content-type', 'image/jpeg')
-        if 'png' in content_type:
-            ext = 'png'
-        elif 'webp' in content_type:
-            ext = 'webp'
-        elif url.lower().endswith('.png'):
-            ext = 'png'
-        elif url.lower().endswith('.webp'):
-            ext = 'webp'
-        else:
-            ext = 'jpg'
-        
-        file_path = output_path / f"{filename}.{ext}"
-        file_path.write_bytes(response.content)
-        return file_path
+        # Streamed, size-capped, and only kept if the content really is an image
+        return image_download.download(url, output_path, filename, timeout=10)
     except Exception as e:
         logger.error(f"Failed to download image from {url}: {e}")
         return None
-
@@ -0,0 +1,66 @@
+"""Benchmark: match and price 100k products against 100 scoped pricing rules.
+
+Run: python benchmarks/bench_pricing_rules.py [products] [rules]
+"""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pricing  # noqa: E402
+from models import PricingRule  # noqa: E402
+
+
+def build_rules(n: int) -> list[PricingRule]:
+    rules = [PricingRule(id=1, name="global")]
+    for i in range(2, n + 1):
+        kind = i % 3
+        if kind == 0:
+            rules.append(PricingRule(id=i, name=f"tag-{i}", scope="tag", scope_value=f"tag{i}", margin_pct=0.6, priority=i % 4))
+        elif kind == 1:
+            rules.append(PricingRule(id=i, name=f"tax-{i}", scope="taxonomy", scope_value=str(1000 + i), margin_pct=0.4, priority=i % 4))
+        else:
+            lo = float(i)
+            rules.append(PricingRule(id=i, name=f"band-{i}", scope="price_band", band_min=lo, band_max=lo + 15, margin_pct=0.3, priority=i % 4))
+    return rules
+
+
+def build_catalogue(n: int, n_rules: int) -> pricing.Catalogue:
+    rng = np.random.default_rng(42)
+    tags = np.array([f"tag{a}, tag{b}, misc" for a, b in rng.integers(0, n_rules + 1, size=(n, 2))], dtype=object)
+    return pricing.Catalogue(
+        sku=np.array([f"SKU-{i}" for i in range(n)], dtype=object),
+        name=np.array([None] * n, dtype=object),
+        price=rng.uniform(5, 150, n),
+        cost=np.where(rng.random(n) < 0.7, rng.uniform(2, 60, n), np.nan),
+        etsy_listing_id=np.array([None] * n, dtype=object),
+        taxonomy_id=np.array(rng.integers(1000, 1000 + n_rules + 1, n).tolist(), dtype=object),
+        tags=tags,
+    )
+
+
+def main():
+    n_products = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    n_rules = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    rules = build_rules(n_rules)
+    cat = build_catalogue(n_products, n_rules)
+
+    t0 = time.perf_counter()
+    index = pricing.RuleIndex(rules)
+    t1 = time.perf_counter()
+    proposed = index.propose(cat)
+    t2 = time.perf_counter()
+    deltas = pricing._deltas(cat, proposed)
+    t3 = time.perf_counter()
+
+    print(f"rules={n_rules} products={n_products}")
+    print(f"compile: {(t1 - t0) * 1000:.1f} ms")
+    print(f"match+propose: {(t2 - t1) * 1000:.1f} ms")
+    print(f"deltas: {(t3 - t2) * 1000:.1f} ms ({len(deltas)} changed)")
+
+
+if __name__ == "__main__":
+    main()
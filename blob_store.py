@@ -0,0 +1,363 @@
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import BinaryIO, Iterable, List, Optional
+from uuid import uuid4
+
+from sqlalchemy import delete, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import Blob, BlobRef
+
+# One content-addressed store for every image the app writes (product uploads,
+# research thumbnails, generated images). Files are keyed "<sha256><ext>", so the
+# same bytes are stored once however many owners reference them.
+BLOB_BACKEND = os.getenv("BLOB_BACKEND", "local")  # local or s3
+BLOB_ROOT = os.getenv("BLOB_ROOT", "blobs")
+BLOB_S3_PREFIX = os.getenv("BLOB_S3_PREFIX", "blobs")
+BLOB_CACHE_DIR = os.getenv("BLOB_CACHE_DIR", "blob_cache")
+BLOB_CACHE_MAX_MB = int(os.getenv("BLOB_CACHE_MAX_MB", "512"))
+# Unreferenced blobs younger than this survive GC, so a put is not collected before its ref lands
+BLOB_GC_GRACE_HOURS = float(os.getenv("BLOB_GC_GRACE_HOURS", "24"))
+CHUNK = 1024 * 1024
+_MAGIC = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+)
+
+_lock = threading.Lock()
+_store = None
+
+
+def sniff_ext(head: bytes) -> str:
+    """File extension for common image formats from their leading bytes ("" if unknown)."""
+    for magic, ext in _MAGIC:
+        if head.startswith(magic):
+            return ext
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    if head[4:12] in (b"ftypavif", b"ftypavis"):
+        return ".avif"
+    return ""
+
+
+def shard(key: str) -> str:
+    return f"{key[:2]}/{key}"
+
+
+class LRUCache:
+    """Size-capped directory of blob copies; least recently used files are evicted first.
+
+    Recency survives restarts through each file's mtime, which get() refreshes.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self.size = 0
+        self.root.mkdir(parents=True, exist_ok=True)
+        found = []
+        for p in self.root.glob("*/*"):
+            if p.is_file() and not p.name.endswith(".part"):
+                st = p.stat()
+                found.append((st.st_mtime, p.name, st.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self.size += size
+
+    def path(self, key: str) -> Path:
+        return self.root / shard(key)
+
+    def get(self, key: str) -> Optional[Path]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.discard(key)
+            return None
+        return path
+
+    def put(self, key: str, src: Path, move: bool = False) -> Path:
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if move:
+            Path(src).replace(path)
+        else:
+            tmp = path.with_name(f"{path.name}.{uuid4().hex}.part")
+            shutil.copyfile(src, tmp)
+            tmp.replace(path)
+        size = path.stat().st_size
+        with self._lock:
+            self.size += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            evicted = self._evict(keep=key)
+        for k in evicted:
+            self.path(k).unlink(missing_ok=True)
+        return path
+
+    def discard(self, key: str):
+        with self._lock:
+            self.size -= self._entries.pop(key, 0)
+        self.path(key).unlink(missing_ok=True)
+
+    def _evict(self, keep: str) -> List[str]:
+        evicted = []
+        while self.size > self.max_bytes and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            if key == keep:
+                self._entries.move_to_end(key)
+                continue
+            self.size -= self._entries.pop(key)
+            evicted.append(key)
+        return evicted
+
+
+class BlobStore:
+    """Content-addressed blobs on a backend (s3_storage.LocalBackend or S3Backend) with DB ref counts.
+
+    A local backend is read in place; a remote one is read through `cache`, an
+    LRUCache that also keeps a copy of every blob written from this process.
+    """
+
+    def __init__(self, backend, cache: Optional[LRUCache] = None, engine=None, prefix: str = ""):
+        self.backend = backend
+        self.cache = cache
+        self.prefix = prefix.strip("/")
+        self._engine = engine
+        self.local = callable(getattr(backend, "path", None))
+        staging = Path(backend.root) if self.local else (cache.root if cache else Path(BLOB_CACHE_DIR))
+        self.staging = staging / ".staging"
+        self.staging.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from db import engine
+            self._engine = engine
+        return self._engine
+
+    def _remote_key(self, key: str) -> str:
+        return f"{self.prefix}/{shard(key)}" if self.prefix else shard(key)
+
+    # -- writing --------------------------------------------------------
+
+    def put_stream(self, src: BinaryIO, ext: Optional[str] = None, owner: Optional[str] = None,
+                   ttl: Optional[timedelta] = None) -> str:
+        """Store a file-like object, hashing it while it is copied; returns the blob key.
+
+        ext defaults to the one sniffed from the content.
+        """
+        tmp = self.staging / f"{uuid4().hex}.part"
+        h = hashlib.sha256()
+        head = b""
+        with open(tmp, "wb") as out:
+            for chunk in iter(lambda: src.read(CHUNK), b""):
+                if not head:
+                    head = chunk[:16]
+                h.update(chunk)
+                out.write(chunk)
+        if ext is None:
+            ext = sniff_ext(head)
+        return self._commit(tmp, h.hexdigest() + (ext or "").lower(), owner, ttl)
+
+    def put_bytes(self, data: bytes, ext: Optional[str] = None, owner: Optional[str] = None,
+                  ttl: Optional[timedelta] = None) -> str:
+        tmp = self.staging / f"{uuid4().hex}.part"
+        tmp.write_bytes(data)
+        if ext is None:
+            ext = sniff_ext(data[:16])
+        return self._commit(tmp, hashlib.sha256(data).hexdigest() + (ext or "").lower(), owner, ttl)
+
+    def put_file(self, path, owner: Optional[str] = None, ttl: Optional[timedelta] = None, move: bool = False) -> str:
+        """Store a file under its content hash and original extension; move=True consumes it."""
+        path = Path(path)
+        with open(path, "rb") as f:
+            if not move:
+                return self.put_stream(f, path.suffix, owner, ttl)
+            h = hashlib.sha256()
+            for chunk in iter(lambda: f.read(CHUNK), b""):
+                h.update(chunk)
+        tmp = self.staging / f"{uuid4().hex}.part"
+        shutil.move(str(path), tmp)
+        return self._commit(tmp, h.hexdigest() + path.suffix.lower(), owner, ttl)
+
+    def _write(self, tmp: Path, key: str, overwrite: bool = False) -> bool:
+        """Put tmp's content at key unless it is already there; returns whether it was written."""
+        if self.local:
+            dest = Path(self.backend.path(shard(key)))
+            if dest.is_file() and not overwrite:
+                return False
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            tmp.replace(dest)
+            return True
+        remote = self._remote_key(key)
+        if self.backend.exists(remote) and not overwrite:
+            return False
+        self.backend.upload(str(tmp), remote)
+        return True
+
+    def _commit(self, tmp: Path, key: str, owner: Optional[str], ttl: Optional[timedelta]) -> str:
+        size = tmp.stat().st_size
+        try:
+            wrote = self._write(tmp, key)
+            if self._record(key, size, owner, ttl) and not wrote:
+                # The content was there but its row was not: gc may be deleting it, so write it back
+                self._write(tmp, key, overwrite=True)
+            if not self.local and self.cache is not None:
+                self.cache.put(key, tmp, move=True)
+        finally:
+            tmp.unlink(missing_ok=True)
+        return key
+
+    def _record(self, key: str, size: int, owner: Optional[str], ttl: Optional[timedelta]) -> bool:
+        """Insert or touch the Blob row and add owner's ref; returns whether the row was inserted."""
+        now = datetime.utcnow()
+        inserted = False
+        with self.engine.begin() as conn:
+            if conn.execute(update(Blob).where(Blob.key == key).values(touched_at=now)).rowcount == 0:
+                try:
+                    with conn.begin_nested():
+                        conn.execute(insert(Blob).values(key=key, size=size, created_at=now, touched_at=now))
+                    inserted = True
+                except IntegrityError:
+                    pass  # stored concurrently by another writer
+            if owner:
+                self._add_ref(conn, key, owner, ttl, now)
+        return inserted
+
+    # -- reading --------------------------------------------------------
+
+    def path(self, key: str) -> Path:
+        """Local path of a blob, fetched into the cache first for remote backends."""
+        if self.local:
+            return Path(self.backend.path(shard(key)))
+        if self.cache is None:
+            raise RuntimeError("remote blob store has no local cache")
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        tmp = self.staging / f"{uuid4().hex}.part"
+        try:
+            self.backend.download(self._remote_key(key), str(tmp))
+            return self.cache.put(key, tmp, move=True)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def url(self, key: str) -> str:
+        return self.backend.url(key if self.local else self._remote_key(key))
+
+    def exists(self, key: str) -> bool:
+        with self.engine.connect() as conn:
+            return conn.execute(select(Blob.key).where(Blob.key == key)).first() is not None
+
+    # -- references -----------------------------------------------------
+
+    def _add_ref(self, conn, key: str, owner: str, ttl: Optional[timedelta], now: datetime):
+        expires = now + ttl if ttl is not None else None
+        updated = conn.execute(
+            update(BlobRef).where(BlobRef.blob_key == key, BlobRef.owner == owner).values(expires_at=expires)
+        ).rowcount
+        if not updated:
+            try:
+                with conn.begin_nested():
+                    conn.execute(insert(BlobRef).values(blob_key=key, owner=owner, created_at=now, expires_at=expires))
+            except IntegrityError:
+                pass
+        conn.execute(update(Blob).where(Blob.key == key).values(touched_at=now))
+
+    def add_ref(self, key: str, owner: str, ttl: Optional[timedelta] = None):
+        """Reference key from owner (idempotent; a ttl makes the reference lapse on its own)."""
+        with self.engine.begin() as conn:
+            self._add_ref(conn, key, owner, ttl, datetime.utcnow())
+
+    def set_refs(self, owner: str, keys: Iterable[str], ttl: Optional[timedelta] = None):
+        """Make keys the owner's only references, releasing whatever it held before."""
+        keys = list(dict.fromkeys(keys))
+        now = datetime.utcnow()
+        with self.engine.begin() as conn:
+            stmt = delete(BlobRef).where(BlobRef.owner == owner)
+            if keys:
+                stmt = stmt.where(BlobRef.blob_key.not_in(keys))
+            conn.execute(stmt)
+            for key in keys:
+                self._add_ref(conn, key, owner, ttl, now)
+
+    def release(self, owner: str, key: Optional[str] = None) -> int:
+        """Drop owner's reference to key (or all of its references); returns how many were dropped."""
+        stmt = delete(BlobRef).where(BlobRef.owner == owner)
+        if key is not None:
+            stmt = stmt.where(BlobRef.blob_key == key)
+        with self.engine.begin() as conn:
+            return conn.execute(stmt).rowcount
+
+    def refcount(self, key: str, now: Optional[datetime] = None) -> int:
+        now = now or datetime.utcnow()
+        with self.engine.connect() as conn:
+            return len(conn.execute(
+                select(BlobRef.id).where(BlobRef.blob_key == key, or_(BlobRef.expires_at.is_(None), BlobRef.expires_at > now))
+            ).all())
+
+    # -- garbage collection ---------------------------------------------
+
+    def gc(self, grace: Optional[timedelta] = None, dry_run: bool = False, now: Optional[datetime] = None) -> dict:
+        """Delete blobs with no live reference that were not put or referenced within the grace period.
+
+        Expired references are dropped first. Rows go in one transaction, files after it;
+        a file whose row was re-created by a put in between is kept.
+        """
+        now = now or datetime.utcnow()
+        cutoff = now - (grace if grace is not None else timedelta(hours=BLOB_GC_GRACE_HOURS))
+        live = select(BlobRef.blob_key).where(or_(BlobRef.expires_at.is_(None), BlobRef.expires_at > now))
+        with self.engine.begin() as conn:
+            doomed = conn.execute(select(Blob.key, Blob.size).where(Blob.touched_at < cutoff, Blob.key.not_in(live))).all()
+            if not dry_run:
+                conn.execute(delete(BlobRef).where(BlobRef.expires_at.is_not(None), BlobRef.expires_at <= now))
+                # Re-checked per row: a blob put or referenced since the select is kept
+                doomed = [
+                    (key, size) for key, size in doomed
+                    if conn.execute(delete(Blob).where(Blob.key == key, Blob.touched_at < cutoff, Blob.key.not_in(live))).rowcount
+                ]
+        if not dry_run:
+            kept = set()
+            for key, _ in doomed:
+                with self.engine.connect() as conn:
+                    if conn.execute(select(Blob.key).where(Blob.key == key)).first() is not None:
+                        kept.add(key)
+                        continue
+                if self.local:
+                    self.backend.delete(shard(key))
+                else:
+                    self.backend.delete(self._remote_key(key))
+                    if self.cache is not None:
+                        self.cache.discard(key)
+            doomed = [(key, size) for key, size in doomed if key not in kept]
+        return {"removed": len(doomed), "bytes": sum(size or 0 for _, size in doomed), "keys": [k for k, _ in doomed]}
+
+
+def get_store() -> BlobStore:
+    """Process-wide store configured from BLOB_* env vars; creates the blob tables on first use."""
+    global _store
+    with _lock:
+        if _store is None:
+            import s3_storage
+            from db import engine
+            from sqlmodel import SQLModel
+            SQLModel.metadata.create_all(engine, tables=[Blob.__table__, BlobRef.__table__])
+            if BLOB_BACKEND == "s3":
+                cache = LRUCache(BLOB_CACHE_DIR, BLOB_CACHE_MAX_MB * 1024 * 1024)
+                _store = BlobStore(s3_storage.default_backend(), cache, engine, prefix=BLOB_S3_PREFIX)
+            else:
+                _store = BlobStore(s3_storage.LocalBackend(BLOB_ROOT, base_url="/blobs"), None, engine)
+        return _store
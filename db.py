@@ -52,10 +52,34 @@ def migrate_db():
                 to_add.append("ALTER TABLE product ADD COLUMN quantity INTEGER")
             if 'printful_file_id' not in cols:
                 to_add.append("ALTER TABLE product ADD COLUMN printful_file_id INTEGER")
+            if 'taxonomy_id' not in cols:
+                to_add.append("ALTER TABLE product ADD COLUMN taxonomy_id INTEGER")
+            if 'tags' not in cols:
+                to_add.append("ALTER TABLE product ADD COLUMN tags VARCHAR")
+            res = conn.exec_driver_sql("PRAGMA table_info('pricingrule')")
+            rule_cols = {row[1] for row in res}
+            if rule_cols:
+                if 'scope' not in rule_cols:
+                    to_add.append("ALTER TABLE pricingrule ADD COLUMN scope VARCHAR NOT NULL DEFAULT 'global'")
+                if 'scope_value' not in rule_cols:
+                    to_add.append("ALTER TABLE pricingrule ADD COLUMN scope_value VARCHAR")
+                if 'band_min' not in rule_cols:
+                    to_add.append("ALTER TABLE pricingrule ADD COLUMN band_min FLOAT")
+                if 'band_max' not in rule_cols:
+                    to_add.append("ALTER TABLE pricingrule ADD COLUMN band_max FLOAT")
+                if 'priority' not in rule_cols:
+                    to_add.append("ALTER TABLE pricingrule ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
             for stmt in to_add:
                 conn.exec_driver_sql(stmt)
         except Exception:
             pass
+    # create_all only builds indexes for new tables; add later ones to existing tables
+    with engine.begin() as conn:
+        try:
+            conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_runlog_created_at_job ON runlog (created_at, job)")
+            conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_productvariant_product_sku ON productvariant (product_sku)")
+        except Exception:
+            pass
 
 
 def get_session():
@@ -1,6 +1,7 @@
 ﻿import os
 import requests
 from http_client import request as http_request
+import tempfile
 from pathlib import Path
 
 DRY_RUN = os.getenv("AUTOMERCH_DRY_RUN", "true").lower() == "true"
@@ -58,10 +59,11 @@ def publish_listing(listing_id: str) -> bool:
 def upload_listing_image_from_url(listing_id: str, image_url: str) -> bool:
     if DRY_RUN:
         return True
-    # Download image then upload via multipart
-    resp = http_request("GET", image_url, timeout=30)
-    resp.raise_for_status()
-    return _upload_listing_image_bytes(listing_id, resp.content, file_name=Path(image_url).name or "image.jpg")
+    # Stream the image to a temp file (size-capped, checked to be an image), then upload via multipart
+    import image_download
+    with tempfile.TemporaryDirectory() as tmp:
+        path = image_download.download(image_url, tmp, Path(image_url.split("?")[0]).stem or "image", timeout=30)
+        return upload_listing_image_from_file(listing_id, str(path))
 
 
 def upload_listing_image_from_file(listing_id: str, file_path: str) -> bool:
@@ -117,6 +119,52 @@ def update_listing_price(listing_id: str, price: float, currency: str = "USD", q
     return True
 
 
+def list_shop_listings(since=None, state: str = "active", page_size: int = 100, workers: int = 4) -> list[dict]:
+    """Shop listings as {listing_id, quantity, views, favorites, last_modified} dicts. Empty in DRY_RUN.
+
+    With `since` (a UTC datetime) pages are read newest-modified first and reading
+    stops at the first listing not modified since then; otherwise all pages are
+    fetched concurrently.
+    """
+    if DRY_RUN:
+        return []
+    if not ETSY_SHOP_ID:
+        raise RuntimeError("ETSY_SHOP_ID not set")
+    from datetime import datetime
+    from http_client import fetch_pages
+    url = f"{BASE_URL}/shops/{ETSY_SHOP_ID}/listings"
+
+    def page(offset, limit):
+        params = {"state": state, "limit": limit, "offset": offset, "sort_on": "updated", "sort_order": "desc"}
+        r = http_request("GET", url, headers=_headers(), params=params, timeout=30)
+        if r.status_code >= 400:
+            raise RuntimeError(f"Etsy listings error {r.status_code}: {r.text}")
+        data = r.json()
+        rows = [
+            {
+                "listing_id": str(l.get("listing_id")),
+                "quantity": l.get("quantity"),
+                "views": l.get("views"),
+                "favorites": l.get("num_favorers"),
+                "last_modified": datetime.utcfromtimestamp(l.get("last_modified_timestamp") or l.get("updated_timestamp") or 0),
+            }
+            for l in data.get("results") or []
+        ]
+        return rows, data.get("count")
+
+    if since is None:
+        return fetch_pages(page, page_size=page_size, workers=workers)
+    out: list[dict] = []
+    offset = 0
+    while True:
+        rows, total = page(offset, page_size)
+        fresh = [r for r in rows if r["last_modified"] >= since]
+        out.extend(fresh)
+        offset += page_size
+        if len(fresh) < len(rows) or not rows or (total is not None and offset >= total):
+            return out
+
+
 def search_listings(keywords: str, limit: int = 50, offset: int = 0, sort_on: str = "score") -> list[dict]:
     """Search active Etsy listings for given keywords.
 
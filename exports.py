@@ -0,0 +1,238 @@
+import json
+import os
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import DateTime, Float, Integer, String, column, inspect, select, table
+
+from db import engine
+from models import Product, ResearchSnapshot, RunLog
+
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.ipc as pa_ipc  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+except Exception:
+    pa = None
+    pa_ipc = None
+    pq = None
+
+BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+ROW_GROUP_SIZE = int(os.getenv("EXPORT_ROW_GROUP_SIZE", "50000"))
+COMPRESSION = os.getenv("EXPORT_COMPRESSION", "zstd")
+# Codecs each format can write; "none" means uncompressed
+CODECS = {
+    "parquet": ("snappy", "gzip", "zstd", "brotli", "lz4", "none"),
+    "arrow": ("lz4", "zstd", "none"),
+}
+
+# Listing rows are written by the automerch package; read them through a lightweight
+# table clause so the legacy models do not need to redefine the table.
+_listing = table(
+    "listing",
+    column("id", Integer),
+    column("listing_id", String),
+    column("sku", String),
+    column("shop_id", String),
+    column("title", String),
+    column("price", Float),
+    column("status", String),
+    column("etsy_url", String),
+    column("created_at", DateTime),
+    column("updated_at", DateTime),
+)
+
+
+def is_available() -> bool:
+    return pa is not None
+
+
+def _schema(dataset: str):
+    if dataset == "products":
+        return pa.schema([
+            ("sku", pa.string()),
+            ("name", pa.string()),
+            ("description", pa.string()),
+            ("price", pa.float64()),
+            ("cost", pa.float64()),
+            ("quantity", pa.int64()),
+            ("created_at", pa.timestamp("us")),
+            ("thumbnail_url", pa.string()),
+            ("variant_id", pa.int64()),
+            ("printful_variant_id", pa.string()),
+            ("etsy_listing_id", pa.string()),
+        ])
+    if dataset == "listings":
+        return pa.schema([
+            ("id", pa.int64()),
+            ("listing_id", pa.string()),
+            ("sku", pa.string()),
+            ("shop_id", pa.string()),
+            ("title", pa.string()),
+            ("price", pa.float64()),
+            ("status", pa.string()),
+            ("etsy_url", pa.string()),
+            ("created_at", pa.timestamp("us")),
+            ("updated_at", pa.timestamp("us")),
+        ])
+    if dataset == "runlogs":
+        return pa.schema([
+            ("id", pa.int64()),
+            ("job", pa.string()),
+            ("status", pa.string()),
+            ("message", pa.string()),
+            ("created_at", pa.timestamp("us")),
+        ])
+    if dataset == "research_metrics":
+        return pa.schema([
+            ("id", pa.int64()),
+            ("keywords", pa.string()),
+            ("limit", pa.int64()),
+            ("created_at", pa.timestamp("us")),
+            ("total_listings", pa.int64()),
+            ("price_count", pa.int64()),
+            ("price_avg", pa.float64()),
+            ("price_median", pa.float64()),
+            ("price_p25", pa.float64()),
+            ("price_p75", pa.float64()),
+            ("price_min", pa.float64()),
+            ("price_max", pa.float64()),
+            ("competition_score", pa.float64()),
+        ])
+    raise KeyError(dataset)
+
+
+DATASETS = ("products", "listings", "runlogs", "research_metrics")
+
+
+def _query(dataset: str):
+    """Return (statement, key column) for a dataset; the key drives keyset batching."""
+    if dataset == "products":
+        cols = [
+            Product.sku, Product.name, Product.description, Product.price, Product.cost,
+            Product.quantity, Product.created_at, Product.thumbnail_url, Product.variant_id,
+            Product.printful_variant_id, Product.etsy_listing_id,
+        ]
+        return select(*cols), Product.sku
+    if dataset == "listings":
+        c = _listing.c
+        cols = [c.id, c.listing_id, c.sku, c.shop_id, c.title, c.price, c.status, c.etsy_url, c.created_at, c.updated_at]
+        return select(*cols), c.id
+    if dataset == "runlogs":
+        return select(RunLog.id, RunLog.job, RunLog.status, RunLog.message, RunLog.created_at), RunLog.id
+    if dataset == "research_metrics":
+        cols = [ResearchSnapshot.id, ResearchSnapshot.keywords, ResearchSnapshot.limit, ResearchSnapshot.created_at, ResearchSnapshot.metrics_json]
+        return select(*cols), ResearchSnapshot.id
+    raise KeyError(dataset)
+
+
+def _iter_row_batches(dataset: str, batch_size: int) -> Iterator[List[Any]]:
+    """Yield rows in key order, one bounded SELECT per batch (keyset pagination)."""
+    stmt, key = _query(dataset)
+    if dataset == "listings" and not inspect(engine).has_table("listing"):
+        return
+    last = None
+    with engine.connect() as conn:
+        while True:
+            q = stmt.order_by(key).limit(batch_size)
+            if last is not None:
+                q = q.where(key > last)
+            rows = conn.execute(q).all()
+            if not rows:
+                return
+            yield rows
+            if len(rows) < batch_size:
+                return
+            last = rows[-1][0]
+
+
+def _flatten_metrics(row) -> Dict[str, Any]:
+    try:
+        m = json.loads(row[4] or "{}")
+    except Exception:
+        m = {}
+    prices = m.get("prices") or {}
+    return {
+        "id": row[0],
+        "keywords": row[1],
+        "limit": row[2],
+        "created_at": row[3],
+        "total_listings": m.get("total_listings"),
+        "price_count": prices.get("count"),
+        "price_avg": prices.get("avg"),
+        "price_median": prices.get("median"),
+        "price_p25": prices.get("p25"),
+        "price_p75": prices.get("p75"),
+        "price_min": prices.get("min"),
+        "price_max": prices.get("max"),
+        "competition_score": m.get("competition_score"),
+    }
+
+
+def iter_record_batches(dataset: str, batch_size: Optional[int] = None):
+    """Yield pyarrow RecordBatches for a dataset using batched DB reads."""
+    schema = _schema(dataset)
+    for rows in _iter_row_batches(dataset, batch_size or BATCH_SIZE):
+        if dataset == "research_metrics":
+            records = [_flatten_metrics(r) for r in rows]
+            arrays = [pa.array([rec[f.name] for rec in records], type=f.type) for f in schema]
+        else:
+            arrays = [pa.array([r[i] for r in rows], type=f.type) for i, f in enumerate(schema)]
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_parquet(dataset: str, path: str, compression: Optional[str] = None, row_group_size: Optional[int] = None) -> int:
+    """Write a dataset to a Parquet file; returns the number of rows written."""
+    schema = _schema(dataset)
+    row_group_size = row_group_size or ROW_GROUP_SIZE
+    total = 0
+    pending: List[Any] = []
+    pending_rows = 0
+    with pq.ParquetWriter(path, schema, compression=compression or COMPRESSION) as writer:
+        for batch in iter_record_batches(dataset):
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            total += batch.num_rows
+            if pending_rows >= row_group_size:
+                writer.write_table(pa.Table.from_batches(pending, schema=schema), row_group_size=row_group_size)
+                pending, pending_rows = [], 0
+        if pending or total == 0:
+            writer.write_table(pa.Table.from_batches(pending, schema=schema), row_group_size=row_group_size)
+    return total
+
+
+def write_arrow(dataset: str, path: str, compression: Optional[str] = None) -> int:
+    """Write a dataset to an Arrow IPC file (Feather v2); returns the number of rows written."""
+    schema = _schema(dataset)
+    codec = compression or COMPRESSION
+    options = pa_ipc.IpcWriteOptions(compression=None if codec == "none" else codec)
+    total = 0
+    with pa.OSFile(path, "wb") as sink, pa_ipc.new_file(sink, schema, options=options) as writer:
+        for batch in iter_record_batches(dataset):
+            writer.write_batch(batch)
+            total += batch.num_rows
+    return total
+
+
+def check_compression(fmt: str, compression: Optional[str]) -> str:
+    """The codec to write fmt with (default EXPORT_COMPRESSION); ValueError if fmt does not support it."""
+    codec = (compression or COMPRESSION).lower()
+    if codec not in CODECS[fmt]:
+        raise ValueError(f"Unsupported {fmt} compression: {codec} (use one of {', '.join(CODECS[fmt])})")
+    return codec
+
+
+def export_to_tempfile(dataset: str, fmt: str, compression: Optional[str] = None, row_group_size: Optional[int] = None) -> str:
+    """Export a dataset to a temporary file and return its path. Caller removes the file."""
+    suffix = ".parquet" if fmt == "parquet" else ".arrow"
+    fd, path = tempfile.mkstemp(prefix=f"automerch-{dataset}-", suffix=suffix)
+    os.close(fd)
+    try:
+        if fmt == "parquet":
+            write_parquet(dataset, path, compression=compression, row_group_size=row_group_size)
+        else:
+            write_arrow(dataset, path, compression=compression)
+    except Exception:
+        os.unlink(path)
+        raise
+    return path
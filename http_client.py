@@ -1,4 +1,5 @@
 import os
+import threading
 import time
 from typing import Any, Dict, Optional
 
@@ -10,13 +11,17 @@ class RateLimiter:
     def __init__(self, rps: float = 3.0):
         self.min_interval = 1.0 / max(0.1, rps)
         self._last = 0.0
+        self._lock = threading.Lock()
 
     def wait(self):
-        now = time.time()
-        elapsed = now - self._last
-        if elapsed < self.min_interval:
-            time.sleep(self.min_interval - elapsed)
-        self._last = time.time()
+        # Reserve the next slot under the lock, sleep outside it, so concurrent
+        # callers are spaced min_interval apart instead of all firing at once
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._last + self.min_interval)
+            self._last = slot
+        if slot > now:
+            time.sleep(slot - now)
 
 
 def _should_retry(exc: Exception) -> bool:
@@ -41,3 +46,22 @@ def request(method: str, url: str, *, headers: Optional[Dict[str, str]] = None,
         raise err
     return resp
 
+
+
+def fetch_pages(fetch_page, page_size: int = 100, workers: int = 4) -> list:
+    """Collect a paginated collection: fetch_page(offset, limit) -> (items, total).
+
+    The first page is fetched alone to learn the total; the remaining offsets are
+    fetched concurrently (still under the shared rate limiter) and concatenated in
+    offset order.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    items, total = fetch_page(0, page_size)
+    items = list(items)
+    if total is None or total <= len(items) or not items:
+        return items
+    offsets = list(range(page_size, total, page_size))
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for page, _ in pool.map(lambda off: fetch_page(off, page_size), offsets):
+            items.extend(page)
+    return items
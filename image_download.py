@@ -0,0 +1,139 @@
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+from uuid import uuid4
+
+import requests
+
+from blob_store import sniff_ext
+
+# Every remote image the app fetches (research thumbnails, Etsy uploads by URL,
+# provider results) comes through here. Downloads are streamed to disk in chunks,
+# capped at IMAGE_DOWNLOAD_MAX_MB, and kept only if their leading bytes are a
+# known image format, so memory per download stays at one chunk.
+IMAGE_DOWNLOAD_MAX_MB = float(os.getenv("IMAGE_DOWNLOAD_MAX_MB", "20"))
+IMAGE_DOWNLOAD_TIMEOUT = float(os.getenv("IMAGE_DOWNLOAD_TIMEOUT", "15"))
+# HEAD (or a 32-byte Range GET when HEAD is refused) before the download proper
+IMAGE_DOWNLOAD_PRECHECK = os.getenv("IMAGE_DOWNLOAD_PRECHECK", "true").lower() == "true"
+CHUNK = 64 * 1024
+SNIFF_BYTES = 32
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+# Servers that do not know better label images with these
+_GENERIC_TYPES = ("application/octet-stream", "binary/octet-stream", "application/binary")
+
+_lock = threading.Lock()
+_session = None
+
+
+def session() -> requests.Session:
+    global _session
+    with _lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers["User-Agent"] = USER_AGENT
+        return _session
+
+
+def max_bytes_default() -> int:
+    return int(IMAGE_DOWNLOAD_MAX_MB * 1024 * 1024)
+
+
+def _check_type(content_type: Optional[str], url: str):
+    ctype = (content_type or "").split(";")[0].strip().lower()
+    if ctype and not ctype.startswith("image/") and ctype not in _GENERIC_TYPES:
+        raise ValueError(f"Not an image ({ctype}): {url}")
+
+
+def _check_size(size: Optional[int], max_bytes: int, url: str):
+    if size is not None and size > max_bytes:
+        raise ValueError(f"Image too large ({size} > {max_bytes} bytes): {url}")
+
+
+def _content_range_total(value: Optional[str]) -> Optional[int]:
+    # "bytes 0-31/12345"; the total may be "*" when unknown
+    total = (value or "").rpartition("/")[2]
+    return int(total) if total.isdigit() else None
+
+
+def _content_length(resp: requests.Response) -> Optional[int]:
+    value = resp.headers.get("Content-Length")
+    return int(value) if value and value.isdigit() else None
+
+
+def precheck(url: str, max_bytes: Optional[int] = None, timeout: Optional[float] = None,
+             headers: Optional[Dict[str, str]] = None):
+    """Reject url before downloading it if it is declared too large or not an image.
+
+    Tries HEAD first; servers that refuse HEAD get a Range GET for the first
+    SNIFF_BYTES, whose magic bytes are checked too. Raises ValueError when the
+    URL is rejected; says nothing when the server gives nothing to go on.
+    """
+    max_bytes = max_bytes_default() if max_bytes is None else max_bytes
+    timeout = IMAGE_DOWNLOAD_TIMEOUT if timeout is None else timeout
+    try:
+        resp = session().head(url, headers=headers, timeout=timeout, allow_redirects=True)
+    except requests.RequestException:
+        resp = None
+    if resp is not None and resp.status_code < 400:
+        _check_type(resp.headers.get("Content-Type"), url)
+        _check_size(_content_length(resp), max_bytes, url)
+        return
+    range_headers = dict(headers or {}, Range=f"bytes=0-{SNIFF_BYTES - 1}")
+    with session().get(url, headers=range_headers, timeout=timeout, stream=True) as resp:
+        if resp.status_code >= 400:
+            resp.raise_for_status()
+        _check_type(resp.headers.get("Content-Type"), url)
+        if resp.status_code == 206:
+            _check_size(_content_range_total(resp.headers.get("Content-Range")), max_bytes, url)
+        else:
+            _check_size(_content_length(resp), max_bytes, url)
+        head = resp.raw.read(SNIFF_BYTES, decode_content=True)
+        if head and not sniff_ext(head):
+            raise ValueError(f"Not an image: {url}")
+
+
+def download(url: str, dest_dir, filename: Optional[str] = None, max_bytes: Optional[int] = None,
+             timeout: Optional[float] = None, headers: Optional[Dict[str, str]] = None,
+             check_first: Optional[bool] = None) -> Path:
+    """Stream an image at url to dest_dir/<filename><ext>; returns the path.
+
+    ext comes from the content's magic bytes, not the URL or Content-Type.
+    filename defaults to a random name. Raises ValueError for oversized or
+    non-image content and requests exceptions for HTTP failures; nothing is
+    left behind on failure.
+    """
+    max_bytes = max_bytes_default() if max_bytes is None else max_bytes
+    timeout = IMAGE_DOWNLOAD_TIMEOUT if timeout is None else timeout
+    if IMAGE_DOWNLOAD_PRECHECK if check_first is None else check_first:
+        precheck(url, max_bytes, timeout, headers)
+    dest_dir = Path(dest_dir)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    tmp = dest_dir / f"{uuid4().hex}.part"
+    try:
+        with session().get(url, headers=headers, timeout=timeout, stream=True) as resp:
+            resp.raise_for_status()
+            _check_type(resp.headers.get("Content-Type"), url)
+            _check_size(_content_length(resp), max_bytes, url)
+            head = b""
+            size = 0
+            with open(tmp, "wb") as out:
+                for chunk in resp.iter_content(CHUNK):
+                    if not chunk:
+                        continue
+                    if len(head) < SNIFF_BYTES:
+                        head += chunk[:SNIFF_BYTES - len(head)]
+                        if len(head) >= SNIFF_BYTES and not sniff_ext(head):
+                            raise ValueError(f"Not an image: {url}")
+                    size += len(chunk)
+                    _check_size(size, max_bytes, url)
+                    out.write(chunk)
+        ext = sniff_ext(head)
+        if not ext:
+            raise ValueError(f"Not an image: {url}")
+        path = dest_dir / f"{filename or uuid4().hex}{ext}"
+        tmp.replace(path)
+        return path
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
@@ -0,0 +1,169 @@
+import multiprocessing
+import os
+import shutil
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+from uuid import uuid4
+
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+IMAGE_IO_WORKERS = int(os.getenv("IMAGE_IO_WORKERS", "4"))
+IMG_MAX_WIDTH = int(os.getenv("IMG_MAX_WIDTH", "1600"))
+IMG_JPEG_QUALITY = int(os.getenv("IMG_JPEG_QUALITY", "88"))
+COPY_CHUNK = 1024 * 1024
+DERIVATIVE_WIDTHS = sorted({int(w) for w in os.getenv("DERIVATIVE_WIDTHS", "160,320,640,1280").split(",") if w.strip()})
+DERIVATIVE_QUALITY = int(os.getenv("DERIVATIVE_QUALITY", "80"))
+# Preferred first; formats this Pillow build cannot encode are dropped
+DERIVATIVE_FORMATS = [f.strip() for f in os.getenv("DERIVATIVE_FORMATS", "avif,webp,jpeg").split(",") if f.strip()]
+_EXT = {"jpeg": "jpg", "webp": "webp", "avif": "avif"}
+
+_lock = threading.Lock()
+_cpu_pool: Optional[ProcessPoolExecutor] = None
+_io_pool: Optional[ThreadPoolExecutor] = None
+
+
+def save_stream(src, dest: Path) -> int:
+    """Copy a file-like object to dest in chunks (never holding it in memory); returns bytes written."""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(dest.name + ".part")
+    with open(tmp, "wb") as out:
+        shutil.copyfileobj(src, out, COPY_CHUNK)
+        size = out.tell()
+    tmp.replace(dest)
+    return size
+
+
+def process_image(src: str, dest: str, max_width: int = IMG_MAX_WIDTH, quality: int = IMG_JPEG_QUALITY) -> dict:
+    """Decode, downscale and re-encode src as a JPEG at dest. Runs in a worker process.
+
+    JPEGs are decoded at reduced scale with draft(); other formats are shrunk by an
+    integer factor with reduce() before the final resample, so large print files
+    never go through a full-resolution resize.
+    """
+    from PIL import Image
+    with Image.open(src) as im:
+        w, h = im.size
+        if im.format == "JPEG" and w > max_width:
+            # Lets libjpeg decode at 1/2, 1/4 or 1/8 scale, never below the requested size
+            im.draft("RGB", (max_width, max(1, h * max_width // w)))
+        im = im.convert("RGB")
+        factor = im.width // max_width
+        if factor >= 2:
+            im = im.reduce(factor)
+        if im.width > max_width:
+            im = im.resize((max_width, max(1, round(im.height * max_width / im.width))))
+        out = Path(dest)
+        tmp = out.with_name(out.name + ".part")
+        im.save(tmp, format="JPEG", quality=quality)
+        tmp.replace(out)
+        return {"path": str(out), "width": im.width, "height": im.height, "source_size": (w, h)}
+
+
+def available_formats() -> list:
+    from PIL import features
+    return [f for f in DERIVATIVE_FORMATS if f == "jpeg" or (f in _EXT and features.check(f))]
+
+
+def derivative_path(derived_dir: Path, width: int, fmt: str) -> Path:
+    return Path(derived_dir) / f"{width}.{_EXT[fmt]}"
+
+
+def pick_width(requested: int) -> int:
+    """Smallest configured width that covers the request (the largest one otherwise)."""
+    for w in DERIVATIVE_WIDTHS:
+        if w >= requested:
+            return w
+    return DERIVATIVE_WIDTHS[-1]
+
+
+def make_derivatives(src: str, derived_dir: str, widths=None, formats=None) -> list:
+    """Write width x format variants of src into derived_dir (as {width}.{ext}); returns the paths.
+
+    Each width is resampled once from the previous, larger one, largest first.
+    """
+    from PIL import Image
+    widths = sorted(widths or DERIVATIVE_WIDTHS, reverse=True)
+    formats = formats or available_formats()
+    out_dir = Path(derived_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    with Image.open(src) as im:
+        im.draft("RGB", (widths[0], max(1, im.height * widths[0] // im.width)))
+        im = im.convert("RGB")
+        for w in widths:
+            if im.width > w:
+                im = im.resize((w, max(1, round(im.height * w / im.width))), Image.LANCZOS)
+            for fmt in formats:
+                path = derivative_path(out_dir, w, fmt)
+                # Unique temp name: lazy renders of the same file may race
+                tmp = path.with_name(f"{path.name}.{uuid4().hex}.part")
+                im.save(tmp, format=fmt.upper(), quality=DERIVATIVE_QUALITY)
+                tmp.replace(path)
+                written.append(str(path))
+    return written
+
+
+def process_upload(src: str, dest: str, derived_dir: Optional[str] = None) -> dict:
+    """process_image, then every derivative of the result, in one worker task."""
+    result = process_image(src, dest)
+    if derived_dir:
+        result["derivatives"] = make_derivatives(dest, derived_dir)
+    return result
+
+
+def ensure_derivative(src: Path, derived_dir: Path, width: int, fmt: str) -> Path:
+    """Return a cached derivative, rendering it (in the worker pool) if missing or older than src."""
+    path = derivative_path(derived_dir, width, fmt)
+    try:
+        if path.stat().st_mtime >= src.stat().st_mtime:
+            return path
+    except FileNotFoundError:
+        pass
+    _cpu().submit(make_derivatives, str(src), str(derived_dir), [width], [fmt]).result()
+    return path
+
+
+def _cpu() -> ProcessPoolExecutor:
+    global _cpu_pool
+    with _lock:
+        if _cpu_pool is None:
+            # spawn: forked workers would inherit the server's threads and DB connections
+            _cpu_pool = ProcessPoolExecutor(max_workers=max(1, IMAGE_WORKERS), mp_context=multiprocessing.get_context("spawn"))
+        return _cpu_pool
+
+
+def _io() -> ThreadPoolExecutor:
+    global _io_pool
+    with _lock:
+        if _io_pool is None:
+            _io_pool = ThreadPoolExecutor(max_workers=max(1, IMAGE_IO_WORKERS), thread_name_prefix="image-io")
+        return _io_pool
+
+
+def submit(src: Path, dest: Path, on_done: Callable[[Optional[dict], Optional[BaseException]], None],
+           derived_dir: Optional[Path] = None) -> Future:
+    """Process src into dest (and its derivatives) off-thread; on_done(result, error) runs on the I/O pool."""
+    future = _cpu().submit(process_upload, str(src), str(dest), str(derived_dir) if derived_dir else None)
+
+    def _done(f: Future):
+        _io().submit(on_done, None if f.exception() else f.result(), f.exception())
+
+    future.add_done_callback(_done)
+    return future
+
+
+def run_io(fn, *args) -> Future:
+    """Run blocking I/O (S3 uploads, DB updates) on the shared image I/O pool."""
+    return _io().submit(fn, *args)
+
+
+def shutdown(wait: bool = False):
+    global _cpu_pool, _io_pool
+    with _lock:
+        cpu, io = _cpu_pool, _io_pool
+        _cpu_pool = _io_pool = None
+    if cpu is not None:
+        cpu.shutdown(wait=wait, cancel_futures=not wait)
+    if io is not None:
+        io.shutdown(wait=wait)
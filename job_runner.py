@@ -0,0 +1,359 @@
+import contextlib
+import importlib
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, select, update
+
+from db import engine
+from models import JobRun
+from runlog_sink import log_run
+
+JOB_MODULES = {
+    "list_to_etsy": "jobs.list_to_etsy",
+    "pull_metrics": "jobs.pull_metrics",
+    "prune_scale": "jobs.prune_scale",
+    "weekly_report": "jobs.weekly_report",
+    "intake_to_assets": "jobs.intake_to_assets",
+    "sync_prices": "jobs.sync_prices",
+    "sync_inventory": "jobs.sync_inventory",
+    "prune_logs": "jobs.prune_logs",
+    "blob_gc": "jobs.blob_gc",
+}
+RUNNER_WORKERS = int(os.getenv("JOB_RUNNER_WORKERS", "4"))
+DEFAULT_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY_DEFAULT", "1"))
+LOG_MAX_LINES = int(os.getenv("JOB_LOG_MAX_LINES", "2000"))
+# /api/jobs/runs/{id}/stream gives up after this long without new output, or this long overall
+STREAM_IDLE_SECONDS = float(os.getenv("JOB_STREAM_IDLE_SECONDS", "300"))
+STREAM_MAX_SECONDS = float(os.getenv("JOB_STREAM_MAX_SECONDS", "3600"))
+
+
+def _parse_limits(value: str) -> Dict[str, int]:
+    """Parse JOB_CONCURRENCY, e.g. "pull_metrics=2,weekly_report=1"."""
+    limits: Dict[str, int] = {}
+    for part in (value or "").split(","):
+        name, _, n = part.partition("=")
+        if name.strip() and n.strip().isdigit():
+            limits[name.strip()] = max(1, int(n))
+    return limits
+
+
+CONCURRENCY = _parse_limits(os.getenv("JOB_CONCURRENCY", ""))
+
+_lock = threading.Lock()
+_active: Dict[str, int] = {}
+_live: Dict[int, "_RunOutput"] = {}
+_local = threading.local()
+_pool: Optional[ThreadPoolExecutor] = None
+_capture_users = 0
+_capture_handler: Optional[logging.Handler] = None
+
+
+class _RunOutput:
+    """Line buffer for one run; keeps the last LOG_MAX_LINES lines with absolute offsets."""
+
+    def __init__(self):
+        self.lines: List[str] = []
+        self.dropped = 0
+        self._partial = ""
+
+    def write(self, text: str):
+        text = self._partial + text
+        *complete, self._partial = text.split("\n")
+        with _lock:
+            self.lines.extend(complete)
+            overflow = len(self.lines) - LOG_MAX_LINES
+            if overflow > 0:
+                del self.lines[:overflow]
+                self.dropped += overflow
+
+    def close(self):
+        if self._partial:
+            self.write("\n")
+
+    def since(self, offset: int) -> Tuple[List[str], int]:
+        with _lock:
+            start = max(0, offset - self.dropped)
+            return list(self.lines[start:]), self.dropped + len(self.lines)
+
+
+def _current_output() -> Optional[_RunOutput]:
+    """Buffer of the run writing from this thread.
+
+    Threads a job spawns (its worker pools) have no run of their own; their output
+    goes to the only live run, and is left out when several runs share the process.
+    """
+    out = getattr(_local, "output", None)
+    if out is None:
+        with _lock:
+            if len(_live) == 1:
+                out = next(iter(_live.values()))
+    return out
+
+
+class _RunStdout:
+    """sys.stdout while runs are live: copies writes into the writing run's buffer, then passes them on."""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, text):
+        out = _current_output()
+        if out is not None:
+            out.write(text)
+        return self._stream.write(text)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class _RunLogHandler(logging.Handler):
+    def emit(self, record):
+        out = _current_output()
+        if out is not None:
+            out.write(self.format(record) + "\n")
+
+
+@contextlib.contextmanager
+def _captured():
+    """Capture stdout and logging into run buffers while at least one run is live in this process."""
+    global _capture_users, _capture_handler
+    with _lock:
+        _capture_users += 1
+        if _capture_users == 1:
+            sys.stdout = _RunStdout(sys.stdout)
+            _capture_handler = _RunLogHandler()
+            _capture_handler.setFormatter(logging.Formatter("%(levelname)s %(name)s: %(message)s"))
+            logging.getLogger().addHandler(_capture_handler)
+    try:
+        yield
+    finally:
+        with _lock:
+            _capture_users -= 1
+            if _capture_users == 0:
+                # Only undo our own proxy; something else may have replaced stdout since
+                if isinstance(sys.stdout, _RunStdout):
+                    sys.stdout = sys.stdout._stream
+                logging.getLogger().removeHandler(_capture_handler)
+                _capture_handler = None
+
+
+def _limit(job: str) -> int:
+    return CONCURRENCY.get(job, DEFAULT_CONCURRENCY)
+
+
+def _reserve(job: str) -> bool:
+    with _lock:
+        if _active.get(job, 0) >= _limit(job):
+            return False
+        _active[job] = _active.get(job, 0) + 1
+        return True
+
+
+def _release(job: str):
+    with _lock:
+        _active[job] = max(0, _active.get(job, 0) - 1)
+
+
+def _items(result) -> Optional[int]:
+    """Items processed, from whatever a job's run() returned."""
+    if isinstance(result, bool):
+        return None
+    if isinstance(result, int):
+        return result
+    if isinstance(result, dict):
+        for key in ("items", "processed", "changed", "updated", "count"):
+            if isinstance(result.get(key), int):
+                return result[key]
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return None
+
+
+def _create(job: str, trigger: str, status: str, message: Optional[str] = None) -> int:
+    with engine.begin() as conn:
+        res = conn.execute(insert(JobRun).values(job=job, trigger=trigger, status=status, message=message, queued_at=datetime.utcnow()))
+        return res.inserted_primary_key[0]
+
+
+def _update(run_id: int, **values):
+    with engine.begin() as conn:
+        conn.execute(update(JobRun).where(JobRun.id == run_id).values(**values))
+
+
+def _execute(run_id: int, job: str):
+    """Run the job module in the current thread, recording timing and output on its JobRun."""
+    output = _RunOutput()
+    with _lock:
+        _live[run_id] = output
+    started = datetime.utcnow()
+    t0 = time.perf_counter()
+    _update(run_id, status="running", started_at=started)
+    _local.output = output
+    status, message, result = "ok", None, None
+    try:
+        with _captured():
+            mod = importlib.import_module(JOB_MODULES[job])
+            if hasattr(mod, "run"):
+                result = mod.run()
+            else:
+                status, message = "no_run", "run() not implemented"
+    except Exception as e:
+        status, message = "error", str(e)
+        output.write(f"{type(e).__name__}: {e}\n")
+    finally:
+        _local.output = None
+        output.close()
+        duration_ms = (time.perf_counter() - t0) * 1000.0
+        lines, _ = output.since(0)
+        try:
+            _update(
+                run_id,
+                status=status,
+                message=message,
+                finished_at=datetime.utcnow(),
+                duration_ms=round(duration_ms, 3),
+                items=_items(result),
+                log="\n".join(lines),
+            )
+        finally:
+            with _lock:
+                _live.pop(run_id, None)
+            _release(job)
+    log_run(job, status, message)
+
+
+def _pool_instance() -> ThreadPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=max(1, RUNNER_WORKERS), thread_name_prefix="job-runner")
+        return _pool
+
+
+def _admit(job: str, trigger: str) -> Tuple[Optional[int], bool]:
+    """Create the JobRun row; returns (run_id, admitted)."""
+    if job not in JOB_MODULES:
+        log_run(job, "unknown", f"Unknown job: {job}")
+        return _create(job, trigger, "unknown", f"Unknown job: {job}"), False
+    if not _reserve(job):
+        message = f"{job} already running (limit {_limit(job)})"
+        log_run(job, "skipped", message)
+        return _create(job, trigger, "skipped", message), False
+    try:
+        return _create(job, trigger, "queued"), True
+    except Exception:
+        _release(job)
+        raise
+
+
+def submit(job: str, trigger: str = "manual") -> Tuple[Optional[int], bool]:
+    """Queue a job on the runner pool; returns (run_id, admitted) without waiting for it.
+
+    A job already at its concurrency limit is recorded as "skipped" instead of queued.
+    """
+    run_id, admitted = _admit(job, trigger)
+    if admitted:
+        try:
+            _pool_instance().submit(_execute, run_id, job)
+        except Exception:
+            _release(job)
+            raise
+    return run_id, admitted
+
+
+def execute(job: str, trigger: str = "schedule") -> Optional[int]:
+    """Run a job in the calling thread (scheduler executors) under the same limits and bookkeeping."""
+    run_id, admitted = _admit(job, trigger)
+    if admitted:
+        _execute(run_id, job)
+    return run_id
+
+
+def read_log(run_id: int, offset: int = 0) -> Tuple[List[str], int, bool]:
+    """Return (lines after offset, next offset, finished) for a run, live or completed."""
+    with _lock:
+        output = _live.get(run_id)
+    if output is not None:
+        lines, next_offset = output.since(offset)
+        return lines, next_offset, False
+    with engine.connect() as conn:
+        row = conn.execute(select(JobRun.status, JobRun.log).where(JobRun.id == run_id)).first()
+    if row is None:
+        return [], offset, True
+    if row.status in ("queued", "running"):
+        # Not picked up by a worker yet (or running in another process)
+        return [], offset, False
+    lines = row.log.split("\n") if row.log else []
+    return lines[offset:], max(offset, len(lines)), True
+
+
+def get_run(run_id: int) -> Optional[dict]:
+    with engine.connect() as conn:
+        row = conn.execute(select(JobRun).where(JobRun.id == run_id)).mappings().first()
+    return dict(row) if row else None
+
+
+def _percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+
+def history(job: str, limit: int = 50) -> dict:
+    """Latest finished runs of a job (newest first) with p50/p95 latency and throughput."""
+    cols = (JobRun.id, JobRun.status, JobRun.trigger, JobRun.started_at, JobRun.duration_ms, JobRun.items)
+    stmt = (
+        select(*cols)
+        .where(JobRun.job == job, JobRun.duration_ms.is_not(None))
+        .order_by(JobRun.started_at.desc(), JobRun.id.desc())
+        .limit(max(1, min(1000, limit)))
+    )
+    with engine.connect() as conn:
+        runs = [dict(r) for r in conn.execute(stmt).mappings()]
+    durations = sorted(r["duration_ms"] for r in runs)
+    items = [(r["items"], r["duration_ms"]) for r in runs if r["items"] is not None and r["duration_ms"]]
+    throughput = None
+    if items:
+        throughput = round(sum(n for n, _ in items) / (sum(ms for _, ms in items) / 1000.0), 3)
+    return {
+        "job": job,
+        "runs": runs,
+        "count": len(runs),
+        "p50_ms": _percentile(durations, 0.50),
+        "p95_ms": _percentile(durations, 0.95),
+        "max_ms": durations[-1] if durations else None,
+        "items_per_sec": throughput,
+    }
+
+
+def latency_summary(limit: int = 50) -> List[dict]:
+    """history() without the run lists, for every known job."""
+    out = []
+    for job in JOB_MODULES:
+        h = history(job, limit)
+        h.pop("runs")
+        out.append(h)
+    return out
+
+
+def recent_runs(limit: int = 20) -> List[dict]:
+    cols = (JobRun.id, JobRun.job, JobRun.trigger, JobRun.status, JobRun.started_at, JobRun.duration_ms, JobRun.items, JobRun.message)
+    stmt = select(*cols).order_by(JobRun.id.desc()).limit(max(1, limit))
+    with engine.connect() as conn:
+        return [dict(r) for r in conn.execute(stmt).mappings()]
+
+
+def shutdown(wait: bool = False):
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=wait)
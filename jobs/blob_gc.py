@@ -0,0 +1,18 @@
+from datetime import timedelta
+from typing import Optional
+
+from runlog_sink import log_run
+
+
+def run(dry_run: bool = False, grace_hours: Optional[float] = None):
+    """Delete blobs that no product, research result or generation batch references any more.
+
+    References with a TTL (research thumbnails, generated images) lapse on their own;
+    unreferenced blobs younger than BLOB_GC_GRACE_HOURS are kept.
+    """
+    import blob_store
+    store = blob_store.get_store()
+    grace = timedelta(hours=grace_hours) if grace_hours is not None else None
+    result = store.gc(grace=grace, dry_run=dry_run)
+    log_run("blob_gc", "ok", f"removed={result['removed']}, bytes={result['bytes']}, dry_run={dry_run}")
+    return {"items": result["removed"], "bytes": result["bytes"], "dry_run": dry_run}
@@ -0,0 +1,40 @@
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func
+from sqlmodel import select
+
+from db import get_session
+from models import RunLog, RunLogDaily
+
+
+def run(dry_run: bool = False, retention_days: int | None = None):
+    """Roll RunLog rows older than the retention window into RunLogDaily, then delete them.
+
+    Counts are added to any existing (day, job, status) rollup, so repeated runs are safe.
+    Retention defaults to RUNLOG_RETENTION_DAYS (30).
+    """
+    days = retention_days if retention_days is not None else int(os.getenv("RUNLOG_RETENTION_DAYS", "30"))
+    cutoff = datetime.utcnow() - timedelta(days=max(0, days))
+    day = func.date(RunLog.created_at)
+    with get_session() as s:
+        groups = [(str(g[0]), *g[1:]) for g in s.exec(
+            select(day, RunLog.job, RunLog.status, func.count(), func.min(RunLog.created_at), func.max(RunLog.created_at))
+            .where(RunLog.created_at < cutoff)
+            .group_by(day, RunLog.job, RunLog.status)
+        ).all()]
+        compacted = sum(g[3] for g in groups)
+        if not dry_run and groups:
+            existing = {
+                (r.day, r.job, r.status): r
+                for r in s.exec(select(RunLogDaily).where(RunLogDaily.day.in_({g[0] for g in groups}))).all()
+            }
+            for d, job, status, count, first_at, last_at in groups:
+                row = existing.get((d, job, status)) or RunLogDaily(day=d, job=job, status=status, count=0)
+                row.count += count
+                row.first_at = min(filter(None, [row.first_at, first_at]))
+                row.last_at = max(filter(None, [row.last_at, last_at]))
+                s.add(row)
+            s.exec(delete(RunLog).where(RunLog.created_at < cutoff))
+        s.add(RunLog(job="prune_logs", status="ok", message=f"compacted={compacted}, groups={len(groups)}, retention_days={days}, dry_run={dry_run}"))
+        s.commit()
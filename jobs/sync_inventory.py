@@ -1,29 +1,179 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import delete, insert, select
+
 from db import get_session
-from models import Product, RunLog
+from models import InventoryState, Product
+from printful_client import UNAVAILABLE as OUT_OF_STOCK
+from runlog_sink import log_run
+from sync_plan import SyncPlan, apply_plan, get_watermark, set_watermark
+
+DEFAULT_QUANTITY = int(os.getenv("INVENTORY_IN_STOCK_QTY", "999"))
+SYNC_WORKERS = int(os.getenv("INVENTORY_SYNC_WORKERS", "4"))
+WATERMARK = "sync_inventory"
+# remote_hash of a SKU whose Etsy push failed: never matches, so plan() retries it
+PENDING = "pending"
+
+
+def _remote_hash(printful_status: Optional[str], etsy_quantity: Optional[int]) -> str:
+    raw = json.dumps([printful_status, etsy_quantity])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _desired(quantity: Optional[int], printful_status: Optional[str]) -> Optional[int]:
+    if printful_status in OUT_OF_STOCK:
+        return 0
+    if printful_status is not None:
+        return DEFAULT_QUANTITY if not quantity else quantity
+    # No Printful variant: only make sure a quantity is set
+    return DEFAULT_QUANTITY if quantity is None else quantity
+
+
+def fetch_remote(since: Optional[datetime] = None) -> dict:
+    """Pull Printful availability and Etsy listing quantities (both empty in dry-run mode)."""
+    from etsy_client import list_shop_listings
+    from printful_client import list_product_availability
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        printful = pool.submit(list_product_availability, workers=SYNC_WORKERS)
+        etsy = pool.submit(list_shop_listings, since=since, workers=SYNC_WORKERS)
+        return {
+            "printful": printful.result(),
+            "etsy": {l["listing_id"]: l["quantity"] for l in etsy.result()},
+        }
+
+
+def stored_remote(session) -> dict:
+    """Remote state as of the last sync, from InventoryState; no API calls."""
+    rows = session.connection().execute(select(InventoryState.sku, InventoryState.printful_status))
+    # An empty etsy dict makes plan() reuse each SKU's stored Etsy quantity
+    return {"printful": {sku: status for sku, status in rows if status is not None}, "etsy": {}}
+
+
+def plan(session, remote: Optional[dict] = None, refresh: bool = False) -> SyncPlan:
+    """Diff Product.quantity against remote stock, skipping SKUs whose remote state hash is unchanged.
+
+    Without remote, the diff is against the state stored by the last sync, unless
+    refresh fetches it from Printful and Etsy. plan.listing_ids holds the listings
+    whose Etsy quantity must be pushed and plan.remote the InventoryState rows to
+    store once the plan is applied.
+    """
+    if remote is None:
+        remote = fetch_remote(get_watermark(session, WATERMARK)) if refresh else stored_remote(session)
+    printful: Dict[str, str] = remote.get("printful") or {}
+    etsy: Dict[str, Optional[int]] = remote.get("etsy") or {}
+    result = SyncPlan(job="sync_inventory", field="quantity")
+    conn = session.connection()
+    states = {
+        row.sku: row
+        for row in conn.execute(
+            select(InventoryState.sku, InventoryState.etsy_quantity, InventoryState.quantity, InventoryState.remote_hash)
+        )
+    }
+    rows = conn.execute(select(Product.sku, Product.quantity, Product.etsy_listing_id))
+    for sku, quantity, listing_id in rows:
+        result.examined += 1
+        state = states.get(sku)
+        pf_status = printful.get(sku)
+        listing_id = str(listing_id) if listing_id else None
+        # Listings not modified since the watermark were not fetched; reuse what we saw last time
+        if listing_id and listing_id in etsy:
+            etsy_qty = etsy[listing_id]
+        else:
+            etsy_qty = state.etsy_quantity if state else None
+        digest = _remote_hash(pf_status, etsy_qty)
+        if state and state.remote_hash == digest and state.quantity == quantity and quantity is not None:
+            continue
+        target = _desired(quantity, pf_status)
+        if target != quantity:
+            result.changes.append((sku, quantity, target))
+        seen_qty = etsy_qty
+        if listing_id and etsy_qty is not None and etsy_qty != target:
+            result.listing_ids[sku] = listing_id
+            etsy_qty = target
+            digest = _remote_hash(pf_status, etsy_qty)
+        result.remote[sku] = {
+            "sku": sku,
+            "printful_status": pf_status,
+            "etsy_quantity": etsy_qty,
+            "quantity": target,
+            "remote_hash": digest,
+            "seen_etsy_quantity": seen_qty,
+        }
+    return result
+
+
+def _push_quantities(session, plan_: SyncPlan) -> Dict[str, str]:
+    """Push changed Etsy quantities concurrently; returns {sku: error} for failures."""
+    from etsy_client import update_listing_price
+    skus = list(plan_.listing_ids)
+    prices = {}
+    for i in range(0, len(skus), 500):
+        chunk = skus[i:i + 500]
+        prices.update(session.connection().execute(select(Product.sku, Product.price).where(Product.sku.in_(chunk))).all())
+
+    def push(sku):
+        price = prices.get(sku)
+        if price is None:
+            return sku, "no price"
+        try:
+            update_listing_price(plan_.listing_ids[sku], float(price), quantity=int(plan_.remote[sku]["quantity"]))
+            return sku, None
+        except Exception as e:
+            return sku, str(e) or type(e).__name__
+
+    with ThreadPoolExecutor(max_workers=max(1, SYNC_WORKERS)) as pool:
+        return {sku: err for sku, err in pool.map(push, skus) if err}
+
+
+def _store_states(session, plan_: SyncPlan, failed: Dict[str, str], started: datetime):
+    """Store reconciled states and advance the watermark.
+
+    A SKU whose push failed is stored with the Etsy quantity seen before the push
+    and a PENDING hash, so the next run retries it even though its listing is not
+    re-fetched; one failing listing cannot hold the watermark back.
+    """
+    rows = []
+    for sku, r in plan_.remote.items():
+        row = {k: r[k] for k in ("sku", "printful_status", "etsy_quantity", "quantity", "remote_hash")}
+        if sku in failed:
+            row.update(etsy_quantity=r["seen_etsy_quantity"], remote_hash=PENDING)
+        rows.append(dict(row, synced_at=started))
+    for i in range(0, len(rows), 500):
+        chunk = rows[i:i + 500]
+        session.execute(delete(InventoryState).where(InventoryState.sku.in_([r["sku"] for r in chunk])))
+        session.execute(insert(InventoryState), chunk)
+    set_watermark(session, WATERMARK, started)
+    session.commit()
 
 
 def run(dry_run: bool = True):
-    """Placeholder: reconcile local quantities with marketplace.
+    """Reconcile Product.quantity with Printful availability and Etsy listing stock.
 
-    If you later store Printful/warehouse stock, compare and update Product.quantity
-    and optionally pause listings when out of stock.
+    Remote state is pulled in concurrent pages. SKUs whose remote state hash and
+    local quantity are unchanged since the last sync are skipped, and Etsy listings
+    untouched since the watermark are not fetched at all. Dry runs only plan, against
+    the stored state. Returns the plan summary.
     """
-    examined = 0
-    updated = 0
-    with get_session() as s:
-        rows = s.query(Product).all()
-        for p in rows:
-            examined += 1
-            # Without external inventory source, we just ensure quantity is set for active products
-            if p.quantity is None:
-                if dry_run:
-                    updated += 1
-                    continue
-                p.quantity = 999
-                s.add(p)
-                s.commit()
-                updated += 1
+    started = datetime.utcnow()
+    failed: Dict[str, str] = {}
     with get_session() as s:
-        s.add(RunLog(job="sync_inventory", status="ok", message=f"examined={examined}, updated={updated}, dry_run={dry_run}"))
-        s.commit()
-
+        p = plan(s, refresh=not dry_run)
+        if not dry_run:
+            apply_plan(s, p)
+            if p.listing_ids:
+                failed = _push_quantities(s, p)
+            _store_states(s, p, failed, started)
+    log_run(
+        "sync_inventory",
+        "ok" if not failed else "error",
+        f"examined={p.examined}, updated={len(p)}, pushed={len(p.listing_ids) - len(failed)}, errors={len(failed)}, dry_run={dry_run}",
+    )
+    summary = p.summary()
+    summary["pushed"] = len(p.listing_ids) - len(failed)
+    summary["errors"] = len(failed)
+    return summary
@@ -1,42 +1,52 @@
+from sqlalchemy import select
+
 from db import get_session
-from models import Product, RunLog
+from models import Product
+from runlog_sink import log_run
+from sync_plan import SyncPlan, apply_plan
 
 
 def _round_99(value: float) -> float:
     return round(max(0.0, float(value)) + 0.001, 2) if value is not None else value
 
 
+def plan(session) -> SyncPlan:
+    """Compute price changes from a single (sku, price, etsy_listing_id) projection."""
+    result = SyncPlan(job="sync_prices", field="price")
+    # Plain Core rows: no ORM entity construction on large catalogues
+    for sku, price, listing_id in session.connection().execute(select(Product.sku, Product.price, Product.etsy_listing_id)):
+        result.examined += 1
+        if price is None:
+            continue
+        target = _round_99(price)
+        if abs(price - target) >= 0.01:
+            result.changes.append((sku, price, target))
+            if listing_id:
+                result.listing_ids[sku] = listing_id
+    return result
+
+
 def run(dry_run: bool = True):
     """Apply a simple pricing rule: ensure .99 ending if price is set.
 
-    In dry_run, just logs proposed changes. When not dry_run, updates DB and Etsy listing price if present.
+    In dry_run, only plans and logs the change count. Otherwise writes prices in chunks
+    and pushes them to Etsy for listed products, together with listings whose earlier
+    push failed. Returns the plan summary.
     """
-    from etsy_client import update_listing_price
-    changed = 0
-    examined = 0
+    from price_push import push_prices, stale_listings
     errors = 0
     with get_session() as s:
-        rows = s.query(Product).all()
-        for p in rows:
-            examined += 1
-            if p.price is None:
-                continue
-            target = _round_99(p.price)
-            if abs((p.price or 0) - target) >= 0.01:
-                if dry_run:
-                    changed += 1
-                    continue
-                try:
-                    p.price = target
-                    s.add(p)
-                    s.commit()
-                    if p.etsy_listing_id:
-                        update_listing_price(p.etsy_listing_id, float(target))
-                    changed += 1
-                except Exception:
-                    errors += 1
-                    s.rollback()
-    with get_session() as s:
-        s.add(RunLog(job="sync_prices", status="ok", message=f"examined={examined}, changed={changed}, errors={errors}, dry_run={dry_run}"))
-        s.commit()
-
+        p = plan(s)
+        if not dry_run:
+            apply_plan(s, p)
+            pushes = {sku: (sku, p.listing_ids[sku], new) for sku, _, new in p.changes if sku in p.listing_ids}
+            for sku, listing_id, price in stale_listings(s):
+                pushes.setdefault(sku, (sku, listing_id, price))
+    if not dry_run and pushes:
+        errors = push_prices(pushes.values())["errors"]
+    log_run(
+        "sync_prices", "error" if errors else "ok",
+        f"examined={p.examined}, changed={len(p)}, errors={errors}, dry_run={dry_run}",
+        counts={"repriced": 0 if dry_run else len(p)},
+    )
+    return p.summary()
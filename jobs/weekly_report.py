@@ -1,3 +1,87 @@
-﻿
-def run():
-    print("Weekly report generated (stub)")
+﻿import hashlib
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import report_stats
+from db import engine
+from runlog_sink import log_run
+
+REPORTS_DIR = Path(os.getenv("REPORTS_DIR", str(Path(__file__).resolve().parent.parent / "reports")))
+TOP_KEYWORDS = int(os.getenv("REPORT_TOP_KEYWORDS", "10"))
+_HEADER = "<!-- stats:{} -->\n"
+# Written on the first render at or after the week's end; only then is the artifact frozen
+_FINAL = "<!-- final -->\n"
+
+
+def artifact_path(week: str) -> Path:
+    return REPORTS_DIR / f"weekly-{week}.md"
+
+
+def render(week: str, stats) -> str:
+    totals = {m: 0 for m in ("drafts_created", "published", "repriced")}
+    errors, keywords = [], []
+    for metric, key, count in stats:
+        if metric in totals:
+            totals[metric] += count
+        elif metric == "errors":
+            errors.append((key, count))
+        elif metric == "research_keyword":
+            keywords.append((key, count))
+    start, end = report_stats.week_bounds(week)
+    lines = [
+        f"# Weekly report {week}",
+        f"{start:%Y-%m-%d} to {end:%Y-%m-%d} (UTC)",
+        "",
+        f"- Drafts created: {totals['drafts_created']}",
+        f"- Published: {totals['published']}",
+        f"- Repriced: {totals['repriced']}",
+        "",
+        "## Errors by job",
+    ]
+    lines += [f"- {job}: {n}" for job, n in sorted(errors, key=lambda e: (-e[1], e[0]))] or ["- none"]
+    lines += ["", "## Top research keywords"]
+    top = sorted(keywords, key=lambda k: (-k[1], k[0]))[:TOP_KEYWORDS]
+    lines += [f"{i}. {kw} ({n})" for i, (kw, n) in enumerate(top, start=1)] or ["- none"]
+    return "\n".join(lines) + "\n"
+
+
+def get(week: Optional[str] = None, now: Optional[datetime] = None) -> dict:
+    """Return the report for an ISO week (default: last week), rendering it only when needed.
+
+    The cached artifact is re-rendered only when the week's counters changed since
+    it was written. Once a week is over, the counters are compared one last time
+    and the artifact is marked final; final artifacts are served as they are.
+    """
+    now = now or datetime.utcnow()
+    week = week or report_stats.previous_week(now)
+    path = artifact_path(week)
+    _, end = report_stats.week_bounds(week)
+    cached = path.read_text(encoding="utf-8") if path.exists() else None
+    final = now >= end
+    if cached is not None and cached.startswith(_FINAL):
+        return {"week": week, "path": str(path), "cached": True, "content": cached.split("\n", 2)[2]}
+    with engine.connect() as conn:
+        stats = report_stats.read_week(conn, week)
+    digest = hashlib.sha1(repr(stats).encode("utf-8")).hexdigest()
+    header = _HEADER.format(digest)
+    if cached is not None and cached.startswith(header):
+        content, was_cached = cached[len(header):], True
+        if not final:
+            return {"week": week, "path": str(path), "cached": True, "content": content}
+    else:
+        content, was_cached = render(week, stats), False
+    REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text((_FINAL if final else "") + header + content, encoding="utf-8")
+    tmp.replace(path)
+    return {"week": week, "path": str(path), "cached": was_cached, "content": content}
+
+
+def run(week: Optional[str] = None):
+    """Generate the weekly report from the WeeklyStat counters and cache it under REPORTS_DIR."""
+    report = get(week)
+    print(report["content"])
+    log_run("weekly_report", "ok", f"{report['week']} cached={report['cached']} -> {report['path']}")
+    return {"week": report["week"], "path": report["path"], "cached": report["cached"]}
@@ -0,0 +1,156 @@
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+from uuid import uuid4
+
+from sqlalchemy import case, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import SchedulerLease
+
+LEASE_TTL = float(os.getenv("SCHEDULER_LEASE_TTL", "30"))
+LEASE_RENEW_INTERVAL = float(os.getenv("SCHEDULER_LEASE_RENEW", "10"))
+LEASE_NAME = "scheduler"
+
+
+def _holder_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:6]}"
+
+
+class LeaderElector:
+    """Keeps a lease row in the shared database so only one replica leads.
+
+    Every replica calls try_acquire() periodically. The holder extends the lease;
+    anyone else takes it over only once it has expired, so a dead leader is
+    replaced within LEASE_TTL seconds. on_elected/on_demoted fire on transitions.
+    """
+
+    def __init__(
+        self,
+        engine,
+        name: str = LEASE_NAME,
+        ttl: Optional[float] = None,
+        renew_interval: Optional[float] = None,
+        on_elected: Optional[Callable[[], None]] = None,
+        on_demoted: Optional[Callable[[], None]] = None,
+        on_renewed: Optional[Callable[[], None]] = None,
+        holder: Optional[str] = None,
+    ):
+        self.engine = engine
+        self.name = name
+        self.ttl = ttl or LEASE_TTL
+        self.renew_interval = renew_interval or LEASE_RENEW_INTERVAL
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.on_renewed = on_renewed
+        self.holder = holder or _holder_id()
+        self.is_leader = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _claim(self, now: datetime) -> bool:
+        table = SchedulerLease.__table__
+        expires = now + timedelta(seconds=self.ttl)
+        with self.engine.begin() as conn:
+            # Conditional UPDATE is atomic: it matches only our own lease or an expired one
+            res = conn.execute(
+                update(table)
+                .where(table.c.name == self.name)
+                .where(or_(table.c.holder == self.holder, table.c.expires_at < now))
+                .values(
+                    holder=self.holder,
+                    expires_at=expires,
+                    acquired_at=case((table.c.holder == self.holder, table.c.acquired_at), else_=now),
+                )
+            )
+            if res.rowcount:
+                return True
+            exists = conn.execute(select(table.c.name).where(table.c.name == self.name)).first()
+        if exists:
+            return False
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(insert(table).values(name=self.name, holder=self.holder, expires_at=expires, acquired_at=now))
+            return True
+        except IntegrityError:
+            # Another replica created the row first
+            return False
+
+    def try_acquire(self) -> bool:
+        """Acquire or renew the lease; returns whether this replica now leads."""
+        try:
+            leading = self._claim(datetime.utcnow())
+        except Exception as e:
+            # Cannot prove we still hold the lease, so stop scheduling until we can
+            print(f"[leader] lease check failed: {e}")
+            leading = False
+        was_leader, self.is_leader = self.is_leader, leading
+        if leading and not was_leader:
+            self._fire(self.on_elected)
+        elif was_leader and not leading:
+            self._fire(self.on_demoted)
+        elif leading:
+            self._fire(self.on_renewed)
+        return leading
+
+    def release(self):
+        """Give up the lease immediately so another replica can take over without waiting for expiry."""
+        if not self.is_leader:
+            return
+        table = SchedulerLease.__table__
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(
+                    update(table)
+                    .where(table.c.name == self.name, table.c.holder == self.holder)
+                    .values(expires_at=datetime.utcnow() - timedelta(seconds=1))
+                )
+        except Exception as e:
+            print(f"[leader] release failed: {e}")
+        self.is_leader = False
+        self._fire(self.on_demoted)
+
+    def current(self) -> Optional[dict]:
+        table = SchedulerLease.__table__
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(table.c.holder, table.c.expires_at, table.c.acquired_at).where(table.c.name == self.name)
+            ).first()
+        if not row:
+            return None
+        return {
+            "holder": row.holder,
+            "acquired_at": row.acquired_at,
+            "expires_at": row.expires_at,
+            "active": row.expires_at >= datetime.utcnow(),
+        }
+
+    def _fire(self, callback):
+        if callback is None:
+            return
+        try:
+            callback()
+        except Exception as e:
+            print(f"[leader] callback failed: {e}")
+
+    def _loop(self):
+        while not self._stop.wait(self.renew_interval):
+            self.try_acquire()
+
+    def start(self):
+        """Try once synchronously (a lone replica leads right away), then keep renewing in the background."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self.try_acquire()
+        self._thread = threading.Thread(target=self._loop, name="scheduler-lease", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.renew_interval + 5)
+            self._thread = None
+        self.release()
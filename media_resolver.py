@@ -0,0 +1,62 @@
+from pathlib import Path
+from urllib.parse import parse_qs
+
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import FileResponse
+from starlette.staticfiles import StaticFiles
+
+import image_processing
+
+DERIVED_DIRNAME = "_derived"
+_SOURCE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff", ".avif"}
+_MEDIA_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp", "avif": "image/avif"}
+
+
+def derived_dir(media_dir: Path, relative: str) -> Path:
+    """Where the derivatives of media_dir/relative are cached."""
+    return Path(media_dir) / DERIVED_DIRNAME / relative
+
+
+def negotiate_format(accept: str, requested: str = "") -> str:
+    formats = image_processing.available_formats()
+    if requested in formats:
+        return requested
+    for fmt in formats:
+        if fmt == "jpeg" or _MEDIA_TYPES[fmt] in accept:
+            return fmt
+    return "jpeg"
+
+
+class MediaFiles(StaticFiles):
+    """StaticFiles for /media that serves resized variants on request.
+
+    `?w=320` picks the smallest configured derivative width covering 320px and the
+    best format the browser accepts (AVIF, then WebP, then JPEG), or `?fmt=`.
+    Derivatives are rendered once, in the image worker pool, and cached on disk
+    next to the media (regenerated when the source is newer). Plain requests are
+    served unchanged.
+    """
+
+    async def get_response(self, path: str, scope):
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        width = (query.get("w") or [""])[0]
+        if not width.isdigit() or Path(path).suffix.lower() not in _SOURCE_SUFFIXES or path.startswith(DERIVED_DIRNAME):
+            return await super().get_response(path, scope)
+        full_path, stat = await run_in_threadpool(self.lookup_path, path)
+        if stat is None:
+            return await super().get_response(path, scope)
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        fmt = negotiate_format(headers.get("accept", ""), (query.get("fmt") or [""])[0])
+        relative = Path(full_path).relative_to(Path(self.directory).resolve()).as_posix()
+        target = await run_in_threadpool(
+            image_processing.ensure_derivative,
+            Path(full_path),
+            derived_dir(Path(self.directory).resolve(), relative),
+            image_processing.pick_width(int(width)),
+            fmt,
+        )
+        return FileResponse(
+            target,
+            media_type=_MEDIA_TYPES[fmt],
+            headers={"Vary": "Accept", "Cache-Control": "public, max-age=86400"},
+        )
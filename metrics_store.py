@@ -0,0 +1,197 @@
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Column, DateTime, Float, Index, Integer, MetaData, String, Table, bindparam, func, insert, inspect, select, update
+
+from db import engine
+from models import MetricDaily
+
+# Raw samples live in one append-only table per month (metric_sample_YYYYMM), so old
+# history is dropped a whole table at a time and inserts only touch a small index.
+PARTITION_PREFIX = "metric_sample_"
+RAW_RETENTION_MONTHS = int(os.getenv("METRICS_RAW_RETENTION_MONTHS", "6"))
+_IN_CHUNK = 500
+
+_metadata = MetaData()
+_tables: Dict[str, Table] = {}
+_lock = threading.Lock()
+
+
+def _month(ts: datetime) -> str:
+    return ts.strftime("%Y%m")
+
+
+def _table(month: str) -> Table:
+    name = f"{PARTITION_PREFIX}{month}"
+    with _lock:
+        table = _tables.get(name)
+        if table is None:
+            table = Table(
+                name,
+                _metadata,
+                Column("id", Integer, primary_key=True),
+                Column("source", String, nullable=False),
+                Column("metric", String, nullable=False),
+                Column("entity_id", String, nullable=False),
+                Column("value", Float, nullable=False),
+                Column("observed_at", DateTime, nullable=False),
+                Index(f"ix_{name}_metric_observed_at", "metric", "observed_at"),
+            )
+            _tables[name] = table
+    return table
+
+
+def partitions() -> List[str]:
+    """Existing raw partition months (YYYYMM), oldest first."""
+    names = inspect(engine).get_table_names()
+    return sorted(n[len(PARTITION_PREFIX):] for n in names if n.startswith(PARTITION_PREFIX))
+
+
+def append(samples: Iterable[dict], conn=None) -> int:
+    """Append raw samples and fold them into MetricDaily in the same transaction.
+
+    Each sample is {source, metric, entity_id, value, observed_at}. Rollups are
+    updated from the batch alone, so the cost is proportional to the batch, never
+    to the history already stored. Pass conn to write inside the caller's
+    transaction (e.g. together with a watermark).
+    """
+    by_month: Dict[str, List[dict]] = defaultdict(list)
+    rollup: Dict[Tuple[str, str, str, str], dict] = {}
+    count = 0
+    for s in samples:
+        row = {
+            "source": s["source"],
+            "metric": s["metric"],
+            "entity_id": str(s["entity_id"]),
+            "value": float(s["value"]),
+            "observed_at": s["observed_at"],
+        }
+        by_month[_month(row["observed_at"])].append(row)
+        key = (row["observed_at"].strftime("%Y-%m-%d"), row["source"], row["metric"], row["entity_id"])
+        agg = rollup.get(key)
+        if agg is None:
+            rollup[key] = {"total": row["value"], "last": row["value"], "samples": 1, "last_at": row["observed_at"]}
+        else:
+            agg["total"] += row["value"]
+            agg["samples"] += 1
+            if row["observed_at"] >= agg["last_at"]:
+                agg["last"], agg["last_at"] = row["value"], row["observed_at"]
+        count += 1
+    if not count:
+        return 0
+
+    if conn is None:
+        with engine.begin() as conn:
+            _write(conn, by_month, rollup)
+    else:
+        _write(conn, by_month, rollup)
+    return count
+
+
+def _write(conn, by_month: Dict[str, List[dict]], rollup: Dict[Tuple[str, str, str, str], dict]):
+    for month, rows in by_month.items():
+        table = _table(month)
+        table.create(conn, checkfirst=True)
+        conn.execute(insert(table), rows)
+    _merge_rollups(conn, rollup)
+
+
+def known_entities(source: str, metric: str, entity_ids: Iterable[str], since: datetime) -> set:
+    """The entity_ids that already have a raw (source, metric) sample observed at or after since."""
+    ids = sorted({str(e) for e in entity_ids})
+    found: set = set()
+    if not ids:
+        return found
+    with engine.connect() as conn:
+        for month in partitions():
+            if month < _month(since):
+                continue
+            t = _table(month)
+            for i in range(0, len(ids), _IN_CHUNK):
+                found.update(conn.execute(
+                    select(t.c.entity_id).where(
+                        t.c.source == source, t.c.metric == metric, t.c.observed_at >= since,
+                        t.c.entity_id.in_(ids[i:i + _IN_CHUNK]),
+                    )
+                ).scalars())
+    return found
+
+
+def _merge_rollups(conn, rollup: Dict[Tuple[str, str, str, str], dict]):
+    existing: Dict[Tuple[str, str, str, str], tuple] = {}
+    days = sorted({k[0] for k in rollup})
+    entities = sorted({k[3] for k in rollup})
+    cols = (MetricDaily.id, MetricDaily.day, MetricDaily.source, MetricDaily.metric, MetricDaily.entity_id,
+            MetricDaily.total, MetricDaily.samples, MetricDaily.last_at)
+    for i in range(0, len(entities), _IN_CHUNK):
+        stmt = select(*cols).where(MetricDaily.day.in_(days), MetricDaily.entity_id.in_(entities[i:i + _IN_CHUNK]))
+        for r in conn.execute(stmt):
+            existing[(r.day, r.source, r.metric, r.entity_id)] = r
+    inserts, newer, older = [], [], []
+    for key, agg in rollup.items():
+        cur = existing.get(key)
+        if cur is None:
+            day, source, metric, entity_id = key
+            inserts.append({"day": day, "source": source, "metric": metric, "entity_id": entity_id, **agg})
+            continue
+        params = {"_id": cur.id, "_total": cur.total + agg["total"], "_samples": cur.samples + agg["samples"]}
+        if cur.last_at is None or agg["last_at"] >= cur.last_at:
+            newer.append(dict(params, _last=agg["last"], _last_at=agg["last_at"]))
+        else:
+            older.append(params)
+    if inserts:
+        conn.execute(insert(MetricDaily), inserts)
+    # executemany UPDATEs, one statement shape per group
+    base = update(MetricDaily).where(MetricDaily.id == bindparam("_id"))
+    if newer:
+        conn.execute(
+            base.values(total=bindparam("_total"), samples=bindparam("_samples"), last=bindparam("_last"), last_at=bindparam("_last_at")),
+            newer,
+        )
+    if older:
+        conn.execute(base.values(total=bindparam("_total"), samples=bindparam("_samples")), older)
+
+
+def trend(metric: str, source: Optional[str] = None, start: Optional[str] = None, end: Optional[str] = None,
+          entity_id: Optional[str] = None) -> List[dict]:
+    """Per-day totals for a metric, read from MetricDaily only.
+
+    `total` sums sample values (orders, revenue); `last` sums each entity's latest
+    reading that day (cumulative counters such as views and favorites).
+    """
+    stmt = select(MetricDaily.day, func.sum(MetricDaily.total), func.sum(MetricDaily.last), func.count()).where(MetricDaily.metric == metric)
+    if source:
+        stmt = stmt.where(MetricDaily.source == source)
+    if start:
+        stmt = stmt.where(MetricDaily.day >= start)
+    if end:
+        stmt = stmt.where(MetricDaily.day <= end)
+    if entity_id:
+        stmt = stmt.where(MetricDaily.entity_id == str(entity_id))
+    stmt = stmt.group_by(MetricDaily.day).order_by(MetricDaily.day)
+    with engine.connect() as conn:
+        return [
+            {"day": day, "total": total, "last": last, "entities": n}
+            for day, total, last, n in conn.execute(stmt)
+        ]
+
+
+def drop_partitions_before(month: str) -> List[str]:
+    """Drop raw partitions older than month (YYYYMM); rollups are kept."""
+    dropped = []
+    with engine.begin() as conn:
+        for m in partitions():
+            if m < month:
+                _table(m).drop(conn, checkfirst=True)
+                dropped.append(m)
+    return dropped
+
+
+def retention_cutoff(now: Optional[datetime] = None, months: Optional[int] = None) -> str:
+    now = now or datetime.utcnow()
+    months = RAW_RETENTION_MONTHS if months is None else months
+    index = now.year * 12 + (now.month - 1) - max(0, months)
+    return f"{index // 12:04d}{index % 12 + 1:02d}"
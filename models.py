@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Optional
 from sqlmodel import SQLModel, Field
-from sqlalchemy import MetaData
+from sqlalchemy import Index, MetaData, UniqueConstraint
 
 # Use a separate metadata instance for old models to avoid conflicts
 _old_metadata = MetaData()
@@ -21,10 +21,15 @@ class Product(SQLModel, table=True):
     etsy_listing_id: Optional[str] = None
     quantity: Optional[int] = None
     printful_file_id: Optional[int] = None
+    taxonomy_id: Optional[int] = None  # Etsy taxonomy id
+    tags: Optional[str] = None  # Comma-separated tags
 
 
 class RunLog(SQLModel, table=True):
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        Index("ix_runlog_created_at_job", "created_at", "job"),
+        {'extend_existing': True},
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
     job: str = Field(default="manual")
     status: str = Field(default="ok")
@@ -52,7 +57,7 @@ class ResearchSnapshot(SQLModel, table=True):
 
 class ProductVariant(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    product_sku: str = Field(foreign_key="product.sku")
+    product_sku: str = Field(foreign_key="product.sku", index=True)
     size: Optional[str] = None
     color: Optional[str] = None
     printful_variant_id: Optional[int] = None
@@ -73,3 +78,117 @@ class PricingRule(SQLModel, table=True):
     min_price: float = Field(default=9.99)
     max_price: float = Field(default=99.99)
     rounding: str = Field(default=".99")  # .99 or .95
+    # Scope: global, tag, taxonomy or price_band. Higher priority wins; ties go to the
+    # more specific scope (tag > taxonomy > price_band > global), then the older rule.
+    scope: str = Field(default="global")
+    scope_value: Optional[str] = None  # tag name or taxonomy id
+    band_min: Optional[float] = None  # price_band: current price >= band_min
+    band_max: Optional[float] = None  # price_band: current price < band_max
+    priority: int = Field(default=0)
+
+
+class RunLogDaily(SQLModel, table=True):
+    """Per-day, per-job RunLog counts kept after raw rows pass the retention window."""
+    __table_args__ = (UniqueConstraint("day", "job", "status", name="uq_runlogdaily_day_job_status"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    day: str = Field(index=True)  # YYYY-MM-DD (UTC)
+    job: str
+    status: str
+    count: int = Field(default=0)
+    first_at: Optional[datetime] = None
+    last_at: Optional[datetime] = None
+
+
+class ListingPriceState(SQLModel, table=True):
+    """Last price known to be live on an Etsy listing, used to skip redundant pushes."""
+    etsy_listing_id: str = Field(primary_key=True)
+    sku: Optional[str] = None
+    price: Optional[float] = None
+    status: str = Field(default="ok")  # ok or error (last attempt)
+    error: Optional[str] = None
+    pushed_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class SchedulerLease(SQLModel, table=True):
+    """Time-limited lease; the replica holding it is the only one running scheduled jobs."""
+    name: str = Field(primary_key=True)
+    holder: str
+    expires_at: datetime
+    acquired_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class JobRun(SQLModel, table=True):
+    """One execution of a jobs.* module with its timing, item count and captured output."""
+    __table_args__ = (Index("ix_jobrun_job_started_at", "job", "started_at"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    job: str
+    trigger: str = Field(default="manual")  # manual or schedule
+    status: str = Field(default="queued")  # queued, running, ok, error, no_run, unknown, skipped
+    queued_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    duration_ms: Optional[float] = None
+    items: Optional[int] = None
+    message: Optional[str] = None
+    log: Optional[str] = None
+
+
+class InventoryState(SQLModel, table=True):
+    """Remote stock state last reconciled for a SKU; remote_hash lets unchanged SKUs be skipped."""
+    sku: str = Field(primary_key=True)
+    printful_status: Optional[str] = None
+    etsy_quantity: Optional[int] = None
+    quantity: Optional[int] = None
+    remote_hash: str
+    synced_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class SyncWatermark(SQLModel, table=True):
+    """Start time of the last completed run of a sync job."""
+    name: str = Field(primary_key=True)
+    value: datetime
+
+
+class MetricDaily(SQLModel, table=True):
+    """Daily per-entity rollup of raw metric samples, maintained as samples are appended."""
+    __table_args__ = (
+        UniqueConstraint("day", "source", "metric", "entity_id", name="uq_metricdaily_key"),
+        Index("ix_metricdaily_metric_day", "metric", "day"),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    day: str  # YYYY-MM-DD (UTC)
+    source: str  # etsy or printful
+    metric: str  # views, favorites, orders, revenue
+    entity_id: str
+    total: float = Field(default=0.0)  # sum of sample values (flow metrics)
+    last: Optional[float] = None  # latest sample value (counters such as views)
+    samples: int = Field(default=0)
+    last_at: Optional[datetime] = None
+
+
+class WeeklyStat(SQLModel, table=True):
+    """Per-ISO-week counters folded in as RunLog entries are flushed (see report_stats)."""
+    __table_args__ = (UniqueConstraint("week", "metric", "key", name="uq_weeklystat_week_metric_key"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    week: str = Field(index=True)  # e.g. 2024-W05
+    metric: str  # drafts_created, published, repriced, errors, research_keyword
+    key: str = Field(default="")  # job name for errors, keyword for research_keyword
+    count: int = Field(default=0)
+
+
+class Blob(SQLModel, table=True):
+    """A content-addressed file in the blob store (see blob_store); key is "<sha256><ext>"."""
+    key: str = Field(primary_key=True)
+    size: int = Field(default=0)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    touched_at: datetime = Field(default_factory=datetime.utcnow, index=True)  # last put or reference
+
+
+class BlobRef(SQLModel, table=True):
+    """One owner's reference to a blob; blobs left without live references are garbage collected."""
+    __table_args__ = (UniqueConstraint("blob_key", "owner", name="uq_blobref_blob_key_owner"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    blob_key: str = Field(index=True)
+    owner: str = Field(index=True)  # e.g. product:SKU, research:LISTING_ID, generated:BATCH
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: Optional[datetime] = None  # None: held until released
@@ -0,0 +1,126 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlmodel import select
+
+from db import get_session
+from models import ListingPriceState, Product
+
+PUSH_WORKERS = int(os.getenv("PRICE_PUSH_WORKERS", "4"))
+PUSH_ROUNDS = int(os.getenv("PRICE_PUSH_ROUNDS", "2"))
+# Etsy's inventory PUT sets price and quantity together; products with no quantity get this
+IN_STOCK_QUANTITY = int(os.getenv("INVENTORY_IN_STOCK_QTY", "999"))
+_IN_CHUNK = 500
+
+
+def _load_states(session, listing_ids: List[str]) -> Dict[str, ListingPriceState]:
+    states: Dict[str, ListingPriceState] = {}
+    for i in range(0, len(listing_ids), _IN_CHUNK):
+        chunk = listing_ids[i:i + _IN_CHUNK]
+        for st in session.exec(select(ListingPriceState).where(ListingPriceState.etsy_listing_id.in_(chunk))).all():
+            states[st.etsy_listing_id] = st
+    return states
+
+
+def _load_quantities(session, skus: List[str]) -> Dict[str, Optional[int]]:
+    quantities: Dict[str, Optional[int]] = {}
+    for i in range(0, len(skus), _IN_CHUNK):
+        chunk = skus[i:i + _IN_CHUNK]
+        quantities.update(session.connection().execute(select(Product.sku, Product.quantity).where(Product.sku.in_(chunk))).all())
+    return quantities
+
+
+def stale_listings(session) -> List[Tuple[str, str, float]]:
+    """(sku, etsy_listing_id, price) for listed products whose last push failed or whose live price is stale.
+
+    The DB price is written before the push, so this is how a failed push gets retried.
+    """
+    stmt = (
+        select(Product.sku, Product.etsy_listing_id, Product.price)
+        .join(ListingPriceState, ListingPriceState.etsy_listing_id == Product.etsy_listing_id)
+        .where(Product.price.is_not(None))
+        .where((ListingPriceState.status == "error") | (ListingPriceState.price.is_(None)) | (func.abs(ListingPriceState.price - Product.price) >= 0.005))
+    )
+    return [tuple(row) for row in session.connection().execute(stmt).all()]
+
+
+def _push_one(item: Tuple[str, str, float, int]) -> Optional[str]:
+    from etsy_client import update_listing_price
+    _, listing_id, price, quantity = item
+    try:
+        update_listing_price(listing_id, float(price), quantity=quantity)
+        return None
+    except Exception as e:
+        return str(e) or type(e).__name__
+
+
+def push_prices(changes: Iterable[Tuple[str, Optional[str], float]], workers: Optional[int] = None) -> dict:
+    """Push (sku, etsy_listing_id, price) changes to Etsy concurrently.
+
+    Listings whose cached remote price already matches are skipped. Each push carries
+    the product's reconciled quantity (see sync_inventory), since the inventory PUT
+    would otherwise reset stock. Requests share
+    http_client's rate limiter and retries; failed listings are retried for up to
+    PRICE_PUSH_ROUNDS rounds (a price PUT is idempotent). Outcomes are written to
+    ListingPriceState in one transaction. Returns counts plus the failures.
+    """
+    import etsy_client
+
+    pending: Dict[str, Tuple[str, str, float]] = {}
+    for sku, listing_id, price in changes:
+        if listing_id and price is not None:
+            pending[str(listing_id)] = (sku, str(listing_id), round(float(price), 2))
+    if not pending:
+        return {"pushed": 0, "skipped": 0, "errors": 0, "failed": []}
+
+    with get_session() as s:
+        states = _load_states(s, list(pending))
+        skipped = 0
+        for listing_id, (_, _, price) in list(pending.items()):
+            st = states.get(listing_id)
+            if st and st.status == "ok" and st.price is not None and abs(st.price - price) < 0.005:
+                del pending[listing_id]
+                skipped += 1
+
+        quantities = _load_quantities(s, sorted({sku for sku, _, _ in pending.values()}))
+        errors: Dict[str, str] = {}
+        todo = [
+            (sku, listing_id, price, IN_STOCK_QUANTITY if quantities.get(sku) is None else int(quantities[sku]))
+            for sku, listing_id, price in pending.values()
+        ]
+        with ThreadPoolExecutor(max_workers=max(1, workers or PUSH_WORKERS)) as pool:
+            for _ in range(max(1, PUSH_ROUNDS)):
+                if not todo:
+                    break
+                results = list(pool.map(_push_one, todo))
+                retry = []
+                for item, err in zip(todo, results):
+                    if err is None:
+                        errors.pop(item[1], None)
+                    else:
+                        errors[item[1]] = err
+                        retry.append(item)
+                todo = retry
+
+        # Dry runs never reach Etsy, so they must not mark anything as live
+        if not etsy_client.DRY_RUN:
+            now = datetime.utcnow()
+            for listing_id, (sku, _, price) in pending.items():
+                st = states.get(listing_id) or ListingPriceState(etsy_listing_id=listing_id)
+                st.sku = sku
+                st.pushed_at = now
+                if listing_id in errors:
+                    st.status = "error"
+                    st.error = errors[listing_id][:500]
+                else:
+                    st.price = price
+                    st.status = "ok"
+                    st.error = None
+                s.add(st)
+            s.commit()
+
+    failed: List[Tuple[str, str]] = [(pending[lid][0], err) for lid, err in errors.items()]
+    return {"pushed": len(pending) - len(errors), "skipped": skipped, "errors": len(errors), "failed": failed}
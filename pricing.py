@@ -0,0 +1,225 @@
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import update
+from sqlmodel import select
+
+from models import PricingRule, Product
+
+ROUNDING_ENDINGS = {".99": 0.99, ".95": 0.95}
+SCOPE_SPECIFICITY = {"global": 0, "price_band": 1, "taxonomy": 2, "tag": 3}
+# Keep IN (...) lists under SQLite's bound-parameter limit
+_IN_CHUNK = 500
+
+
+@dataclass
+class Catalogue:
+    sku: np.ndarray
+    name: np.ndarray
+    price: np.ndarray  # float64, NaN when unset
+    cost: np.ndarray  # float64, NaN when unset
+    etsy_listing_id: np.ndarray
+    taxonomy_id: np.ndarray
+    tags: np.ndarray  # comma-separated strings or None
+
+    def __len__(self) -> int:
+        return len(self.sku)
+
+
+@dataclass
+class DeltaTable:
+    """Products whose proposed price differs from the current one, as parallel arrays."""
+    sku: np.ndarray
+    name: np.ndarray
+    current: np.ndarray
+    proposed: np.ndarray
+    etsy_listing_id: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.sku)
+
+    def rows(self, limit: Optional[int] = None) -> List[dict]:
+        n = len(self) if limit is None else min(limit, len(self))
+        return [
+            {
+                "sku": self.sku[i],
+                "name": self.name[i],
+                "current": float(self.current[i]),
+                "proposed": float(self.proposed[i]),
+                "etsy_listing_id": self.etsy_listing_id[i],
+            }
+            for i in range(n)
+        ]
+
+
+def active_rule(session) -> PricingRule:
+    rule = session.exec(select(PricingRule).where(PricingRule.active == True)).first()  # noqa: E712
+    return rule or PricingRule()
+
+
+def _parse_tags(value) -> List[str]:
+    if not value:
+        return []
+    return [t.strip().lower() for t in str(value).split(",") if t.strip()]
+
+
+class RuleIndex:
+    """Active pricing rules compiled into per-scope buckets.
+
+    Rules are ranked once (priority, scope specificity, then older id first) so each
+    product only needs the best rank among the buckets its scope keys fall into:
+    one dict lookup per tag, one per taxonomy id, a binary search over price-band
+    edges, and the best global rule. Products matching nothing use PricingRule()
+    defaults.
+    """
+
+    def __init__(self, rules: Iterable[PricingRule]):
+        ranked = sorted(
+            (r for r in rules if r.scope in SCOPE_SPECIFICITY),
+            key=lambda r: (r.priority or 0, SCOPE_SPECIFICITY[r.scope], -(r.id or 0)),
+        )
+        # Rank 0 is the implicit default; real rules start at 1
+        self.rules: List[PricingRule] = [PricingRule()] + ranked
+        self.margin = np.array([r.margin_pct for r in self.rules], dtype=np.float64)
+        self.min_price = np.array([r.min_price for r in self.rules], dtype=np.float64)
+        self.max_price = np.array([r.max_price for r in self.rules], dtype=np.float64)
+        self.ending = np.array([ROUNDING_ENDINGS.get(r.rounding, 0.99) for r in self.rules], dtype=np.float64)
+
+        self.global_rank = 0
+        self.by_tag: dict = {}
+        self.by_taxonomy: dict = {}
+        bands = []
+        for rank, r in enumerate(self.rules[1:], start=1):
+            if r.scope == "global":
+                self.global_rank = rank
+            elif r.scope == "tag" and r.scope_value:
+                self.by_tag[r.scope_value.strip().lower()] = rank
+            elif r.scope == "taxonomy" and r.scope_value:
+                try:
+                    self.by_taxonomy[int(r.scope_value)] = rank
+                except ValueError:
+                    continue
+            elif r.scope == "price_band":
+                lo = -np.inf if r.band_min is None else float(r.band_min)
+                hi = np.inf if r.band_max is None else float(r.band_max)
+                if lo < hi:
+                    bands.append((lo, hi, rank))
+        # Split the price axis at every band edge; each elementary interval keeps the
+        # best rank among the bands covering it, so lookup is a single searchsorted.
+        edges = sorted({e for lo, hi, _ in bands for e in (lo, hi)})
+        self.band_edges = np.array(edges, dtype=np.float64)
+        best = np.zeros(max(0, len(edges) - 1), dtype=np.int64)
+        for lo, hi, rank in bands:
+            i, j = edges.index(lo), edges.index(hi)
+            best[i:j] = np.maximum(best[i:j], rank)
+        self.band_best = best
+
+    @classmethod
+    def load(cls, session) -> "RuleIndex":
+        return cls(session.exec(select(PricingRule).where(PricingRule.active == True)).all())  # noqa: E712
+
+    def match(self, cat: "Catalogue") -> np.ndarray:
+        """Return the winning rule rank for every product in the catalogue."""
+        n = len(cat)
+        best = np.full(n, self.global_rank, dtype=np.int64)
+        if len(self.band_best):
+            price = cat.price
+            slot = np.searchsorted(self.band_edges, np.nan_to_num(price, nan=-np.inf), side="right") - 1
+            inside = ~np.isnan(price) & (slot >= 0) & (slot < len(self.band_best))
+            band_rank = np.zeros(n, dtype=np.int64)
+            band_rank[inside] = self.band_best[slot[inside]]
+            best = np.maximum(best, band_rank)
+        if self.by_taxonomy:
+            tax_rank = np.fromiter((self.by_taxonomy.get(t, 0) for t in cat.taxonomy_id), dtype=np.int64, count=n)
+            best = np.maximum(best, tax_rank)
+        if self.by_tag:
+            by_tag = self.by_tag
+            tag_rank = np.fromiter(
+                (max((by_tag.get(t, 0) for t in _parse_tags(v)), default=0) for v in cat.tags),
+                dtype=np.int64, count=n,
+            )
+            best = np.maximum(best, tag_rank)
+        return best
+
+    def propose(self, cat: "Catalogue") -> np.ndarray:
+        rank = self.match(cat)
+        return propose(cat.cost, cat.price, self.margin[rank], self.min_price[rank], self.max_price[rank], self.ending[rank])
+
+
+def _to_float(values) -> np.ndarray:
+    return np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+
+
+def load_catalogue(session, skus: Optional[Iterable[str]] = None) -> Catalogue:
+    """Load the columns pricing needs with a projection query."""
+    stmt = select(
+        Product.sku, Product.name, Product.price, Product.cost, Product.etsy_listing_id, Product.taxonomy_id, Product.tags,
+    ).order_by(Product.sku)
+    if skus is None:
+        rows = session.exec(stmt).all()
+    else:
+        wanted = list(dict.fromkeys(skus))
+        rows = []
+        for i in range(0, len(wanted), _IN_CHUNK):
+            rows.extend(session.exec(stmt.where(Product.sku.in_(wanted[i:i + _IN_CHUNK]))).all())
+    cols = list(zip(*rows)) if rows else [()] * 7
+    return Catalogue(
+        sku=np.array(cols[0], dtype=object),
+        name=np.array(cols[1], dtype=object),
+        price=_to_float(cols[2]),
+        cost=_to_float(cols[3]),
+        etsy_listing_id=np.array(cols[4], dtype=object),
+        taxonomy_id=np.array(cols[5], dtype=object),
+        tags=np.array(cols[6], dtype=object),
+    )
+
+
+def propose(cost, price, margin_pct, min_price, max_price, ending) -> np.ndarray:
+    """Proposed prices for whole arrays at once; NaN where there is no cost or price.
+
+    Cost-based when cost > 0 (cost x (1 + margin)), otherwise the current price, then
+    clamped to [min_price, max_price] and snapped to the whole-dollar ending (.99/.95).
+    Rule parameters may be scalars or per-product arrays.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    price = np.asarray(price, dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        base = np.where(cost > 0, cost * (1.0 + np.asarray(margin_pct, dtype=np.float64)), price)
+    base = np.clip(base, min_price, max_price)
+    return np.round(np.floor(base) + ending, 2)
+
+
+def compute_deltas(session, rule: Optional[PricingRule] = None, skus: Optional[Iterable[str]] = None) -> DeltaTable:
+    """Deltas under a single rule, or under all active rules via the RuleIndex when rule is None."""
+    cat = load_catalogue(session, skus)
+    if rule is not None:
+        proposed = propose(
+            cat.cost, cat.price, rule.margin_pct, rule.min_price, rule.max_price,
+            ROUNDING_ENDINGS.get(rule.rounding, 0.99),
+        )
+    else:
+        proposed = RuleIndex.load(session).propose(cat)
+    return _deltas(cat, proposed)
+
+
+def _deltas(cat: Catalogue, proposed: np.ndarray) -> DeltaTable:
+    # Compare in whole cents so float noise does not create or hide a change
+    with np.errstate(invalid="ignore"):
+        changed = ~np.isnan(proposed) & ~np.isnan(cat.price) & (np.rint(proposed * 100) != np.rint(cat.price * 100))
+    return DeltaTable(
+        sku=cat.sku[changed],
+        name=cat.name[changed],
+        current=cat.price[changed],
+        proposed=proposed[changed],
+        etsy_listing_id=cat.etsy_listing_id[changed],
+    )
+
+
+def apply_deltas(session, deltas: DeltaTable) -> int:
+    """Write proposed prices with one bulk UPDATE by primary key; the caller commits."""
+    if not len(deltas):
+        return 0
+    params = [{"sku": s, "price": float(p)} for s, p in zip(deltas.sku, deltas.proposed)]
+    session.execute(update(Product), params)
+    return len(params)
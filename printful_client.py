@@ -30,7 +30,15 @@ def create_product(product: dict):
             "thumbnail": product.get("thumbnail"),
             "external_id": product.get("sku"),
         },
-        "sync_variants": [\n            {\n                "retail_price": str(product.get("price") or "19.99"),\n                "sku": product.get("sku"),\n                "variant_id": product.get("variant_id", 4011),\n                "files": ([{"type": "preview", "url": product.get("thumbnail")} ] if product.get("thumbnail") else [])\n            }\n        ],\n    }
+        "sync_variants": [
+            {
+                "retail_price": str(product.get("price") or "19.99"),
+                "sku": product.get("sku"),
+                "variant_id": product.get("variant_id", 4011),
+                "files": ([{"type": "preview", "url": product.get("thumbnail")} ] if product.get("thumbnail") else [])
+            }
+        ],
+    }
     r = http_request("POST", f"{BASE_URL}/store/products", headers=_headers(), json=payload, timeout=30)
     if r.status_code >= 400:
         raise RuntimeError(f"Printful error {r.status_code}: {r.text}")
@@ -50,6 +58,105 @@ def get_store_metrics():
     return {"name": data.get("name"), "currency": data.get("currency")} 
 
 
+def _get(path: str, params: dict | None = None) -> dict:
+    r = http_request("GET", f"{BASE_URL}{path}", headers=_headers(), params=params, timeout=30)
+    if r.status_code >= 400:
+        raise RuntimeError(f"Printful error {r.status_code}: {r.text}")
+    return r.json()
+
+
+def list_sync_products(page_size: int = 100, workers: int = 4) -> list[dict]:
+    """All store sync products, pages fetched concurrently. Empty in DRY_RUN."""
+    if DRY_RUN:
+        return []
+    from http_client import fetch_pages
+
+    def page(offset, limit):
+        data = _get("/store/products", {"offset": offset, "limit": limit})
+        return data.get("result") or [], (data.get("paging") or {}).get("total")
+
+    return fetch_pages(page, page_size=page_size, workers=workers)
+
+
+# Variant statuses that mean it cannot be ordered right now
+UNAVAILABLE = {"out_of_stock", "temporary_out_of_stock", "discontinued", "stopped"}
+
+
+def _product_availability(variants: list[dict]) -> str:
+    """One status for a product: available while any variant is, else the first variant's status."""
+    statuses = [v.get("availability_status") or "active" for v in variants]
+    available = [st for st in statuses if st not in UNAVAILABLE]
+    return (available or statuses or ["active"])[0]
+
+
+def list_product_availability(page_size: int = 100, workers: int = 4) -> dict[str, str]:
+    """Map product SKU -> availability_status for every sync product in the store. Empty in DRY_RUN.
+
+    Multi-variant products carry "{sku}-{SIZE}-{COLOR}" variant SKUs, so statuses
+    are aggregated per product and keyed by its sync_product external_id (the SKU
+    it was created with). Products without one fall back to their variant SKUs.
+    """
+    if DRY_RUN:
+        return {}
+    from concurrent.futures import ThreadPoolExecutor
+    products = list_sync_products(page_size=page_size, workers=workers)
+
+    def detail(product):
+        result = _get(f"/store/products/{product['id']}").get("result") or {}
+        external_id = (result.get("sync_product") or {}).get("external_id") or product.get("external_id")
+        return external_id, result.get("sync_variants") or []
+
+    out: dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for external_id, vs in pool.map(detail, [p for p in products if p.get("id")]):
+            if external_id:
+                out[str(external_id)] = _product_availability(vs)
+                continue
+            for v in vs:
+                if v.get("sku"):
+                    out.setdefault(v["sku"], v.get("availability_status") or "active")
+    return out
+
+
+def list_orders(since=None, page_size: int = 100, workers: int = 4) -> list[dict]:
+    """Store orders as {order_id, status, total, created} dicts, newest first. Empty in DRY_RUN.
+
+    With `since` (a UTC datetime) pages are read until the first older order.
+    Orders created exactly at `since` are included, since timestamps are whole
+    seconds; callers dedupe them by order_id. Otherwise all pages are fetched
+    concurrently.
+    """
+    if DRY_RUN:
+        return []
+    from datetime import datetime
+    from http_client import fetch_pages
+
+    def page(offset, limit):
+        data = _get("/orders", {"offset": offset, "limit": limit})
+        rows = []
+        for o in data.get("result") or []:
+            costs = o.get("retail_costs") or o.get("costs") or {}
+            rows.append({
+                "order_id": str(o.get("id")),
+                "status": o.get("status"),
+                "total": float(costs.get("total") or 0),
+                "created": datetime.utcfromtimestamp(o.get("created") or 0),
+            })
+        return rows, (data.get("paging") or {}).get("total")
+
+    if since is None:
+        return fetch_pages(page, page_size=page_size, workers=workers)
+    out: list[dict] = []
+    offset = 0
+    while True:
+        rows, total = page(offset, page_size)
+        fresh = [r for r in rows if r["created"] >= since]
+        out.extend(fresh)
+        offset += page_size
+        if len(fresh) < len(rows) or not rows or (total is not None and offset >= total):
+            return out
+
+
 def create_product_with_variants(product: dict, variants: list[dict]):
     """
     Create a product with multiple variants in Printful. Each variant dict should include
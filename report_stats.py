@@ -0,0 +1,69 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, insert, select, update
+
+from models import WeeklyStat
+
+StatKey = Tuple[str, str, str]  # (week, metric, key)
+
+
+def week_of(ts: datetime) -> str:
+    year, week, _ = ts.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def week_bounds(week: str) -> Tuple[datetime, datetime]:
+    """Monday 00:00 of the ISO week and of the following week."""
+    start = datetime.strptime(week + "-1", "%G-W%V-%u")
+    return start, start + timedelta(days=7)
+
+
+def previous_week(now: Optional[datetime] = None) -> str:
+    return week_of((now or datetime.utcnow()) - timedelta(days=7))
+
+
+def fold(entries: Iterable[dict]) -> Counter:
+    """Aggregate buffered RunLog entries into weekly counters.
+
+    Errors are counted per job automatically; other counters come from the entry's
+    `counts` ({"published": 3, "research_keyword:mugs": 1}).
+    """
+    agg: Counter = Counter()
+    for e in entries:
+        week = week_of(e["created_at"])
+        if e.get("status") == "error":
+            agg[(week, "errors", e["job"])] += 1
+        for name, n in (e.get("counts") or {}).items():
+            if n:
+                metric, _, key = name.partition(":")
+                agg[(week, metric, key.strip().lower())] += int(n)
+    return agg
+
+
+def merge(conn, agg: Dict[StatKey, int]):
+    """Add counters into WeeklyStat; runs inside the caller's transaction."""
+    if not agg:
+        return
+    weeks = sorted({k[0] for k in agg})
+    existing = {
+        (r.week, r.metric, r.key): (r.id, r.count)
+        for r in conn.execute(select(WeeklyStat.id, WeeklyStat.week, WeeklyStat.metric, WeeklyStat.key, WeeklyStat.count).where(WeeklyStat.week.in_(weeks)))
+    }
+    inserts, updates = [], []
+    for (week, metric, key), n in agg.items():
+        if (week, metric, key) in existing:
+            row_id, count = existing[(week, metric, key)]
+            updates.append({"_id": row_id, "_count": count + n})
+        else:
+            inserts.append({"week": week, "metric": metric, "key": key, "count": n})
+    if inserts:
+        conn.execute(insert(WeeklyStat), inserts)
+    if updates:
+        conn.execute(update(WeeklyStat).where(WeeklyStat.id == bindparam("_id")).values(count=bindparam("_count")), updates)
+
+
+def read_week(conn, week: str) -> List[Tuple[str, str, int]]:
+    stmt = select(WeeklyStat.metric, WeeklyStat.key, WeeklyStat.count).where(WeeklyStat.week == week).order_by(WeeklyStat.metric, WeeklyStat.key)
+    return [tuple(r) for r in conn.execute(stmt)]
@@ -1,8 +1,10 @@
+import io
 import os
 import json
-from collections import Counter
+import threading
+from collections import Counter, OrderedDict
 from statistics import median
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 from etsy_client import search_listings
 
@@ -249,16 +251,58 @@ def llm_synthesis(keywords: str, metrics: Dict[str, Any], sample_listings: List[
         return {"raw": content}
 
 
+_PLACEHOLDER_CACHE_SIZE = int(os.getenv("RESEARCH_PLACEHOLDER_CACHE_SIZE", "256"))
+_placeholders: "OrderedDict[str, bytes]" = OrderedDict()
+_placeholder_lock = threading.Lock()
+
+
+def placeholder_image(title: str) -> Optional[bytes]:
+    """JPEG bytes of an 800x800 placeholder showing title; None if Pillow is missing.
+
+    Rendered and encoded once per distinct title; the bytes are kept in a small LRU.
+    """
+    text = (title or "Product")[:40]
+    with _placeholder_lock:
+        if text in _placeholders:
+            _placeholders.move_to_end(text)
+            return _placeholders[text]
+    try:
+        from PIL import Image, ImageDraw, ImageFont
+    except ImportError:
+        print("[Research] PIL/Pillow not installed. Install with: pip install Pillow")
+        return None
+    try:
+        img = Image.new('RGB', (800, 800), color=(70, 130, 180))
+        draw = ImageDraw.Draw(img)
+        font = ImageFont.load_default()
+        bbox = draw.textbbox((0, 0), text, font=font)
+        position = ((800 - (bbox[2] - bbox[0])) // 2, (800 - (bbox[3] - bbox[1])) // 2)
+        draw.text(position, text, fill=(255, 255, 255), font=font)
+        buf = io.BytesIO()
+        img.save(buf, 'JPEG', quality=85)
+    except Exception as e:
+        print(f"[Research] Error creating placeholder: {e}")
+        return None
+    data = buf.getvalue()
+    with _placeholder_lock:
+        _placeholders[text] = data
+        while len(_placeholders) > _PLACEHOLDER_CACHE_SIZE:
+            _placeholders.popitem(last=False)
+    return data
+
+
 def run_research(keywords: str, limit: int = 50) -> Dict[str, Any]:
     """Run complete research including downloading and storing competitor images."""
-    import requests
-    import base64
     from pathlib import Path
     import os
     
-    # Create images directory if it doesn't exist
-    images_dir = Path("research_images")
-    images_dir.mkdir(exist_ok=True)
+    from datetime import timedelta
+    import blob_store
+    import image_download
+
+    # Downloaded images and placeholders both go to the blob store
+    store = blob_store.get_store()
+    image_ttl = timedelta(days=float(os.getenv("RESEARCH_IMAGE_TTL_DAYS", "14")))
     
     listings = search_listings(keywords, limit=limit)
     metrics = basic_market_metrics(listings)
@@ -315,144 +359,50 @@ def run_research(keywords: str, limit: int = 50) -> Dict[str, Any]:
         
         # Download and store primary image for image-to-image generation
         local_image_path = None
-        image_data_base64 = None
+        image_blob_key = None
         relative_path = None
         
-        # Create unique filename
         listing_id = l.get("listing_id") or f"listing_{len(preview)}"
-        safe_title = "".join(c for c in (l.get("title") or "product")[:50] if c.isalnum() or c in (' ', '-', '_')).strip().replace(' ', '_')
         
-        # Function to create placeholder image
-        def create_placeholder_image(output_path: Path, title: str, listing_id_val) -> tuple:
-            """Create a placeholder image locally."""
+        if image_url and (image_url.startswith("http://") or image_url.startswith("https://")):
             try:
-                from PIL import Image, ImageDraw, ImageFont
-                import io
-                
-                # Create 800x800 image with gradient background
-                img = Image.new('RGB', (800, 800), color=(70, 130, 180))
-                draw = ImageDraw.Draw(img)
-                
-                # Draw title
-                title_text = title[:40] if title else f"Product {listing_id_val}"
-                try:
-                    # Try default font first
-                    font = ImageFont.load_default()
-                except:
-                    font = None
-                
-                # Get text size
-                if font:
-                    bbox = draw.textbbox((0, 0), title_text, font=font)
-                    text_width = bbox[2] - bbox[0]
-                    text_height = bbox[3] - bbox[1]
-                else:
-                    text_width = len(title_text) * 10
-                    text_height = 20
-                
-                # Center text
-                position = ((800 - text_width) // 2, (800 - text_height) // 2)
-                draw.text(position, title_text, fill=(255, 255, 255), font=font)
-                
-                # Save image
-                img.save(output_path, 'JPEG', quality=85)
-                
-                # Convert to base64
-                img_bytes = io.BytesIO()
-                img.save(img_bytes, format='JPEG')
-                img_bytes.seek(0)
-                base64_data = base64.b64encode(img_bytes.read()).decode('utf-8')
+                print(f"[Research] Downloading image from: {image_url[:80]}...")
+                # Streamed straight into staging; oversized or non-image responses are rejected early
+                downloaded = image_download.download(image_url, store.staging)
+                size = downloaded.stat().st_size
+                # Content-addressed: re-running research on the same listings stores nothing new
+                image_blob_key = store.put_file(downloaded, owner=f"research:{listing_id}", ttl=image_ttl, move=True)
+                local_image_path = store.path(image_blob_key)
+                print(f"[Research] ✅ Saved image: {local_image_path} ({size} bytes)")
                 
-                # Use absolute path or relative path that works on Windows
+                # Store local path relative to project root
                 try:
-                    rel_path = str(output_path.relative_to(Path.cwd()))
+                    relative_path = str(local_image_path.relative_to(Path.cwd()))
                 except ValueError:
                     # If relative path fails, use absolute path
-                    rel_path = str(output_path)
-                return rel_path, base64_data
-            except ImportError:
-                print("[Research] PIL/Pillow not installed. Install with: pip install Pillow")
-                return None, None
-            except Exception as e:
-                print(f"[Research] Error creating placeholder: {e}")
-                return None, None
-        
-        if image_url and (image_url.startswith("http://") or image_url.startswith("https://")):
-            try:
-                print(f"[Research] Downloading image from: {image_url[:80]}...")
-                response = requests.get(image_url, timeout=10, headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'})
-                print(f"[Research] Response status: {response.status_code}")
-                if response.status_code == 200:
-                    # Get file extension from URL or content type
-                    content_type = response.headers.get('content-type', 'image/jpeg')
-                    ext = 'jpg'
-                    if 'png' in content_type:
-                        ext = 'png'
-                    elif 'webp' in content_type:
-                        ext = 'webp'
-                    elif image_url.lower().endswith('.png'):
-                        ext = 'png'
-                    elif image_url.lower().endswith('.webp'):
-                        ext = 'webp'
-                    
-                    filename = f"{listing_id}_{safe_title}.{ext}"
-                    local_image_path = images_dir / filename
-                    
-                    # Save image locally
-                    local_image_path.write_bytes(response.content)
-                    print(f"[Research] ✅ Saved image: {local_image_path} ({len(response.content)} bytes)")
-                    
-                    # Convert to base64 for API
-                    image_data_base64 = base64.b64encode(response.content).decode('utf-8')
-                    print(f"[Research] Base64 length: {len(image_data_base64)} chars")
-                    
-                    # Store local path relative to project root
-                    try:
-                        relative_path = str(local_image_path.relative_to(Path.cwd()))
-                    except ValueError:
-                        # If relative path fails, use absolute path
-                        relative_path = str(local_image_path)
-                else:
-                    raise Exception(f"HTTP {response.status_code}")
+                    relative_path = str(local_image_path)
             except Exception as e:
-                # If download fails, log the error and create placeholder image
+                # If download fails, log the error and fall back to a placeholder
                 print(f"[Research] ⚠️ Download failed: {str(e)}")
-                print("[Research] Creating placeholder image...")
-                filename = f"{listing_id}_{safe_title}_placeholder.jpg"
-                placeholder_path = images_dir / filename
-                relative_path, image_data_base64 = create_placeholder_image(
-                    placeholder_path, 
-                    l.get("title") or "Product", 
-                    listing_id
-                )
-                if relative_path:
-                    local_image_path = placeholder_path
-                    print(f"[Research] Created placeholder: {local_image_path}")
-                else:
-                    print(f"[Research] ❌ Failed to create placeholder image")
-                    relative_path = None
-                    image_data_base64 = None
-        else:
-            # No image URL - create placeholder
-            if not image_url:
-                print(f"[Research] ⚠️ No image URL found for listing {listing_id}, creating placeholder...")
-                print(f"[Research] Listing data keys: {list(l.keys())}")
-                if l.get("images"):
-                    print(f"[Research] Images field type: {type(l['images'])}, value: {l['images']}")
-            filename = f"{listing_id}_{safe_title}_placeholder.jpg"
-            placeholder_path = images_dir / filename
-            relative_path, image_data_base64 = create_placeholder_image(
-                placeholder_path,
-                l.get("title") or "Product",
-                listing_id
-            )
-            if relative_path:
-                local_image_path = placeholder_path
-                print(f"[Research] Created placeholder: {local_image_path}")
+        elif not image_url:
+            print(f"[Research] ⚠️ No image URL found for listing {listing_id}, using a placeholder...")
+            print(f"[Research] Listing data keys: {list(l.keys())}")
+            if l.get("images"):
+                print(f"[Research] Images field type: {type(l['images'])}, value: {l['images']}")
+        
+        if image_blob_key is None:
+            # Same title, same bytes: rendered once per process and stored once per content hash
+            placeholder = placeholder_image(l.get("title") or "Product")
+            if placeholder is not None:
+                image_blob_key = store.put_bytes(placeholder, ".jpg", owner=f"research:{listing_id}", ttl=image_ttl)
+                local_image_path = store.path(image_blob_key)
+                try:
+                    relative_path = str(local_image_path.relative_to(Path.cwd()))
+                except ValueError:
+                    relative_path = str(local_image_path)
+                print(f"[Research] Using placeholder: {local_image_path}")
             else:
                 print(f"[Research] ❌ Failed to create placeholder image")
-                relative_path = None
-                image_data_base64 = None
         
         # Extract price amount
         price_obj = l.get("price")
@@ -477,6 +427,6 @@ def run_research(keywords: str, limit: int = 50) -> Dict[str, Any]:
             "images": images,
             "image_url": image_url,
             "image_local_path": relative_path,  # Local file path
-            "image_data_base64": image_data_base64,  # Base64 for API
+            "image_blob_key": image_blob_key,  # Pass to /api/images/generate as reference_image_key
         })
     return {"keywords": keywords, "metrics": metrics, "llm": llm, "listings": preview}
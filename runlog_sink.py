@@ -0,0 +1,85 @@
+import atexit
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert
+
+import report_stats
+from db import engine
+from models import RunLog
+
+FLUSH_INTERVAL = float(os.getenv("RUNLOG_FLUSH_INTERVAL", "2"))
+FLUSH_SIZE = int(os.getenv("RUNLOG_FLUSH_SIZE", "200"))
+
+_lock = threading.Lock()
+_buffer: List[dict] = []
+_wake = threading.Event()
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def log_run(job: str, status: str = "ok", message: Optional[str] = None, counts: Optional[Dict[str, int]] = None):
+    """Queue a RunLog entry; it is written by the background flusher in a batched transaction.
+
+    `counts` feeds the weekly report counters (see report_stats.fold). When the
+    flusher is not running (CLI jobs, tests) the entry is written immediately.
+    """
+    entry = {"job": job, "status": status, "message": message, "created_at": datetime.utcnow(), "counts": counts}
+    with _lock:
+        _buffer.append(entry)
+        size = len(_buffer)
+    if _thread is None or not _thread.is_alive():
+        flush()
+    elif size >= FLUSH_SIZE:
+        _wake.set()
+
+
+def flush() -> int:
+    """Write all buffered entries in one transaction; returns the number written."""
+    global _buffer
+    with _lock:
+        batch, _buffer = _buffer, []
+    if not batch:
+        return 0
+    try:
+        with engine.begin() as conn:
+            conn.execute(insert(RunLog), [{k: v for k, v in e.items() if k != "counts"} for e in batch])
+            report_stats.merge(conn, report_stats.fold(batch))
+    except Exception as e:
+        # Keep the entries for the next attempt rather than dropping them (bounded)
+        with _lock:
+            _buffer = (batch + _buffer)[-FLUSH_SIZE * 10:]
+        print(f"[runlog] flush failed: {e}")
+        return 0
+    return len(batch)
+
+
+def _loop():
+    while not _stop.is_set():
+        _wake.wait(FLUSH_INTERVAL)
+        _wake.clear()
+        flush()
+
+
+def start():
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="runlog-sink", daemon=True)
+    _thread.start()
+
+
+def stop():
+    global _thread
+    _stop.set()
+    _wake.set()
+    if _thread is not None:
+        _thread.join(timeout=FLUSH_INTERVAL + 5)
+        _thread = None
+    flush()
+
+
+atexit.register(flush)
@@ -1,12 +1,29 @@
-﻿import os
+﻿import hashlib
 import mimetypes
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+from uuid import uuid4
 
 try:
     import boto3  # type: ignore
+    from boto3.s3.transfer import TransferConfig  # type: ignore
+    from botocore.config import Config  # type: ignore
 except Exception:
     boto3 = None
 
+MB = 1024 * 1024
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD_MB", "8")) * MB
+S3_MULTIPART_CHUNKSIZE = int(os.getenv("S3_MULTIPART_CHUNKSIZE_MB", "8")) * MB
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "8"))
+S3_UPLOAD_WORKERS = int(os.getenv("S3_UPLOAD_WORKERS", "4"))
+
+_lock = threading.Lock()
+_client_cache = None
+
 
 def is_configured() -> bool:
     return bool(os.getenv("S3_BUCKET") and (boto3 is not None))
@@ -19,15 +36,150 @@ def public_base_url(bucket: str) -> str:
     return f"https://{bucket}.s3.amazonaws.com"
 
 
-def upload_file(local_path: str, key: str) -> str:
+def _client():
+    """One S3 client per process; boto3 clients are thread-safe once created."""
+    global _client_cache
+    with _lock:
+        if _client_cache is None:
+            # Enough pooled connections for every worker's multipart threads
+            pool = max(10, S3_MAX_CONCURRENCY * S3_UPLOAD_WORKERS)
+            _client_cache = boto3.client("s3", config=Config(max_pool_connections=pool, retries={"max_attempts": 5, "mode": "adaptive"}))
+        return _client_cache
+
+
+def _transfer_config():
+    return TransferConfig(
+        multipart_threshold=S3_MULTIPART_THRESHOLD,
+        multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+        max_concurrency=S3_MAX_CONCURRENCY,
+        use_threads=True,
+    )
+
+
+def content_hash(local_path: str) -> str:
+    h = hashlib.sha256()
+    with open(local_path, "rb") as f:
+        for chunk in iter(lambda: f.read(MB), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def content_key(local_path: str, prefix: str = "") -> str:
+    """Key derived from the file's SHA-256, so identical files share one object."""
+    digest = content_hash(local_path)
+    name = f"{digest[:2]}/{digest}{Path(local_path).suffix.lower()}"
+    return f"{prefix.strip('/')}/{name}" if prefix.strip("/") else name
+
+
+class S3Backend:
+    def __init__(self, bucket: Optional[str] = None, client=None):
+        self.bucket = bucket or os.getenv("S3_BUCKET")
+        self._client = client
+
+    @property
+    def client(self):
+        return self._client or _client()
+
+    def url(self, key: str) -> str:
+        return f"{public_base_url(self.bucket)}/{key}"
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError  # type: ignore
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def upload(self, local_path: str, key: str) -> str:
+        content_type, _ = mimetypes.guess_type(local_path)
+        extra = {"ACL": "public-read"}
+        if content_type:
+            extra["ContentType"] = content_type
+        self.client.upload_file(local_path, self.bucket, key, ExtraArgs=extra, Config=_transfer_config())
+        return self.url(key)
+
+    def download(self, key: str, local_path: str) -> None:
+        self.client.download_file(self.bucket, key, local_path, Config=_transfer_config())
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+
+class LocalBackend:
+    """Filesystem stand-in with the S3Backend interface (tests, local development)."""
+
+    def __init__(self, root: str, base_url: str = "/media"):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip("/")
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+    def exists(self, key: str) -> bool:
+        return (self.root / key).is_file()
+
+    def upload(self, local_path: str, key: str) -> str:
+        dest = self.root / key
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        # Unique per call: concurrent uploads of the same key must not share a temp file
+        tmp = dest.with_name(f"{dest.name}.{uuid4().hex}.part")
+        try:
+            shutil.copyfile(local_path, tmp)
+            tmp.replace(dest)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        return self.url(key)
+
+    def path(self, key: str) -> Path:
+        return self.root / key
+
+    def download(self, key: str, local_path: str) -> None:
+        shutil.copyfile(self.root / key, local_path)
+
+    def delete(self, key: str) -> None:
+        try:
+            (self.root / key).unlink()
+        except FileNotFoundError:
+            pass
+
+
+def default_backend() -> S3Backend:
     if not is_configured():
         raise RuntimeError("S3 not configured")
-    bucket = os.getenv("S3_BUCKET")
-    client = boto3.client("s3")
-    content_type, _ = mimetypes.guess_type(local_path)
-    extra = {"ACL": "public-read"}
-    if content_type:
-        extra["ContentType"] = content_type
-    client.upload_file(local_path, bucket, key, ExtraArgs=extra)
-    base = public_base_url(bucket)
-    return f"{base}/{key}"
+    return S3Backend()
+
+
+def upload_file(local_path: str, key: str) -> str:
+    return default_backend().upload(local_path, key)
+
+
+def put_content_addressed(local_path: str, prefix: str = "", backend=None) -> Tuple[str, bool]:
+    """Upload under a content-hash key unless that object already exists; returns (url, uploaded)."""
+    backend = backend or default_backend()
+    key = content_key(local_path, prefix)
+    if backend.exists(key):
+        return backend.url(key), False
+    return backend.upload(local_path, key), True
+
+
+def upload_many(paths: Iterable[str], prefix: str = "", backend=None, workers: Optional[int] = None) -> Dict[str, dict]:
+    """Content-addressed uploads of many files on a worker pool.
+
+    Returns {local_path: {"url", "uploaded"} or {"error"}}; one failure does not stop the rest.
+    """
+    backend = backend or default_backend()
+    paths = list(dict.fromkeys(paths))
+
+    def one(path):
+        try:
+            url, uploaded = put_content_addressed(path, prefix, backend)
+            return path, {"url": url, "uploaded": uploaded}
+        except Exception as e:
+            return path, {"error": str(e) or type(e).__name__}
+
+    with ThreadPoolExecutor(max_workers=max(1, workers or S3_UPLOAD_WORKERS)) as pool:
+        return dict(pool.map(one, paths))
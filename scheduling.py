@@ -0,0 +1,74 @@
+import multiprocessing
+import os
+from typing import Optional
+from uuid import uuid4
+
+from apscheduler.executors.pool import ProcessPoolExecutor, ThreadPoolExecutor
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+
+import job_runner
+from job_runner import JOB_MODULES
+
+SCHEDULER_THREADS = int(os.getenv("SCHEDULER_THREADS", "8"))
+SCHEDULER_HEAVY_THREADS = int(os.getenv("SCHEDULER_HEAVY_THREADS", "2"))
+SCHEDULER_PROCESSES = int(os.getenv("SCHEDULER_PROCESSES", "2"))
+# "heavy" (separate thread pool) or "process" (separate processes) for API-bound jobs
+SCHEDULER_HEAVY_EXECUTOR = os.getenv("SCHEDULER_HEAVY_EXECUTOR", "heavy")
+SCHEDULER_MISFIRE_GRACE = int(os.getenv("SCHEDULER_MISFIRE_GRACE", "300"))
+JOBSTORE_TABLE = "apscheduler_jobs"
+
+# Jobs that spend minutes talking to Etsy/Printful; kept off the default pool so
+# quick housekeeping jobs are never queued behind them.
+HEAVY_JOBS = {"list_to_etsy", "pull_metrics", "intake_to_assets", "sync_prices", "sync_inventory"}
+
+
+def run_scheduled_job(job: str):
+    """Entry point stored in the job store; referenced by name so it survives restarts."""
+    job_runner.execute(job, trigger="schedule")
+
+
+def executor_for(job: str) -> str:
+    if job not in HEAVY_JOBS:
+        return "default"
+    return "process" if SCHEDULER_HEAVY_EXECUTOR == "process" else "heavy"
+
+
+def build_scheduler(engine=None) -> BackgroundScheduler:
+    """Scheduler with schedules persisted in the app database.
+
+    Each job gets coalesce (missed runs collapse into one), max_instances=1 and a
+    misfire grace window, so a deploy neither drops schedules nor replays a backlog.
+    """
+    if engine is None:
+        from db import engine
+    executors = {
+        "default": ThreadPoolExecutor(SCHEDULER_THREADS),
+        "heavy": ThreadPoolExecutor(SCHEDULER_HEAVY_THREADS),
+        # spawn: forked children would share the parent's pooled DB connections
+        "process": ProcessPoolExecutor(SCHEDULER_PROCESSES, pool_kwargs={"mp_context": multiprocessing.get_context("spawn")}),
+    }
+    job_defaults = {"coalesce": True, "max_instances": 1, "misfire_grace_time": SCHEDULER_MISFIRE_GRACE}
+    return BackgroundScheduler(
+        jobstores={"default": SQLAlchemyJobStore(engine=engine, tablename=JOBSTORE_TABLE)},
+        executors=executors,
+        job_defaults=job_defaults,
+    )
+
+
+def add_interval_job(scheduler: BackgroundScheduler, job: str, minutes: int) -> Optional[str]:
+    """Persist an interval schedule for a known job; returns its id, or None if unknown."""
+    if job not in JOB_MODULES:
+        return None
+    job_id = f"{job}-" + str(uuid4())[:8]
+    scheduler.add_job(
+        "scheduling:run_scheduled_job",
+        "interval",
+        minutes=max(1, int(minutes)),
+        args=[job],
+        id=job_id,
+        name=job,
+        executor=executor_for(job),
+        replace_existing=False,
+    )
+    return job_id
@@ -0,0 +1,61 @@
+import os
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import delete, insert, select, update
+
+from models import Product, SyncWatermark
+
+APPLY_CHUNK = int(os.getenv("SYNC_APPLY_CHUNK", "1000"))
+
+
+@dataclass
+class SyncPlan:
+    """Change set computed by a sync job's planning phase.
+
+    changes holds (sku, old, new) tuples for plan.field; listing_ids maps sku to Etsy
+    listing id for rows that also need a marketplace push; remote holds per-sku
+    remote state a job records after applying.
+    """
+    job: str
+    field: str
+    examined: int = 0
+    changes: List[Tuple[str, Any, Any]] = field(default_factory=list)
+    listing_ids: dict = field(default_factory=dict)
+    remote: dict = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.changes)
+
+    def summary(self, limit: Optional[int] = 50) -> dict:
+        shown = self.changes if limit is None else self.changes[:limit]
+        return {
+            "job": self.job,
+            "field": self.field,
+            "examined": self.examined,
+            "changed": len(self.changes),
+            "changes": [{"sku": sku, "old": old, "new": new} for sku, old, new in shown],
+        }
+
+
+def apply_plan(session, plan: SyncPlan, chunk_size: Optional[int] = None) -> int:
+    """Write a plan's new values with bulk UPDATEs by primary key, committing per chunk."""
+    chunk_size = max(1, chunk_size or APPLY_CHUNK)
+    written = 0
+    for i in range(0, len(plan.changes), chunk_size):
+        params = [{"sku": sku, plan.field: new} for sku, _, new in plan.changes[i:i + chunk_size]]
+        session.execute(update(Product), params)
+        session.commit()
+        written += len(params)
+    return written
+
+
+def get_watermark(session, name: str) -> Optional[datetime]:
+    return session.connection().execute(select(SyncWatermark.value).where(SyncWatermark.name == name)).scalar()
+
+
+def set_watermark(session, name: str, value: datetime):
+    """Replace a named watermark; the caller commits."""
+    session.execute(delete(SyncWatermark).where(SyncWatermark.name == name))
+    session.execute(insert(SyncWatermark).values(name=name, value=value))
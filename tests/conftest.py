@@ -0,0 +1,3 @@
+# The automerch package and the legacy app map some of the same tables. The legacy
+# models declare extend_existing, so they must be registered second.
+import automerch.models  # noqa: F401
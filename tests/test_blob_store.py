@@ -0,0 +1,95 @@
+import io
+from datetime import datetime, timedelta
+
+from sqlmodel import SQLModel, create_engine
+
+import blob_store
+from blob_store import BlobStore, LRUCache
+from models import Blob, BlobRef
+from s3_storage import LocalBackend
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 32
+
+
+def _store(tmp_path, remote=False, cache_bytes=1024):
+    engine = create_engine(f"sqlite:///{tmp_path / 'blobs.db'}")
+    SQLModel.metadata.create_all(engine, tables=[Blob.__table__, BlobRef.__table__])
+    if not remote:
+        return BlobStore(LocalBackend(tmp_path / "blobs", base_url="/blobs"), engine=engine)
+
+    class Remote(LocalBackend):
+        path = None  # no in-place reads: behaves like S3
+        downloads = 0
+
+        def download(self, key, local_path):
+            Remote.downloads += 1
+            super().download(key, local_path)
+
+    backend = Remote(tmp_path / "bucket", base_url="https://cdn.example")
+    return BlobStore(backend, LRUCache(tmp_path / "cache", cache_bytes), engine, prefix="blobs")
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    store = _store(tmp_path)
+    a = store.put_bytes(PNG, owner="product:A")
+    b = store.put_stream(io.BytesIO(PNG), owner="research:1")
+    assert a == b and a.endswith(".png")
+    assert store.path(a).read_bytes() == PNG
+    assert store.url(a) == f"/blobs/{a}"
+    assert store.refcount(a) == 2
+    assert len(list((tmp_path / "blobs").glob("*/*"))) == 1
+
+
+def test_gc_removes_only_unreferenced_blobs(tmp_path):
+    store = _store(tmp_path)
+    kept = store.put_bytes(b"kept", ".jpg", owner="product:A")
+    replaced = store.put_bytes(b"old", ".jpg", owner="product:B")
+    store.set_refs("product:B", [store.put_bytes(b"new", ".jpg")])
+    expiring = store.put_bytes(b"thumb", ".jpg", owner="research:9", ttl=timedelta(days=1))
+    later = datetime.utcnow() + timedelta(days=3)
+
+    assert store.gc(grace=timedelta(hours=1), now=datetime.utcnow())["removed"] == 0  # still in grace
+    result = store.gc(grace=timedelta(hours=1), now=later)
+    assert sorted(result["keys"]) == sorted([replaced, expiring])
+    assert not store.path(replaced).exists() and not store.exists(expiring)
+    assert store.path(kept).exists() and store.refcount(kept) == 1
+
+
+def test_gc_keeps_a_blob_put_again_after_its_row_was_deleted(tmp_path):
+    store = _store(tmp_path)
+    key = store.put_bytes(b"old", ".jpg")
+    engine = store.engine
+
+    class PutBeforeFileDelete:
+        """Lets a put land between gc's transaction and its file deletes."""
+
+        def __getattr__(self, name):
+            return getattr(engine, name)
+
+        def connect(self):
+            store._engine = engine
+            assert store.put_bytes(b"old", ".jpg", owner="product:C") == key
+            return engine.connect()
+
+    store._engine = PutBeforeFileDelete()
+    assert store.gc(grace=timedelta(0), now=datetime.utcnow() + timedelta(seconds=1))["removed"] == 0
+    assert store.path(key).read_bytes() == b"old" and store.refcount(key) == 1
+
+
+def test_remote_reads_go_through_a_bounded_lru_cache(tmp_path):
+    store = _store(tmp_path, remote=True, cache_bytes=250)
+    keys = [store.put_bytes(bytes([i]) * 100, ".bin") for i in range(3)]
+    assert (tmp_path / "bucket" / "blobs" / keys[0][:2] / keys[0]).is_file()
+    assert store.cache.size <= 250
+    assert store.cache.get(keys[0]) is None  # least recently used went first
+
+    assert store.path(keys[0]).read_bytes() == bytes([0]) * 100
+    assert store.path(keys[0]).exists() and type(store.backend).downloads == 1
+    assert store.cache.get(keys[1]) is None
+    assert LRUCache(tmp_path / "cache", 250).size == store.cache.size
+
+
+def test_sniff_ext():
+    assert blob_store.sniff_ext(b"\xff\xd8\xff\xe0") == ".jpg"
+    assert blob_store.sniff_ext(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == ".webp"
+    assert blob_store.sniff_ext(b"hello") == ""
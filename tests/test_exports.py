@@ -0,0 +1,45 @@
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app as appmod
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.ipc as pa_ipc  # noqa: E402
+import pyarrow.parquet as pq  # noqa: E402
+
+client = TestClient(appmod.app)
+
+
+def test_export_products_parquet_schema():
+    r = client.get("/api/export/products.parquet")
+    assert r.status_code == 200
+    table = pq.read_table(io.BytesIO(r.content))
+    assert table.schema.field("sku").type == pa.string()
+    assert table.schema.field("price").type == pa.float64()
+
+
+def test_export_runlogs_arrow():
+    r = client.get("/api/export/runlogs.arrow?compression=lz4")
+    assert r.status_code == 200
+    table = pa_ipc.open_file(pa.BufferReader(r.content)).read_all()
+    assert table.column_names == ["id", "job", "status", "message", "created_at"]
+
+
+def test_export_unknown_dataset():
+    r = client.get("/api/export/nope.parquet")
+    assert r.status_code == 404
+
+
+@pytest.mark.parametrize("url, status", [
+    ("/api/export/products.parquet?compression=brotli", 200),
+    ("/api/export/products.parquet?compression=NONE", 200),
+    ("/api/export/products.parquet?compression=lzo", 400),
+    ("/api/export/products.arrow?compression=snappy", 400),
+])
+def test_export_compression_is_validated(url, status):
+    r = client.get(url)
+    assert r.status_code == status
+    if status == 400:
+        assert "Unsupported" in r.json()["error"]
@@ -0,0 +1,124 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlmodel import SQLModel, create_engine
+
+from automerch.api.routes import image_generation
+from automerch.models import GenerationJob, GenerationJobImage
+from automerch.services.image_generator import client, job_queue
+
+
+class FakeGenerator:
+    def generate_product_images(self, prompt, count, style, aspect_ratio, reference_image_url=None,
+                                reference_image_base64=None, on_image=None, reference=None):
+        images = []
+        for i in range(count):
+            if i == 1:
+                continue  # a failed variation
+            image = {"base64": "aGk=", "prompt": prompt, "style": style}
+            on_image(i, image)
+            images.append(image)
+        return images
+
+
+def _setup(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    SQLModel.metadata.create_all(engine, tables=[GenerationJob.__table__, GenerationJobImage.__table__])
+    monkeypatch.setattr(job_queue, "engine", engine)
+    monkeypatch.setattr(job_queue, "start", lambda: None)
+    monkeypatch.setattr(job_queue, "store_image", lambda owner, base64_data=None, url=None: f"{owner[-4:]}.png")
+    monkeypatch.setattr(client, "ImageGenerator", FakeGenerator)
+    monkeypatch.setattr(job_queue.settings, "IMAGE_CACHE_POLICY", "off")
+    app = FastAPI()
+    app.include_router(image_generation.router)
+    return TestClient(app)
+
+
+def test_generate_returns_a_job_and_streams_its_images(tmp_path, monkeypatch):
+    api = _setup(tmp_path, monkeypatch)
+    resp = api.post("/api/images/generate", json={"prompt": "cat mug", "count": 3})
+    assert resp.status_code == 202
+    job_id = resp.json()["job_id"]
+    assert api.get(f"/api/images/jobs/{job_id}").json()["status"] == "queued"
+
+    job = job_queue._claim()
+    assert job.id == job_id and job_queue._claim() is None
+    job_queue._run(job)
+
+    status = api.get(f"/api/images/jobs/{job_id}").json()
+    assert status["status"] == "done" and status["completed"] == 2
+    assert [img["index"] for img in status["images"]] == [0, 2]
+    assert status["images"][0]["url"] == f"/api/images/files/{job_id[-4:]}.png"
+
+    body = api.get(f"/api/images/jobs/{job_id}/events").text
+    assert body.count("event: image") == 2 and 'event: done\ndata: {"id"' in body
+    resumed = api.get(f"/api/images/jobs/{job_id}/events", headers={"Last-Event-ID": str(status["images"][0]["id"])}).text
+    assert resumed.count("event: image") == 1
+
+
+def test_only_stale_jobs_are_requeued_and_resume_from_the_shortfall(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    job_id = job_queue.enqueue({"prompt": "p", "count": 3})
+    job = job_queue._claim()
+    assert job.id == job_id
+    # Still heartbeated by a live process: left alone
+    assert job_queue.requeue_interrupted() == 0
+    job_queue._add_image(job_id, 0, "a.png", None, {})
+    assert job_queue.requeue_interrupted(stale_after=-1) == 1
+    assert job_queue.get_status(job_id)["status"] == "queued"
+
+    job_queue._run(job_queue._claim())
+    status = job_queue.get_job(job_id)
+    assert status["completed"] == 2 and [img["index"] for img in status["images"]] == [0, 1]
+    assert status["images"][0]["blob_key"] == "a.png"
+
+
+def test_reference_image_is_passed_by_key_and_read_once(tmp_path, monkeypatch):
+    import base64
+    import blob_store
+    from models import Blob, BlobRef
+    from s3_storage import LocalBackend
+
+    api = _setup(tmp_path, monkeypatch)
+    SQLModel.metadata.create_all(job_queue.engine, tables=[Blob.__table__, BlobRef.__table__])
+    store = blob_store.BlobStore(LocalBackend(tmp_path / "blobs"), engine=job_queue.engine)
+    monkeypatch.setattr(blob_store, "_store", store)
+    seen = []
+
+    class RecordingGenerator(FakeGenerator):
+        def generate_product_images(self, prompt, count, style, aspect_ratio, reference_image_url=None,
+                                    reference_image_base64=None, on_image=None, reference=None):
+            assert reference_image_base64 is None
+            seen.append(reference)
+            return super().generate_product_images(prompt, count, style, aspect_ratio, on_image=on_image)
+
+    monkeypatch.setattr(client, "ImageGenerator", RecordingGenerator)
+    png = b"\x89PNG\r\n\x1a\n" + b"0" * 32
+    key = store.put_bytes(png, owner="research:1")
+
+    assert api.post("/api/images/generate", json={"prompt": "p", "reference_image_key": "nope.png"}).status_code == 400
+    # A stale key falls back to the base64 sent along with it
+    stale = api.post("/api/images/generate", json={
+        "prompt": "p", "reference_image_key": "nope.png", "reference_image_base64": base64.b64encode(png).decode(),
+    })
+    assert stale.status_code == 202
+    job_id = api.post("/api/images/generate", json={"prompt": "p", "count": 3, "reference_image_key": key}).json()["job_id"]
+    from_b64 = job_queue.enqueue({"prompt": "p", "reference_image_base64": base64.b64encode(png).decode()})
+    assert store.refcount(key) == 4  # research, and all three jobs
+    for _ in range(3):
+        job_queue._run(job_queue._claim())
+
+    assert job_queue.get_status(job_id)["status"] == job_queue.get_status(from_b64)["status"] == "done"
+    assert [(r.key, r.data, r.mime_type, r.content_hash) for r in seen] == [(key, png, "image/png", key[:-4])] * 3
+
+
+def test_a_requeued_job_is_not_finished_by_its_stalled_worker(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    job_id = job_queue.enqueue({"prompt": "p", "count": 1})
+    stalled = job_queue._claim()
+    assert job_queue.requeue_interrupted(stale_after=-1) == 1
+    monkeypatch.setattr(job_queue, "WORKER_ID", "other:1")
+    job_queue._claim()
+
+    monkeypatch.setattr(job_queue, "WORKER_ID", stalled.worker)
+    job_queue._run(stalled)
+    assert job_queue.get_status(job_id)["status"] == "running"
@@ -0,0 +1,93 @@
+import base64
+import io
+import json
+from datetime import timedelta
+
+from PIL import Image
+from sqlmodel import SQLModel, create_engine
+
+import blob_store
+from automerch.models import GenerationJob, GenerationJobImage, GeneratedImageCacheEntry
+from automerch.services.image_generator import client, image_cache, job_queue
+from models import Blob, BlobRef
+from s3_storage import LocalBackend
+
+
+def _png(seed: int, noise: int = 0) -> bytes:
+    im = Image.new("L", (64, 64))
+    # Distinct seeds give unrelated gradients; noise nudges a few pixels only
+    im.putdata([((x * (seed + 1) * 37 + y * (seed + 3) * 11) % 256 + (noise if x == y else 0)) % 256
+                for y in range(64) for x in range(64)])
+    buf = io.BytesIO()
+    im.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _setup(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'cache.db'}")
+    SQLModel.metadata.create_all(engine, tables=[
+        GenerationJob.__table__, GenerationJobImage.__table__, GeneratedImageCacheEntry.__table__,
+        Blob.__table__, BlobRef.__table__,
+    ])
+    store = blob_store.BlobStore(LocalBackend(tmp_path / "blobs"), engine=engine)
+    monkeypatch.setattr(blob_store, "_store", store)
+    monkeypatch.setattr(image_cache, "engine", engine)
+    monkeypatch.setattr(job_queue, "engine", engine)
+    monkeypatch.setattr(job_queue, "start", lambda: None)
+    return store
+
+
+def test_near_duplicates_and_lru_eviction(tmp_path, monkeypatch):
+    store = _setup(tmp_path, monkeypatch)
+    a = store.put_bytes(_png(1))
+    a_again = store.put_bytes(_png(1, noise=3))
+    b = store.put_bytes(_png(5))
+
+    assert image_cache.record("k1", a, store.path(a))["cache_recorded"] is True
+    dup = image_cache.record("k1", a_again, store.path(a_again))
+    assert dup["cache_recorded"] is False and dup["near_duplicate_of"] == a
+    across = image_cache.record("k2", a_again, store.path(a_again))
+    assert across["cache_recorded"] is True and across["near_duplicate_of"] == a
+    assert image_cache.record("k1", b, store.path(b))["cache_recorded"] is True
+
+    assert [e["blob_key"] for e in image_cache.lookup("k1", 5)] == [a, b]
+    assert image_cache.evict(max_entries=2) == 1  # k2 was used least recently
+    assert image_cache.lookup("k2", 5) == []
+    assert store.refcount(a_again) == 0 and store.refcount(a) == 1
+
+
+def test_repeat_requests_reuse_cached_images(tmp_path, monkeypatch):
+    store = _setup(tmp_path, monkeypatch)
+    calls = []
+
+    class FakeGenerator:
+        def cache_identity(self):
+            return "fake", "m1"
+
+        def generate_product_images(self, prompt, count, style, aspect_ratio, reference_image_url=None,
+                                    reference_image_base64=None, on_image=None, reference=None):
+            calls.append(count)
+            images = [{"base64": base64.b64encode(_png(10 + len(calls) * 10 + i)).decode()} for i in range(count)]
+            for i, image in enumerate(images):
+                on_image(i, image)
+            return images
+
+    monkeypatch.setattr(client, "ImageGenerator", FakeGenerator)
+    first = job_queue.enqueue({"prompt": "fox mug", "count": 2})
+    job_queue._run(job_queue._claim())
+    second = job_queue.enqueue({"prompt": "fox mug", "count": 3})
+    job_queue._run(job_queue._claim())
+
+    assert calls == [2, 1]  # only the shortfall is generated
+    images = job_queue.get_job(second)["images"]
+    assert job_queue.get_job(second)["status"] == "done"
+    assert [img["index"] for img in images] == [0, 1, 2]
+    assert [img.get("cached") for img in images] == [True, True, None]
+    assert [img["blob_key"] for img in images[:2]] == [img["blob_key"] for img in job_queue.get_job(first)["images"]]
+
+    # Once the first job lets go and the cache is evicted, the reusing job still holds its images
+    store.release(f"generation_job:{first}")
+    assert image_cache.evict(max_entries=0) == 3
+    assert all(store.refcount(img["blob_key"]) >= 1 for img in images)
+    assert store.gc(grace=timedelta(0))["removed"] == 0
+    assert json.loads(json.dumps(images))  # events stay JSON-serialisable
@@ -0,0 +1,74 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import image_download
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 200
+
+
+class Handler(BaseHTTPRequestHandler):
+    routes = {
+        "/ok.png": ("image/png", PNG),
+        "/big.png": ("image/png", PNG * 100),
+        "/page": ("text/html", b"<html>" * 50),
+        "/disguised": ("application/octet-stream", b"<html>" * 50),
+    }
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body: bool):
+        path = self.path.split("?")[0]
+        if path not in self.routes:
+            self.send_response(404)
+            self.end_headers()
+            return
+        ctype, data = self.routes[path]
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        if "nolength" not in self.path:
+            self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if body:
+            self.wfile.write(data)
+
+    def do_HEAD(self):
+        if "nohead" in self.path:
+            self.send_response(405)
+            self.end_headers()
+            return
+        self._send(False)
+
+    def do_GET(self):
+        self.server.gets.append(self.path)
+        self._send(True)
+
+
+@pytest.fixture
+def server():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    srv.gets = []
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.shutdown()
+
+
+def test_download_streams_and_validates(server, tmp_path):
+    base = f"http://127.0.0.1:{server.server_port}"
+    path = image_download.download(f"{base}/ok.png?x=1", tmp_path, "thumb")
+    assert path == tmp_path / "thumb.png" and path.read_bytes() == PNG
+
+    # Rejected by the HEAD precheck: no GET is made
+    for url in ("/big.png", "/page"):
+        with pytest.raises(ValueError):
+            image_download.download(base + url, tmp_path, max_bytes=1000)
+    assert server.gets == ["/ok.png?x=1"]
+
+    # HEAD refused, size unknown up front: the Range probe and the stream itself catch them
+    with pytest.raises(ValueError, match="Not an image"):
+        image_download.download(f"{base}/disguised?nohead", tmp_path)
+    with pytest.raises(ValueError, match="too large"):
+        image_download.download(f"{base}/big.png?nolength", tmp_path, max_bytes=1000, check_first=False)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["thumb.png"]
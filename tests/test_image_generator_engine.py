@@ -0,0 +1,67 @@
+import threading
+import time
+
+from automerch.services.image_generator import engine
+
+
+def test_batch_runs_concurrently_and_keeps_order(monkeypatch):
+    monkeypatch.setattr(engine, "_pools", {})
+    monkeypatch.setenv("IMAGE_GEN_CONCURRENCY_FAKE", "5")
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def generate_one(i):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.2 if i == 0 else 0.05)  # the first image finishes last
+        with lock:
+            active[0] -= 1
+        if i == 2:
+            raise RuntimeError("provider error")
+        return [{"i": i}, {"i": i, "extra": True}] if i == 4 else {"i": i}
+
+    started = time.monotonic()
+    images = engine.run_batch("fake", 5, generate_one, timeout=5)
+    assert time.monotonic() - started < 0.6
+    assert [img["i"] for img in images] == [0, 1, 3, 4, 4]
+    assert peak[0] > 1
+
+
+def test_provider_cap_and_timeout(monkeypatch):
+    monkeypatch.setattr(engine, "_pools", {})
+    monkeypatch.setenv("IMAGE_GEN_CONCURRENCY_SLOW", "1")
+    calls = []
+
+    def generate_one(i):
+        calls.append(i)
+        time.sleep(1.0 if i == 1 else 0.01)
+        return {"i": i}
+
+    # One slot, 0.2s per image: image 1 overruns the batch budget and image 2 never starts
+    started = time.monotonic()
+    images = engine.run_batch("slow", 3, generate_one, timeout=0.2)
+    assert images == [{"i": 0}]
+    assert time.monotonic() - started < 0.9
+    time.sleep(0.6)
+    assert calls == [0, 1]
+
+
+def test_concurrent_batches_share_the_provider_pool(monkeypatch):
+    monkeypatch.setattr(engine, "_pools", {})
+    monkeypatch.setenv("IMAGE_GEN_CONCURRENCY_SHARED", "2")
+    results = {}
+
+    def generate_one(i):
+        time.sleep(0.15)
+        return {"i": i}
+
+    # Eight images through two slots take longer than any one batch's timeout, but each
+    # image starts late rather than running over, so none is dropped
+    batches = [threading.Thread(target=lambda n=n: results.update({n: engine.run_batch("shared", 4, generate_one, timeout=0.25)}))
+               for n in range(2)]
+    for t in batches:
+        t.start()
+    for t in batches:
+        t.join()
+    assert [len(results[n]) for n in range(2)] == [4, 4]
@@ -0,0 +1,58 @@
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+import image_processing
+
+
+def _image_file(path, size, fmt):
+    Image.new("RGB", size, (200, 30, 30)).save(path, format=fmt)
+    return path
+
+
+def test_save_stream_copies_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_processing, "COPY_CHUNK", 7)
+    dest = tmp_path / "a" / "orig.bin"
+    assert image_processing.save_stream(io.BytesIO(b"x" * 100), dest) == 100
+    assert dest.read_bytes() == b"x" * 100
+    assert not (tmp_path / "a" / "orig.bin.part").exists()
+
+
+def test_process_image_downscales_png_and_jpeg(tmp_path):
+    png = _image_file(tmp_path / "big.png", (4000, 2000), "PNG")
+    out = image_processing.process_image(str(png), str(tmp_path / "out.jpg"), max_width=1000)
+    assert (out["width"], out["height"]) == (1000, 500)
+    assert out["source_size"] == (4000, 2000)
+
+    jpg = _image_file(tmp_path / "big.jpg", (3200, 1600), "JPEG")
+    out = image_processing.process_image(str(jpg), str(tmp_path / "out2.jpg"), max_width=800)
+    with Image.open(out["path"]) as im:
+        assert im.size == (800, 400) and im.format == "JPEG"
+
+
+def test_submit_reports_result_on_io_pool(tmp_path, monkeypatch):
+    cpu, io_pool = ThreadPoolExecutor(1), ThreadPoolExecutor(1, thread_name_prefix="image-io")
+    monkeypatch.setattr(image_processing, "_cpu", lambda: cpu)
+    monkeypatch.setattr(image_processing, "_io", lambda: io_pool)
+    done = threading.Event()
+    calls = []
+
+    def on_done(result, error):
+        calls.append((result, error, threading.current_thread().name))
+        done.set()
+
+    src = _image_file(tmp_path / "small.png", (50, 40), "PNG")
+    image_processing.submit(src, tmp_path / "small.jpg", on_done)
+    assert done.wait(10)
+    result, error, thread = calls[0]
+    assert error is None and result["width"] == 50 and thread.startswith("image-io")
+
+    done.clear()
+    bad = tmp_path / "bad.png"
+    bad.write_bytes(b"not an image")
+    image_processing.submit(bad, tmp_path / "bad.jpg", on_done)
+    assert done.wait(10)
+    assert calls[1][0] is None and calls[1][1] is not None
+    cpu.shutdown(); io_pool.shutdown()
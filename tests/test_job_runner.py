@@ -0,0 +1,107 @@
+import sys
+import threading
+import types
+
+import pytest
+from sqlmodel import SQLModel, create_engine
+
+import job_runner
+
+
+@pytest.fixture
+def runner(monkeypatch, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'runs.db'}")
+    SQLModel.metadata.create_all(engine)
+    monkeypatch.setattr(job_runner, "engine", engine)
+    monkeypatch.setattr(job_runner, "log_run", lambda *a, **k: None)
+    monkeypatch.setattr(job_runner, "_active", {})
+    yield job_runner
+    job_runner.shutdown(wait=True)
+
+
+def _fake_job(monkeypatch, name, run):
+    mod = types.ModuleType(f"fake_jobs_{name}")
+    mod.run = run
+    monkeypatch.setitem(sys.modules, mod.__name__, mod)
+    monkeypatch.setitem(job_runner.JOB_MODULES, name, mod.__name__)
+
+
+def test_execute_records_timing_items_and_output(runner, monkeypatch):
+    def run():
+        print("step one")
+        print("step two")
+        return {"examined": 10, "changed": 3}
+
+    _fake_job(monkeypatch, "fake", run)
+    run_id = runner.execute("fake")
+    row = runner.get_run(run_id)
+    assert row["status"] == "ok" and row["trigger"] == "schedule"
+    assert row["items"] == 3
+    assert row["duration_ms"] >= 0 and row["started_at"] <= row["finished_at"]
+    assert row["log"] == "step one\nstep two"
+    lines, offset, finished = runner.read_log(run_id, 1)
+    assert (lines, offset, finished) == (["step two"], 2, True)
+
+    h = runner.history("fake")
+    assert h["count"] == 1 and h["p50_ms"] == row["duration_ms"]
+
+
+def test_errors_and_unknown_jobs_are_recorded(runner, monkeypatch):
+    def boom():
+        raise RuntimeError("etsy down")
+
+    _fake_job(monkeypatch, "boom", boom)
+    assert runner.get_run(runner.execute("boom"))["message"] == "etsy down"
+    assert runner.get_run(runner.execute("nope"))["status"] == "unknown"
+
+
+def test_submit_runs_off_thread_and_enforces_concurrency(runner, monkeypatch):
+    gate = threading.Event()
+    seen = []
+
+    def slow():
+        seen.append(threading.current_thread().name)
+        gate.wait(5)
+        return 7
+
+    _fake_job(monkeypatch, "slow", slow)
+    first, admitted = runner.submit("slow")
+    second, admitted_again = runner.submit("slow")
+    assert admitted and not admitted_again
+    assert runner.get_run(second)["status"] == "skipped"
+    gate.set()
+    runner.shutdown(wait=True)
+    assert runner.get_run(first)["status"] == "ok"
+    assert runner.get_run(first)["items"] == 7
+    assert seen[0].startswith("job-runner")
+    # Slot is released once the run finishes
+    assert runner._active["slow"] == 0
+
+
+def test_parse_limits():
+    assert job_runner._parse_limits("pull_metrics=2, weekly_report=1,bad") == {"pull_metrics": 2, "weekly_report": 1}
+
+
+def test_output_of_spawned_threads_is_captured_and_stdout_restored(runner, monkeypatch):
+    stdout = sys.stdout
+
+    def run():
+        print("main")
+        worker = threading.Thread(target=lambda: print("from worker"))
+        worker.start()
+        worker.join()
+
+    _fake_job(monkeypatch, "spawner", run)
+    assert runner.get_run(runner.execute("spawner"))["log"] == "main\nfrom worker"
+    assert sys.stdout is stdout
+
+
+def test_stream_stops_when_the_run_never_starts(runner, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import app as appmod
+
+    monkeypatch.setattr(runner, "STREAM_IDLE_SECONDS", 0.1)
+    run_id = runner._create("elsewhere", "manual", "queued")
+    body = TestClient(appmod.app).get(f"/api/jobs/runs/{run_id}/stream").text
+    assert body == 'event: timeout\ndata: {"status": "queued", "offset": 0}\n\n'
@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+from sqlmodel import SQLModel, create_engine
+
+from leader import LeaderElector
+from models import SchedulerLease
+
+
+def _engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'lease.db'}")
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def test_only_one_replica_leads(tmp_path):
+    engine = _engine(tmp_path)
+    events = []
+    a = LeaderElector(engine, holder="a", on_elected=lambda: events.append("a+"), on_demoted=lambda: events.append("a-"))
+    b = LeaderElector(engine, holder="b", on_elected=lambda: events.append("b+"))
+    assert a.try_acquire() is True
+    assert b.try_acquire() is False
+    assert a.try_acquire() is True  # renewal
+    assert a.current()["holder"] == "a"
+
+    a.release()
+    assert b.try_acquire() is True
+    assert a.try_acquire() is False
+    assert events == ["a+", "a-", "b+"]
+
+
+def test_expired_lease_fails_over(tmp_path):
+    engine = _engine(tmp_path)
+    a = LeaderElector(engine, holder="a")
+    b = LeaderElector(engine, holder="b")
+    assert a.try_acquire()
+    # Leader stops renewing (crashed); its lease runs out
+    table = SchedulerLease.__table__
+    with engine.begin() as conn:
+        conn.execute(update(table).values(expires_at=datetime.utcnow() - timedelta(seconds=5)))
+    assert b.try_acquire() is True
+    assert a.try_acquire() is False
+    assert a.is_leader is False
+    assert b.current()["holder"] == "b"
@@ -0,0 +1,27 @@
+from datetime import datetime, timedelta
+
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from jobs import prune_logs
+from models import RunLog, RunLogDaily
+
+
+def test_prune_logs_rolls_up_old_rows(monkeypatch):
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    monkeypatch.setattr(prune_logs, "get_session", lambda: Session(engine))
+    old = datetime.utcnow() - timedelta(days=40)
+    with Session(engine) as s:
+        s.add_all([RunLog(job="sync_prices", created_at=old) for _ in range(3)])
+        s.add(RunLog(job="sync_prices", status="error", created_at=old))
+        s.add(RunLog(job="sync_prices"))
+        s.commit()
+
+    prune_logs.run(retention_days=30)
+    prune_logs.run(retention_days=30)
+
+    with Session(engine) as s:
+        daily = {(r.job, r.status): r.count for r in s.exec(select(RunLogDaily)).all()}
+        assert daily == {("sync_prices", "ok"): 3, ("sync_prices", "error"): 1}
+        remaining = s.exec(select(RunLog).where(RunLog.job == "sync_prices")).all()
+        assert len(remaining) == 1
@@ -0,0 +1,60 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import image_processing
+from media_resolver import MediaFiles, derived_dir
+
+
+def _client(tmp_path, monkeypatch):
+    pool = ThreadPoolExecutor(1)
+    monkeypatch.setattr(image_processing, "_cpu", lambda: pool)
+    monkeypatch.setattr(image_processing, "DERIVATIVE_WIDTHS", [160, 320, 640])
+    (tmp_path / "products").mkdir()
+    Image.new("RGB", (1200, 800), (10, 120, 200)).save(tmp_path / "products" / "SKU1.jpg", "JPEG")
+    app = FastAPI()
+    app.mount("/media", MediaFiles(directory=str(tmp_path)), name="media")
+    return TestClient(app)
+
+
+def test_resolver_picks_width_and_format(tmp_path, monkeypatch):
+    client = _client(tmp_path, monkeypatch)
+    plain = client.get("/media/products/SKU1.jpg")
+    assert plain.status_code == 200 and plain.headers["content-type"] == "image/jpeg"
+
+    r = client.get("/media/products/SKU1.jpg?w=200", headers={"Accept": "image/webp,image/*"})
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "image/webp" and r.headers["vary"] == "Accept"
+    cached = derived_dir(tmp_path, "products/SKU1.jpg") / "320.webp"
+    assert cached.exists()
+    with Image.open(cached) as im:
+        assert im.width == 320
+    assert len(r.content) < len(plain.content)
+
+    jpeg = client.get("/media/products/SKU1.jpg?w=5000&fmt=jpeg")
+    assert jpeg.headers["content-type"] == "image/jpeg"
+    assert (derived_dir(tmp_path, "products/SKU1.jpg") / "640.jpg").exists()
+    assert client.get("/media/products/missing.jpg?w=100").status_code == 404
+
+
+def test_make_derivatives_writes_every_width_and_format(tmp_path):
+    src = tmp_path / "src.jpg"
+    Image.new("RGB", (900, 600)).save(src, "JPEG")
+    paths = image_processing.make_derivatives(str(src), str(tmp_path / "d"), [300, 150], ["webp", "jpeg"])
+    assert sorted(p.rsplit("/", 1)[1] for p in paths) == ["150.jpg", "150.webp", "300.jpg", "300.webp"]
+
+
+def test_thumb_serves_local_derivatives_for_uploaded_s3_images(tmp_path, monkeypatch):
+    import app as appmod
+    import s3_storage
+
+    monkeypatch.setattr(appmod, "MEDIA_PRODUCTS", tmp_path)
+    Image.new("RGB", (10, 10)).save(tmp_path / "SKU1.jpg", "JPEG")
+    key = s3_storage.content_key(str(tmp_path / "SKU1.jpg"), "products")
+    url = f"https://bucket.s3.amazonaws.com/{key}"
+
+    assert appmod._thumb(url, 48, "SKU1") == "/media/products/SKU1.jpg?w=48"
+    assert appmod._thumb(url, 48, "OTHER") == url  # no local copy on this replica
+    assert appmod._thumb("https://cdn.example.com/x.jpg", 48, "SKU1") == "https://cdn.example.com/x.jpg"
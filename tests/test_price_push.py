@@ -0,0 +1,71 @@
+import threading
+
+from sqlmodel import Session, SQLModel, create_engine, select
+
+import etsy_client
+import price_push
+from models import ListingPriceState, Product
+
+
+def _setup(monkeypatch, fail_once=()):
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    monkeypatch.setattr(price_push, "get_session", lambda: Session(engine))
+    monkeypatch.setattr(etsy_client, "DRY_RUN", False)
+    calls = []
+    lock = threading.Lock()
+    pending_failures = set(fail_once)
+
+    def fake_update(listing_id, price, *args, quantity=999, **kwargs):
+        with lock:
+            calls.append((listing_id, price, quantity))
+            if listing_id in pending_failures:
+                pending_failures.discard(listing_id)
+                raise RuntimeError("Etsy inventory error 500")
+        return True
+
+    monkeypatch.setattr(etsy_client, "update_listing_price", fake_update)
+    return engine, calls
+
+
+def test_push_skips_matching_remote_price_and_retries(monkeypatch):
+    engine, calls = _setup(monkeypatch, fail_once={"L2"})
+    with Session(engine) as s:
+        s.add(ListingPriceState(etsy_listing_id="L3", price=12.99))
+        s.add_all([Product(sku="A", quantity=0), Product(sku="B", quantity=None)])
+        s.commit()
+
+    result = price_push.push_prices([("A", "L1", 10.99), ("B", "L2", 11.99), ("C", "L3", 12.99), ("D", None, 9.99)])
+
+    assert (result["pushed"], result["skipped"], result["errors"]) == (2, 1, 0)
+    assert sorted(calls) == [("L1", 10.99, 0), ("L2", 11.99, price_push.IN_STOCK_QUANTITY), ("L2", 11.99, price_push.IN_STOCK_QUANTITY)]
+    with Session(engine) as s:
+        states = {st.etsy_listing_id: st.price for st in s.exec(select(ListingPriceState)).all()}
+    assert states == {"L1": 10.99, "L2": 11.99, "L3": 12.99}
+
+    calls.clear()
+    again = price_push.push_prices([("A", "L1", 10.99)])
+    assert again["skipped"] == 1 and calls == []
+
+
+def test_failed_and_stale_pushes_are_listed_for_retry(monkeypatch):
+    engine, calls = _setup(monkeypatch, fail_once={"L1"})
+    with Session(engine) as s:
+        s.add_all([
+            Product(sku="A", price=10.99, etsy_listing_id="L1"),
+            Product(sku="B", price=11.99, etsy_listing_id="L2"),
+            Product(sku="C", price=14.99, etsy_listing_id="L3"),
+            ListingPriceState(etsy_listing_id="L3", price=12.99),
+        ])
+        s.commit()
+
+    monkeypatch.setattr(price_push, "PUSH_ROUNDS", 1)
+    assert price_push.push_prices([("A", "L1", 10.99), ("B", "L2", 11.99)])["errors"] == 1
+
+    # A failed push and a live price that lags the DB are both picked up next run
+    with Session(engine) as s:
+        stale = sorted(price_push.stale_listings(s))
+    assert stale == [("A", "L1", 10.99), ("C", "L3", 14.99)]
+    price_push.push_prices(stale)
+    with Session(engine) as s:
+        assert price_push.stale_listings(s) == []
@@ -0,0 +1,86 @@
+import numpy as np
+from sqlmodel import Session, SQLModel, create_engine, select
+
+import pricing
+from models import PricingRule, Product
+
+
+def _reference(cost, price, rule):
+    # Scalar formula the vectorized engine must match
+    if cost is not None and cost > 0:
+        base = cost * (1.0 + rule.margin_pct)
+    elif price is not None:
+        base = price
+    else:
+        return None
+    base = max(rule.min_price, min(rule.max_price, base))
+    return round(int(base) + (0.95 if rule.rounding == ".95" else 0.99), 2)
+
+
+def test_propose_matches_scalar_formula():
+    rng = np.random.default_rng(0)
+    cost = rng.uniform(0, 80, 1000)
+    cost[::7] = np.nan
+    price = rng.uniform(1, 150, 1000)
+    price[::11] = np.nan
+    for rule in (PricingRule(), PricingRule(margin_pct=0.8, min_price=5, max_price=60, rounding=".95")):
+        got = pricing.propose(cost, price, rule.margin_pct, rule.min_price, rule.max_price, pricing.ROUNDING_ENDINGS[rule.rounding])
+        for c, p, g in zip(cost, price, got):
+            want = _reference(None if np.isnan(c) else c, None if np.isnan(p) else p, rule)
+            assert (want is None and np.isnan(g)) or abs(want - g) < 1e-9
+
+
+def test_compute_and_apply_deltas():
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as s:
+        s.add_all([
+            Product(sku="A", price=10.0, cost=10.0),
+            Product(sku="B", price=19.99),
+            Product(sku="C", cost=5.0),
+        ])
+        s.commit()
+        deltas = pricing.compute_deltas(s)
+        assert list(deltas.sku) == ["A"]
+        assert deltas.rows()[0]["proposed"] == 15.99
+        assert pricing.apply_deltas(s, deltas) == 1
+        s.commit()
+        assert s.exec(select(Product.price).where(Product.sku == "A")).one() == 15.99
+
+
+def _catalogue(**cols):
+    n = len(cols["sku"])
+    return pricing.Catalogue(
+        sku=np.array(cols["sku"], dtype=object),
+        name=np.array([None] * n, dtype=object),
+        price=np.array(cols.get("price", [np.nan] * n), dtype=np.float64),
+        cost=np.array(cols.get("cost", [np.nan] * n), dtype=np.float64),
+        etsy_listing_id=np.array([None] * n, dtype=object),
+        taxonomy_id=np.array(cols.get("taxonomy_id", [None] * n), dtype=object),
+        tags=np.array(cols.get("tags", [None] * n), dtype=object),
+    )
+
+
+def test_rule_index_scopes_and_priority():
+    rules = [
+        PricingRule(id=1, name="global", margin_pct=0.5),
+        PricingRule(id=2, name="mugs", scope="tag", scope_value="Mug", margin_pct=1.0),
+        PricingRule(id=3, name="shirts", scope="taxonomy", scope_value="1125", margin_pct=0.2),
+        PricingRule(id=4, name="cheap", scope="price_band", band_max=10.0, margin_pct=0.1),
+        PricingRule(id=5, name="vip", scope="price_band", band_min=100.0, margin_pct=0.0, priority=5),
+    ]
+    index = pricing.RuleIndex(rules)
+    cat = _catalogue(
+        sku=["plain", "mug", "shirt", "mug-shirt", "cheap", "vip-mug"],
+        price=[20.0, 20.0, 20.0, 20.0, 5.0, 150.0],
+        taxonomy_id=[None, None, 1125, 1125, None, None],
+        tags=[None, "gift, mug", None, "mug", None, "mug"],
+    )
+    names = [index.rules[r].name for r in index.match(cat)]
+    assert names == ["global", "mugs", "shirts", "mugs", "cheap", "vip"]
+
+
+def test_rule_index_without_rules_uses_defaults():
+    index = pricing.RuleIndex([])
+    cat = _catalogue(sku=["A"], price=[10.0], cost=[10.0])
+    assert index.propose(cat)[0] == 15.99
@@ -0,0 +1,30 @@
+from sqlmodel import SQLModel, create_engine
+
+import blob_store
+import research
+from models import Blob, BlobRef
+from s3_storage import LocalBackend
+
+
+def test_placeholders_render_once_per_title(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'r.db'}")
+    SQLModel.metadata.create_all(engine, tables=[Blob.__table__, BlobRef.__table__])
+    store = blob_store.BlobStore(LocalBackend(tmp_path / "blobs"), engine=engine)
+    monkeypatch.setattr(blob_store, "_store", store)
+    monkeypatch.setattr(research, "_placeholders", research.OrderedDict())
+    listings = [{"listing_id": i, "title": "Cat Mug" if i < 3 else "Dog Mug"} for i in range(4)]
+    monkeypatch.setattr(research, "search_listings", lambda keywords, limit: listings)
+    monkeypatch.setattr(research, "llm_synthesis", lambda *a: {})
+
+    from PIL import Image
+    renders = []
+    new = Image.new
+    monkeypatch.setattr(Image, "new", lambda *a, **k: renders.append(a) or new(*a, **k))
+
+    preview = research.run_research("mug")["listings"]
+    keys = [l["image_blob_key"] for l in preview]
+    assert len(renders) == 2
+    assert keys[0] == keys[1] == keys[2] != keys[3]
+    assert store.path(keys[0]).read_bytes()[:3] == b"\xff\xd8\xff"
+    assert store.refcount(keys[0]) == 3
+    assert research.placeholder_image("Cat Mug") is research.placeholder_image("Cat Mug") and len(renders) == 2
@@ -0,0 +1,33 @@
+from sqlmodel import Session, SQLModel, create_engine, select
+
+import runlog_sink
+from models import RunLog
+
+
+def test_buffered_entries_flush_in_one_batch(monkeypatch, tmp_path):
+    # File-backed DB: the flusher thread uses its own connection
+    engine = create_engine(f"sqlite:///{tmp_path / 'runlog.db'}")
+    SQLModel.metadata.create_all(engine)
+    monkeypatch.setattr(runlog_sink, "engine", engine)
+    monkeypatch.setattr(runlog_sink, "FLUSH_INTERVAL", 60.0)
+    runlog_sink.start()
+    try:
+        for i in range(5):
+            runlog_sink.log_run("bench", "ok", str(i))
+        with Session(engine) as s:
+            assert s.exec(select(RunLog)).all() == []
+    finally:
+        runlog_sink.stop()
+    with Session(engine) as s:
+        rows = s.exec(select(RunLog).order_by(RunLog.id)).all()
+    assert [r.message for r in rows] == ["0", "1", "2", "3", "4"]
+
+
+def test_log_run_writes_immediately_without_flusher(monkeypatch):
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    monkeypatch.setattr(runlog_sink, "engine", engine)
+    runlog_sink.log_run("cli_job", "error", "boom")
+    with Session(engine) as s:
+        row = s.exec(select(RunLog)).one()
+    assert (row.job, row.status, row.message) == ("cli_job", "error", "boom")
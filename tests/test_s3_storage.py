@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+
+import s3_storage
+from s3_storage import LocalBackend
+
+
+class CountingBackend(LocalBackend):
+    def __init__(self, root):
+        super().__init__(root, base_url="https://cdn.example")
+        self.uploads = 0
+
+    def upload(self, local_path, key):
+        self.uploads += 1
+        return super().upload(local_path, key)
+
+
+def test_content_addressed_uploads_skip_identical_files(tmp_path):
+    backend = CountingBackend(tmp_path / "bucket")
+    a = tmp_path / "a.JPG"
+    b = tmp_path / "b.jpg"
+    c = tmp_path / "c.jpg"
+    a.write_bytes(b"same bytes")
+    b.write_bytes(b"same bytes")
+    c.write_bytes(b"other")
+
+    url, uploaded = s3_storage.put_content_addressed(str(a), "products/", backend)
+    digest = s3_storage.content_hash(str(a))
+    assert uploaded and url == f"https://cdn.example/products/{digest[:2]}/{digest}.jpg"
+
+    results = s3_storage.upload_many([str(a), str(b), str(c), str(tmp_path / "missing.jpg")], "products", backend, workers=3)
+    assert results[str(a)] == {"url": url, "uploaded": False}
+    assert results[str(b)]["url"] == url
+    assert results[str(c)]["uploaded"] is True
+    assert "error" in results[str(tmp_path / "missing.jpg")]
+    assert backend.uploads == 2
+
+
+def test_concurrent_uploads_of_one_key_do_not_clobber_each_other(tmp_path, monkeypatch):
+    backend = LocalBackend(tmp_path / "bucket")
+    src = tmp_path / "src.jpg"
+    src.write_bytes(b"x" * 100_000)
+    temps = []
+    copy = s3_storage.shutil.copyfile
+    monkeypatch.setattr(s3_storage.shutil, "copyfile", lambda a, b: temps.append(b) or copy(a, b))
+    threads = [threading.Thread(target=backend.upload, args=(str(src), "k/img.jpg")) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(temps)) == 8
+    assert backend.path("k/img.jpg").read_bytes() == src.read_bytes()
+    assert [p.name for p in (tmp_path / "bucket" / "k").iterdir()] == ["img.jpg"]
+
+
+def test_client_is_created_once(monkeypatch):
+    pytest.importorskip("boto3")
+    created = []
+    monkeypatch.setattr(s3_storage, "_client_cache", None)
+    monkeypatch.setattr(s3_storage.boto3, "client", lambda *a, **k: created.append(k) or object())
+    assert s3_storage._client() is s3_storage._client()
+    assert len(created) == 1 and created[0]["config"].max_pool_connections >= 10
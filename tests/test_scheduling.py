@@ -0,0 +1,38 @@
+from sqlmodel import create_engine
+
+import scheduling
+
+
+def test_schedules_survive_a_restart(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    first = scheduling.build_scheduler(engine)
+    first.start(paused=True)
+    job_id = scheduling.add_interval_job(first, "prune_logs", 15)
+    assert scheduling.add_interval_job(first, "nope", 15) is None
+    first.shutdown(wait=False)
+
+    second = scheduling.build_scheduler(engine)
+    second.start(paused=True)
+    try:
+        job = second.get_job(job_id)
+        assert job is not None
+        assert job.name == "prune_logs"
+        assert job.args == ("prune_logs",)
+        assert job.coalesce is True and job.max_instances == 1
+        assert job.misfire_grace_time == scheduling.SCHEDULER_MISFIRE_GRACE
+    finally:
+        second.shutdown(wait=False)
+
+
+def test_heavy_jobs_use_their_own_executor(monkeypatch):
+    assert scheduling.executor_for("prune_logs") == "default"
+    assert scheduling.executor_for("sync_prices") == "heavy"
+    monkeypatch.setattr(scheduling, "SCHEDULER_HEAVY_EXECUTOR", "process")
+    assert scheduling.executor_for("pull_metrics") == "process"
+
+
+def test_scheduled_runs_go_through_the_job_runner(monkeypatch):
+    calls = []
+    monkeypatch.setattr(scheduling.job_runner, "execute", lambda job, trigger="schedule": calls.append((job, trigger)))
+    scheduling.run_scheduled_job("prune_logs")
+    assert calls == [("prune_logs", "schedule")]
@@ -0,0 +1,95 @@
+from datetime import datetime
+
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from http_client import fetch_pages
+from jobs import sync_inventory
+from models import InventoryState, Product, SyncWatermark
+from sync_plan import apply_plan
+
+
+def _session():
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    return Session(engine)
+
+
+def test_reconcile_against_printful_and_etsy():
+    with _session() as s:
+        s.add_all([
+            Product(sku="OOS", quantity=999, etsy_listing_id="L1", price=20.0),
+            Product(sku="BACK", quantity=0, etsy_listing_id="L2", price=20.0),
+            Product(sku="LOCAL", quantity=None),
+            Product(sku="SAME", quantity=999, etsy_listing_id="L3", price=20.0),
+        ])
+        s.commit()
+        remote = {
+            "printful": {"OOS": "out_of_stock", "BACK": "active", "SAME": "active"},
+            "etsy": {"L1": 999, "L2": 0, "L3": 999},
+        }
+        plan = sync_inventory.plan(s, remote)
+        assert sorted(plan.changes) == [("BACK", 0, 999), ("LOCAL", None, 999), ("OOS", 999, 0)]
+        assert plan.listing_ids == {"OOS": "L1", "BACK": "L2"}
+        assert plan.remote["OOS"]["etsy_quantity"] == 0
+
+        apply_plan(s, plan)
+        sync_inventory._store_states(s, plan, {"BACK": "etsy down"}, datetime(2024, 1, 1))
+        # The watermark advances; the failed SKU is kept pending with what Etsy still has
+        assert s.exec(select(SyncWatermark.value)).one() == datetime(2024, 1, 1)
+        back = s.get(InventoryState, "BACK")
+        assert (back.etsy_quantity, back.remote_hash) == (0, sync_inventory.PENDING)
+
+        # L2 is not re-fetched, yet BACK is pushed again
+        retry = sync_inventory.plan(s, {"printful": remote["printful"], "etsy": {}})
+        assert retry.listing_ids == {"BACK": "L2"}
+        sync_inventory._store_states(s, retry, {}, datetime(2024, 1, 2))
+        assert s.exec(select(SyncWatermark.value)).one() == datetime(2024, 1, 2)
+
+        # Repeat run: Etsy returns nothing new since the watermark; unchanged SKUs are skipped
+        again = sync_inventory.plan(s, {"printful": remote["printful"], "etsy": {}})
+        assert again.changes == [] and again.remote == {}
+
+
+def test_fetch_pages_collects_all_offsets_in_order():
+    seen = []
+
+    def page(offset, limit):
+        seen.append(offset)
+        return list(range(offset, min(offset + limit, 25))), 25
+
+    assert fetch_pages(page, page_size=10, workers=3) == list(range(25))
+    assert sorted(seen) == [0, 10, 20]
+
+
+def test_printful_availability_is_aggregated_per_product(monkeypatch):
+    import printful_client
+    details = {
+        1: {"sync_product": {"external_id": "MUG"}, "sync_variants": [
+            {"sku": "MUG-S-RED", "availability_status": "out_of_stock"},
+            {"sku": "MUG-M-RED", "availability_status": "active"},
+        ]},
+        2: {"sync_product": {"external_id": "TEE"}, "sync_variants": [
+            {"sku": "TEE-S-BLUE", "availability_status": "discontinued"},
+            {"sku": "TEE-M-BLUE", "availability_status": "out_of_stock"},
+        ]},
+        3: {"sync_product": {}, "sync_variants": [{"sku": "LEGACY", "availability_status": "stopped"}]},
+    }
+    monkeypatch.setattr(printful_client, "DRY_RUN", False)
+    monkeypatch.setattr(printful_client, "list_sync_products", lambda **kw: [{"id": i} for i in details])
+    monkeypatch.setattr(printful_client, "_get", lambda path, params=None: {"result": details[int(path.rsplit("/", 1)[1])]})
+    assert printful_client.list_product_availability() == {"MUG": "active", "TEE": "discontinued", "LEGACY": "stopped"}
+
+
+def test_plan_without_refresh_uses_stored_state(monkeypatch):
+    monkeypatch.setattr(sync_inventory, "fetch_remote", lambda since: (_ for _ in ()).throw(AssertionError("fetched")))
+    with _session() as s:
+        s.add_all([
+            Product(sku="OOS", quantity=999, etsy_listing_id="L1"),
+            Product(sku="SAME", quantity=999, etsy_listing_id="L2"),
+            InventoryState(sku="OOS", printful_status="out_of_stock", etsy_quantity=999, quantity=999, remote_hash="old"),
+            InventoryState(sku="SAME", printful_status="active", etsy_quantity=999, quantity=999,
+                           remote_hash=sync_inventory._remote_hash("active", 999)),
+        ])
+        s.commit()
+        plan = sync_inventory.plan(s)
+    assert plan.changes == [("OOS", 999, 0)] and plan.listing_ids == {"OOS": "L1"}
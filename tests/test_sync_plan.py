@@ -0,0 +1,31 @@
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from jobs import sync_inventory, sync_prices
+from models import Product
+from sync_plan import apply_plan
+
+
+def test_plan_and_chunked_apply():
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as s:
+        s.add_all([Product(sku=f"S{i}", quantity=None if i % 2 else 5) for i in range(7)])
+        s.commit()
+        plan = sync_inventory.plan(s)
+        assert (plan.examined, len(plan)) == (7, 3)
+        assert plan.summary(limit=1)["changes"] == [{"sku": "S1", "old": None, "new": 999}]
+        assert apply_plan(s, plan, chunk_size=2) == 3
+        assert None not in s.exec(select(Product.quantity)).all()
+        assert len(sync_inventory.plan(s)) == 0
+
+
+def test_sync_prices_plan_skips_unpriced():
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as s:
+        s.add_all([Product(sku="A", price=-5.0, etsy_listing_id="L1"), Product(sku="B", price=None), Product(sku="C", price=9.99)])
+        s.commit()
+        plan = sync_prices.plan(s)
+        assert plan.examined == 3
+        assert plan.changes == [("A", -5.0, 0.0)]
+        assert plan.listing_ids == {"A": "L1"}
@@ -0,0 +1,35 @@
+from sqlmodel import Session, SQLModel, create_engine, select
+
+import variants
+from models import ProductVariant, VariantMap
+
+
+def _session():
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    return Session(engine)
+
+
+def test_add_matrix_inserts_only_missing():
+    with _session() as s:
+        s.add(ProductVariant(product_sku="TEE", size="M", color="Black"))
+        s.commit()
+        created = variants.add_matrix(s, "TEE", ["S", "M"], ["Black", "White"])
+        s.commit()
+        assert created == 3
+        assert variants.add_matrix(s, "TEE", ["S", "M"], ["Black", "White"]) == 0
+        assert len(s.exec(select(ProductVariant)).all()) == 4
+
+
+def test_resolve_uses_cached_map_until_invalidated():
+    variants.invalidate()
+    with _session() as s:
+        s.add(VariantMap(size="M", color="Black", printful_variant_id=4012))
+        s.commit()
+        assert variants.resolve(s, "M", "Black") == 4012
+        s.add(VariantMap(size="L", color="Black", printful_variant_id=4013))
+        s.commit()
+        assert variants.resolve(s, "L", "Black") is None
+        variants.invalidate()
+        assert variants.resolve(s, "L", "Black") == 4013
+    variants.invalidate()
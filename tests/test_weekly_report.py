@@ -0,0 +1,59 @@
+from datetime import datetime
+
+import pytest
+from sqlmodel import SQLModel, create_engine
+
+import report_stats
+import runlog_sink
+from jobs import weekly_report
+
+
+@pytest.fixture
+def engine(monkeypatch, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'report.db'}")
+    SQLModel.metadata.create_all(engine)
+    monkeypatch.setattr(runlog_sink, "engine", engine)
+    monkeypatch.setattr(weekly_report, "engine", engine)
+    monkeypatch.setattr(weekly_report, "REPORTS_DIR", tmp_path / "reports")
+    return engine
+
+
+def test_fold_counts_errors_and_explicit_counters():
+    ts = datetime(2024, 1, 31)
+    agg = report_stats.fold([
+        {"job": "etsy_list", "status": "error", "created_at": ts, "counts": {"drafts_created": 0}},
+        {"job": "bulk_etsy_draft", "status": "ok", "created_at": ts, "counts": {"drafts_created": 3}},
+        {"job": "research_snapshot", "status": "ok", "created_at": ts, "counts": {"research_keyword:Cat Mugs": 1}},
+    ])
+    assert agg == {("2024-W05", "errors", "etsy_list"): 1, ("2024-W05", "drafts_created", ""): 3, ("2024-W05", "research_keyword", "cat mugs"): 1}
+
+
+def test_report_is_built_from_counters_and_cached(engine):
+    runlog_sink.log_run("bulk_etsy_publish", "ok", counts={"published": 4})
+    runlog_sink.log_run("pricing_apply", "ok", counts={"repriced": 12})
+    runlog_sink.log_run("sync_prices", "error", "etsy down")
+    for q in ("mugs", "mugs", "tees"):
+        runlog_sink.log_run("research_snapshot", "ok", counts={f"research_keyword:{q}": 1})
+    week = report_stats.week_of(datetime.utcnow())
+
+    first = weekly_report.get(week)
+    assert first["cached"] is False
+    assert "- Published: 4" in first["content"] and "- Repriced: 12" in first["content"]
+    assert "- sync_prices: 1" in first["content"]
+    assert "1. mugs (2)\n2. tees (1)" in first["content"]
+    assert weekly_report.get(week)["cached"] is True
+
+    # New activity in an open week invalidates the cached copy
+    runlog_sink.log_run("etsy_publish", "ok", counts={"published": 1})
+    again = weekly_report.get(week)
+    assert again["cached"] is False and "- Published: 5" in again["content"]
+
+    # Activity logged before the week closed still lands in the first render after it
+    runlog_sink.log_run("etsy_publish", "ok", counts={"published": 1})
+    _, end = report_stats.week_bounds(week)
+    final = weekly_report.get(week, now=end)
+    assert final["cached"] is False and "- Published: 6" in final["content"]
+
+    # From then on the final artifact is served without touching the database
+    runlog_sink.log_run("etsy_publish", "ok", counts={"published": 1})
+    assert weekly_report.get(week, now=end) == {**final, "cached": True}
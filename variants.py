@@ -0,0 +1,68 @@
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlmodel import select
+
+from models import ProductVariant, VariantMap
+
+# Other workers cannot see our invalidations, so the cache also expires on a timer.
+VARIANT_MAP_TTL = float(os.getenv("VARIANT_MAP_TTL", "60"))
+
+_lock = threading.Lock()
+_cache: Optional[Dict[Tuple[Optional[str], Optional[str]], int]] = None
+_loaded_at = 0.0
+
+
+def _load(session) -> Dict[Tuple[Optional[str], Optional[str]], int]:
+    rows = session.exec(select(VariantMap.size, VariantMap.color, VariantMap.printful_variant_id).order_by(VariantMap.id)).all()
+    mapping: Dict[Tuple[Optional[str], Optional[str]], int] = {}
+    for size, color, pfid in rows:
+        # Keep the oldest row for duplicate keys, matching the previous .first() lookup
+        mapping.setdefault((size or None, color or None), pfid)
+    return mapping
+
+
+def variant_map(session) -> Dict[Tuple[Optional[str], Optional[str]], int]:
+    """Return the whole VariantMap as {(size, color): printful_variant_id}, loaded with one query."""
+    global _cache, _loaded_at
+    with _lock:
+        if _cache is None or (time.monotonic() - _loaded_at) > VARIANT_MAP_TTL:
+            _cache = _load(session)
+            _loaded_at = time.monotonic()
+        return _cache
+
+
+def invalidate():
+    """Drop the cached map; call after any VariantMap write."""
+    global _cache
+    with _lock:
+        _cache = None
+
+
+def resolve(session, size: Optional[str], color: Optional[str]) -> Optional[int]:
+    if not (size or color):
+        return None
+    return variant_map(session).get((size or None, color or None))
+
+
+def add_matrix(session, sku: str, sizes: Iterable[Optional[str]], colors: Iterable[Optional[str]]) -> int:
+    """Insert missing size x color variants for a SKU with one SELECT and one bulk INSERT.
+
+    Returns the number of rows created. The caller commits.
+    """
+    sizes = list(sizes) or [None]
+    colors = list(colors) or [None]
+    wanted = {(size or None, color or None) for size in sizes for color in colors}
+    existing = {
+        (size, color)
+        for size, color in session.exec(select(ProductVariant.size, ProductVariant.color).where(ProductVariant.product_sku == sku)).all()
+    }
+    missing = sorted(wanted - existing, key=lambda k: (k[0] or "", k[1] or ""))
+    if not missing:
+        return 0
+    rows: List[dict] = [{"product_sku": sku, "size": size, "color": color} for size, color in missing]
+    session.execute(insert(ProductVariant), rows)
+    return len(rows)